@@ -2,7 +2,187 @@
 Claude API interactions module
 """
 import os
-import requests
+import time
+import json
+import hashlib
+import threading
+from .scheduler import INTERACTIVE, get_scheduler
+
+
+# ANTHROPIC_API_URL points the app at another endpoint, e.g. claude.mock_upstream for local testing
+API_URL = os.environ.get("ANTHROPIC_API_URL", "https://api.anthropic.com/v1/messages")
+API_VERSION = "2023-06-01"
+DEFAULT_MODEL = "claude-3-7-sonnet-20250219"
+
+# Per-user cache directory for state that should survive restarts
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".claudeqml")
+KEY_CACHE_FILE = os.path.join(CACHE_DIR, "api_key_cache.json")
+KEY_CACHE_TTL = 24 * 60 * 60  # Re-validate the key with the API once a day
+
+
+def _hash_api_key(api_key):
+    """Return a stable hash of the API key so the key itself is never written to disk"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def is_api_key_cached(api_key, ttl=KEY_CACHE_TTL):
+    """
+    Check whether this API key was successfully validated within the last ttl seconds
+    Returns True if a fresh cache entry exists, False otherwise
+    """
+    if not api_key:
+        return False
+        
+    try:
+        with open(KEY_CACHE_FILE, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return False
+        
+    if entry.get("key_hash") != _hash_api_key(api_key):
+        return False
+    return time.time() - entry.get("validated_at", 0) < ttl
+
+
+def cache_valid_api_key(api_key):
+    """Record a successful validation of the API key"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(KEY_CACHE_FILE, "w") as f:
+            json.dump({"key_hash": _hash_api_key(api_key), "validated_at": time.time()}, f)
+    except OSError as e:
+        print(f"Could not write API key cache: {e}")
+
+
+# Connections kept open to the API, shared by every thread
+HTTP_POOL_SIZE = 16
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Token bucket limiting the requests made to the API by the whole process"""
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst or max(1, int(requests_per_minute // 10))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        
+    def try_acquire(self, reserve=0):
+        """
+        Take a token if more than reserve tokens would be left over
+        Returns 0.0 if a request may be made, otherwise the seconds until one may
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            needed = 1 + min(reserve, self.capacity - 1)
+            if self.tokens >= needed:
+                self.tokens -= 1
+                return 0.0
+            return (needed - self.tokens) / self.rate
+        
+    def acquire(self):
+        """Block until a request may be made"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+def set_rate_limiter(limiter):
+    """Apply a RateLimiter to every API request, or remove it with None"""
+    get_scheduler().set_rate_limiter(limiter)
+
+
+def http_session():
+    """Return the pooled requests session used for API calls"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            # Imported here so requests is not loaded on the startup path
+            import requests
+            from requests.adapters import HTTPAdapter
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
+        return _http_session
+
+
+def post_message(data, api_key=None, timeout=None, priority=None):
+    """
+    Send a request to the Anthropic messages endpoint and return the parsed response
+    The request waits for its turn in the scheduler; priority overrides the thread's request_context()
+    Raises an Exception if the request does not succeed
+    """
+    if api_key is None:
+        api_key = os.environ.get("ANTHROPIC_API_KEY", "")
+        
+    headers = {
+        "x-api-key": api_key,
+        "anthropic-version": API_VERSION,
+        "content-type": "application/json"
+    }
+    
+    with get_scheduler().request(priority):
+        response = http_session().post(API_URL, headers=headers, json=data, timeout=timeout)
+    
+    # Check for errors
+    if response.status_code != 200:
+        raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
+    
+    return response.json()
+
+
+# Continuation requests made for one response that was cut off at max_tokens
+MAX_CONTINUATIONS = 3
+
+
+class ResponseTruncated(Exception):
+    """Raised when a response is still cut off after every continuation; response holds what was received"""
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
+
+def response_text(response_data):
+    """Return the text of a messages response"""
+    return "".join(block.get("text", "") for block in response_data.get("content", []) if block.get("type") == "text")
+
+
+def complete_message(data, api_key=None, timeout=None, priority=None, max_continuations=MAX_CONTINUATIONS):
+    """
+    Send a request and, while the response stops at max_tokens, continue it from where it was cut off
+    Returns the response with the parts stitched into one text block and the usage summed over every request
+    Raises ResponseTruncated if it is still incomplete after max_continuations
+    """
+    response_data = post_message(data, api_key, timeout, priority)
+    text = response_text(response_data)
+    usage = dict(response_data.get("usage") or {})
+    continuations = 0
+    while response_data.get("stop_reason") == "max_tokens":
+        if continuations == max_continuations:
+            raise ResponseTruncated(f"The response was still cut off after {continuations} continuation(s)",
+                                    dict(response_data, content=[{"type": "text", "text": text}], usage=usage))
+        continuations += 1
+        print(f"Response cut off at {data['max_tokens']} tokens; requesting continuation {continuations}")
+        
+        # The partial output is sent back as the start of the assistant's turn, which the model then
+        # continues; the API rejects an assistant turn that ends in whitespace
+        partial = text.rstrip()
+        messages = list(data["messages"]) + [{"role": "assistant", "content": [{"type": "text", "text": partial}]}]
+        response_data = post_message(dict(data, messages=messages), api_key, timeout, priority)
+        text = partial + response_text(response_data)
+        for key, value in (response_data.get("usage") or {}).items():
+            if isinstance(value, int):
+                usage[key] = usage.get(key, 0) + value
+    
+    return dict(response_data, content=[{"type": "text", "text": text}], usage=usage, continuations=continuations)
 
 
 def is_valid_api_key(api_key):
@@ -13,51 +193,53 @@ def is_valid_api_key(api_key):
     if not api_key or len(api_key) < 20:  # Basic length check
         return False
         
+    # Imported here because the router reads its defaults from this module
+    from .model_router import AUTH_CHECK, get_model_router
+    router = get_model_router()
+    route = router.choose(AUTH_CHECK)
+    
     # Try to make a simple API call to validate
     try:
         headers = {
             "x-api-key": api_key,
-            "anthropic-version": "2023-06-01",
+            "anthropic-version": API_VERSION,
             "content-type": "application/json"
         }
         
         # Request with minimal tokens to check auth only
         data = {
-            "model": "claude-3-7-sonnet-20250219",
-            "max_tokens": 1,
+            "model": route.model,
+            "max_tokens": route.max_tokens,
             "messages": [{"role": "user", "content": [{"type": "text", "text": "Hello"}]}]
         }
         
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=data,
-            timeout=5  # Short timeout just for validation
-        )
+        started = time.time()
+        with get_scheduler().request(INTERACTIVE):
+            response = http_session().post(
+                API_URL,
+                headers=headers,
+                json=data,
+                timeout=5  # Short timeout just for validation
+            )
         
         # Check if the response is valid (even if rate limited)
-        return response.status_code == 200 or response.status_code == 429
+        valid = response.status_code == 200 or response.status_code == 429
+        if valid:
+            router.record(route, time.time() - started)
+        return valid
         
     except Exception:
         return False
 
 
-def ask_claude(prompt, message_history=None):
-    """Ask Claude API a question and return the response"""
+def ask_claude(prompt, message_history=None, request_class=None):
+    """Ask Claude API a question and return the response; request_class picks the model (boilerplate by default)"""
     api_key = os.environ.get("ANTHROPIC_API_KEY", "")
     if not api_key:
         print("Error: ANTHROPIC_API_KEY environment variable not set")
         return None
     
     try:
-        # API endpoint and headers
-        url = "https://api.anthropic.com/v1/messages"
-        headers = {
-            "x-api-key": api_key,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        
         # Initialize message history if not provided
         if message_history is None:
             message_history = []
@@ -65,24 +247,25 @@ def ask_claude(prompt, message_history=None):
         # Add current prompt to message history
         message_history.append({"role": "user", "content": prompt})
         
+        from .model_router import BOILERPLATE, get_model_router
+        router = get_model_router()
+        route = router.choose(request_class or BOILERPLATE)
+        
         # Request payload
         data = {
-            "model": "claude-3-7-sonnet-20250219",
-            "max_tokens": 4000,
+            "model": route.model,
+            "max_tokens": route.max_tokens,
             "temperature": 0.7,
             "messages": message_history
         }
         
         # Make the API call to Anthropic directly
-        response = requests.post(url, headers=headers, json=data)
-        
-        # Check for errors
-        if response.status_code != 200:
-            raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
+        started = time.time()
+        response_data = post_message(data, api_key)
         
         # Parse the response
-        response_data = response.json()
         result = response_data['content'][0]['text'].strip()
+        router.record(route, time.time() - started, bool(result))
         
         # Add response to message history
         message_history.append({"role": "assistant", "content": result})
@@ -92,4 +275,4 @@ def ask_claude(prompt, message_history=None):
         
     except Exception as e:
         print(f"Error asking Claude: {str(e)}")
-        return None, message_history
\ No newline at end of file
+        return None, message_history
@@ -0,0 +1,135 @@
+"""
+Per-component project files
+
+A generated UI is kept as Content.qml plus reusable components in components/*.qml,
+so an edit rewrites and reloads only the files it touches. Claude returns several
+files in one response separated by "// File: <path>" marker lines.
+"""
+import os
+import re
+from .qml_tokenizer import tokenize
+from .qml_style import import_statements
+
+
+CONTENT_FILE = "Content.qml"
+COMPONENTS_DIR = "components"
+COMPONENTS_IMPORT = f'import "{COMPONENTS_DIR}"'
+
+FILE_MARKER_RE = re.compile(r"^[ \t]*//[ \t]*File:[ \t]*(\S+)[ \t]*$", re.M)
+COMPONENT_NAME_RE = re.compile(r"^[A-Z][A-Za-z0-9_]*\.qml$")
+
+
+def project_file_name(name):
+    """
+    Normalize a file name from a response to "Content.qml" or "components/Name.qml"
+    Returns None for anything else, so a response can never write outside the project
+    """
+    name = name.strip().strip("`'\"").replace("\\", "/")
+    if name.startswith("./"):
+        name = name[2:]
+    if name == CONTENT_FILE:
+        return name
+    if name.startswith(f"{COMPONENTS_DIR}/"):
+        name = name[len(COMPONENTS_DIR) + 1:]
+    if "/" not in name and COMPONENT_NAME_RE.match(name) and name != CONTENT_FILE:
+        return f"{COMPONENTS_DIR}/{name}"
+    return None
+
+
+def component_type(name):
+    """The QML type name a component file defines, e.g. "components/Gauge.qml" -> "Gauge" """
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def load_project_files(content_qml_file):
+    """Read Content.qml and every component into a {relative name: source} dict"""
+    project_dir = os.path.dirname(content_qml_file)
+    files = {}
+    if os.path.exists(content_qml_file):
+        with open(content_qml_file, "r") as f:
+            files[CONTENT_FILE] = f.read()
+
+    components_dir = os.path.join(project_dir, COMPONENTS_DIR)
+    if os.path.isdir(components_dir):
+        for entry in sorted(os.listdir(components_dir)):
+            if COMPONENT_NAME_RE.match(entry):
+                with open(os.path.join(components_dir, entry), "r") as f:
+                    files[f"{COMPONENTS_DIR}/{entry}"] = f.read()
+    return files
+
+
+def format_project_files(files):
+    """Format files for a prompt, Content.qml first"""
+    names = sorted(files, key=lambda name: (name != CONTENT_FILE, name))
+    return "\n\n".join(f"// File: {name}\n{files[name].strip()}" for name in names)
+
+
+def split_response(text, default_name=CONTENT_FILE):
+    """
+    Split a response into {relative name: source}
+    A response without file markers is the new content of default_name
+    """
+    markers = list(FILE_MARKER_RE.finditer(text))
+    if not markers:
+        return {default_name: text}
+
+    files = {}
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        name = project_file_name(marker.group(1))
+        if name is None:
+            print(f"Ignoring file outside the project in response: {marker.group(1)}")
+            continue
+        body = text[marker.end():end].strip()
+
+        # Each file may be wrapped in its own code fence
+        body = re.sub(r"^```(?:qml)?\s*", "", body)
+        body = re.sub(r"\s*```$", "", body)
+        files[name] = body.strip()
+    return files
+
+
+def mentioned_components(files, prompt):
+    """Return the component files whose type name appears in the prompt"""
+    words = {word.lower() for word in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", prompt)}
+    return [name for name in files if name != CONTENT_FILE and component_type(name).lower() in words]
+
+
+def ensure_components_import(source, files):
+    """Add import "components" to a file that uses component types without importing them"""
+    types = {component_type(name) for name in files if name != CONTENT_FILE}
+    if not types:
+        return source
+
+    tokens = tokenize(source)
+    statements = list(import_statements(tokens))
+    imported = {source[tokens[start].start:tokens[end].end] for _, start, end, _ in statements}
+    if f'"{COMPONENTS_DIR}"' in imported:
+        return source
+    if not any(token.kind == "ident" and token.text in types for token in tokens):
+        return source
+
+    if statements:
+        position = tokens[statements[-1][2]].end
+        return source[:position] + f"\n{COMPONENTS_IMPORT}" + source[position:]
+    return f"{COMPONENTS_IMPORT}\n\n{source}"
+
+
+def write_project_files(content_qml_file, files):
+    """
+    Write the files that differ from what is on disk
+    Returns the absolute paths of the files that were written
+    """
+    project_dir = os.path.dirname(content_qml_file)
+    written = []
+    for name, source in files.items():
+        path = content_qml_file if name == CONTENT_FILE else os.path.join(project_dir, name)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                if f.read() == source:
+                    continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(source)
+        written.append(path)
+    return written
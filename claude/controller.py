@@ -9,6 +9,7 @@ class QmlReloaderController(QObject):
     promptStatusChanged = Signal(str)
     isLoadingChanged = Signal(bool)
     isImageProcessingChanged = Signal(bool)
+    logMessage = Signal(str)
     
     def __init__(self, engine):
         super().__init__()
@@ -47,4 +48,8 @@ class QmlReloaderController(QObject):
     
     @Slot(str)
     def updatePromptStatus(self, status): 
-        self.promptStatusChanged.emit(status)
\ No newline at end of file
+        self.promptStatusChanged.emit(status)
+        
+    def log(self, message):
+        """Add a message to the application's output log; safe to call from any thread"""
+        self.logMessage.emit(message)
@@ -0,0 +1,574 @@
+"""
+Image-to-QML: single requests, region decomposition and layout skeletons
+
+Instead of asking for the whole UI in one response, a quick layout pass finds the
+main regions of the reference image (a gauge, a tell-tale row, a side panel), each
+region's crop is sent concurrently to generate one component, and Content.qml is
+assembled locally to place the components where the regions are. Wall-clock time
+is then bounded by the slowest region rather than by the whole screen, and no
+single response has to hold the complete UI.
+
+Enable it with --decompose-image or CLAUDEQML_DECOMPOSE_IMAGE=1.
+
+With --progressive-image or CLAUDEQML_PROGRESSIVE_IMAGE=1 a low-detail skeleton
+of the layout is also generated by the fast model from a downscaled copy of the
+image, so there is something to look at while the detailed pass runs.
+
+Every caller goes through ImageAnalyzer, which keeps one request in flight per
+image content and prompt parameters: selecting the same image again, or the same
+image arriving from several sessions, shares the running request and its result.
+A request whose callers have all moved on is cancelled before its next API call,
+and its result is never delivered.
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .api import complete_message, ResponseTruncated
+from .scheduler import MAX_NON_INTERACTIVE_REQUESTS, request_context, current_context
+from .model_router import IMAGE_ANALYSIS as IMAGE_ANALYSIS_REQUEST, IMAGE_SKELETON, LAYOUT_ANALYSIS, get_model_router
+from .qml_style import enforce_style, format_issues, MODULE_TYPES
+from .qml_tokenizer import is_complete_document
+from .components import CONTENT_FILE, COMPONENTS_DIR, COMPONENTS_IMPORT, format_project_files
+from .session_store import get_session_store
+
+
+MIN_REGIONS = 2       # A layout with fewer regions is generated in one request instead
+MAX_REGIONS = 8
+# Region requests beyond the scheduler's non-interactive connections would only queue; while the
+# skeleton request of the same class is in flight, one fewer region is sent at a time
+MAX_PARALLEL_REGIONS = MAX_NON_INTERACTIVE_REQUESTS
+MIN_REGION_FRACTION = 0.02  # Regions smaller than this share of either side are dropped
+SKELETON_IMAGE_SIZE = 512   # Longest side of the image the skeleton is made from
+
+# Names a component must not take, since it would shadow the built-in type
+BUILTIN_TYPES = frozenset(("Item", "Rectangle", "Text", "Image", "Canvas", "Row", "Column", "Grid", "Flow",
+                           "Repeater", "Loader", "MouseArea", "ListView", "GridView", "Flickable", "Shape")
+                          + sum(MODULE_TYPES.values(), ()))
+
+LayoutRegion = namedtuple("LayoutRegion", "name x y width height description")
+Layout = namedtuple("Layout", "background regions")
+
+IMAGE_SYSTEM_PROMPT = """You are an expert QML developer assistant who specializes in recreating UI designs from images.
+
+Follow these style guidelines:
+1. Make sure the root element uses anchors.fill: parent
+2. Make generous use of QtQuick.Layouts for proper responsive layout
+3. Use QtQuick.Controls 2 components for standard UI elements
+4. Implement custom graphics with Canvas when appropriate
+5. Be precise with colors, try to match the exact colors from the image
+6. Always use real numbers for decimal values (use 0.5 instead of 0 when appropriate)
+7. If a gauge is created, 0 mph should always be at -210 degrees
+8. Never use QtGraphicalEffects
+
+Return ONLY the QML code without any explanation or markdown formatting."""
+
+IMAGE_PROMPT = """Please create QML code that recreates the UI shown in this reference image.
+
+Your task is to:
+1. Analyze the visual elements, layout, colors, and design of the image
+2. Create QML code that implements this interface as closely as possible
+3. Use standard Qt Quick components and custom elements as needed
+4. Ensure all interactive elements are functional
+5. Pay special attention to colors, gradients, and visual styling
+
+Please provide ONLY the complete QML code, with no explanation or markdown formatting."""
+
+LAYOUT_SYSTEM_PROMPT = """You are an expert UI designer who breaks user interface designs into components.
+
+Return ONLY a JSON object, without any explanation or markdown formatting."""
+
+LAYOUT_PROMPT = """This reference image of a user interface is {width}x{height} pixels.
+
+Split it into its {min_regions} to {max_regions} main visual regions, such as a gauge, a row of indicators, a header or a side panel. Regions must not overlap and together should cover every important element.
+
+Return a JSON object of this form, with coordinates in pixels of the image:
+{{"background": "#rrggbb", "regions": [{{"name": "SpeedGauge", "x": 0, "y": 0, "width": 100, "height": 100, "description": "What the region contains"}}]}}
+
+"background" is the color behind the regions, and each "name" is a short CamelCase component name."""
+
+REGION_SYSTEM_PROMPT = """You are an expert QML developer assistant who specializes in recreating UI designs from images.
+
+Follow these style guidelines:
+1. The root element is an Item or Rectangle without anchors, x, y, width or height; it is sized by whoever uses it
+2. Size and place children relative to the root's width and height so the component scales
+3. Use QtQuick.Controls 2 components for standard UI elements
+4. Implement custom graphics with Canvas when appropriate
+5. Be precise with colors, try to match the exact colors from the image
+6. Always use real numbers for decimal values (use 0.5 instead of 0 when appropriate)
+7. If a gauge is created, 0 mph should always be at -210 degrees
+8. Never use QtGraphicalEffects
+
+Return ONLY the QML code without any explanation or markdown formatting."""
+
+REGION_PROMPT = """This image is a crop of one region of a larger user interface, with a small margin of its surroundings. The region is {width}x{height} pixels and contains: {description}
+
+Create a reusable QML component named {name} that recreates only this region as closely as possible, in layout, colors and content.
+
+Please provide ONLY the complete QML code, with no explanation or markdown formatting."""
+
+SKELETON_SYSTEM_PROMPT = """You are an expert QML developer assistant who sketches the layout of UI designs quickly.
+
+Return ONLY the QML code without any explanation or markdown formatting."""
+
+SKELETON_PROMPT = """Create a low-detail QML skeleton of the layout of the user interface in this image, to show while the full version is being made.
+
+- The root element is a Rectangle with anchors.fill: parent and the background color of the image
+- Block out each main area (gauges, panels, rows of indicators, headers) as a Rectangle with its approximate position, size, color and corner radius, sized relative to the root
+- Add the main labels as Text
+- Do not draw details: no Canvas, gradients, shadows, animations or icons
+
+Please provide ONLY the complete QML code, with no explanation or markdown formatting."""
+
+
+class ImageAnalysisCancelled(Exception):
+    """Raised to callers of an image analysis that was cancelled or superseded"""
+
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ImageAnalysisCancelled("The image analysis was cancelled")
+
+
+def decomposition_enabled():
+    """Reference images are decomposed into regions with CLAUDEQML_DECOMPOSE_IMAGE=1 or --decompose-image"""
+    return os.environ.get("CLAUDEQML_DECOMPOSE_IMAGE", "") == "1" or "--decompose-image" in sys.argv
+
+
+def progressive_enabled():
+    """A layout skeleton is shown before the detailed QML with CLAUDEQML_PROGRESSIVE_IMAGE=1 or --progressive-image"""
+    return os.environ.get("CLAUDEQML_PROGRESSIVE_IMAGE", "") == "1" or "--progressive-image" in sys.argv
+
+
+def encode_image(image_path):
+    """Return an API image block with the contents of an image file"""
+    with open(image_path, "rb") as image_file:
+        data = base64.b64encode(image_file.read()).decode("utf-8")
+    media_type = "image/jpeg"
+    if image_path.lower().endswith(".png"):
+        media_type = "image/png"
+    elif image_path.lower().endswith(".gif"):
+        media_type = "image/gif"
+    return {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": data}}
+
+
+def downscaled_image(image_path, size=SKELETON_IMAGE_SIZE):
+    """Return an API image block with the image shrunk to fit size, as a JPEG"""
+    from PySide6.QtCore import Qt, QBuffer, QByteArray, QIODevice
+    from PySide6.QtGui import QImage
+    image = QImage(image_path)
+    if image.isNull():
+        raise Exception(f"Could not read {image_path}")
+    if max(image.width(), image.height()) > size:
+        image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.convertToFormat(QImage.Format_RGB888).save(buffer, "JPEG", 85)
+    buffer.close()
+    return {
+        "type": "image",
+        "source": {"type": "base64", "media_type": "image/jpeg", "data": base64.b64encode(bytes(data)).decode("utf-8")}
+    }
+
+
+def component_name(name, taken):
+    """Turn a region name into a component type name that is valid, unique and not a built-in type"""
+    name = "".join(word[:1].upper() + word[1:] for word in re.findall(r"[A-Za-z0-9]+", str(name)))
+    if not name or not name[0].isalpha():
+        name = f"Region{name}"
+    if name in BUILTIN_TYPES:
+        name += "Panel"
+    unique, counter = name, 2
+    while unique in taken:
+        unique, counter = f"{name}{counter}", counter + 1
+    taken.add(unique)
+    return unique
+
+
+def parse_layout(text, width, height):
+    """
+    Read the layout pass response into a Layout, clipping regions to the image
+    Raises ValueError if the response holds no usable JSON
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("The layout response contains no JSON object")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("The layout response is not a JSON object")
+
+    background = data.get("background")
+    if not isinstance(background, str) or not re.fullmatch(r"#[0-9A-Fa-f]{6}", background):
+        background = "#000000"
+
+    regions, taken = [], set()
+    for entry in data.get("regions") or []:
+        try:
+            x, y = max(0, int(entry["x"])), max(0, int(entry["y"]))
+            right = min(width, int(entry["x"]) + int(entry["width"]))
+            bottom = min(height, int(entry["y"]) + int(entry["height"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if right - x < width * MIN_REGION_FRACTION or bottom - y < height * MIN_REGION_FRACTION:
+            continue
+        regions.append(LayoutRegion(component_name(entry.get("name") or "Region", taken), x, y, right - x, bottom - y,
+                                    str(entry.get("description") or "part of the interface")))
+    return Layout(background, regions[:MAX_REGIONS])
+
+
+def analyze_layout(image_block, width, height, api_key=None):
+    """Run the layout pass on the whole image and return its Layout"""
+    router = get_model_router()
+    route = router.choose(LAYOUT_ANALYSIS)
+    data = {
+        "model": route.model,
+        "max_tokens": route.max_tokens,
+        "temperature": 0.0,
+        "system": LAYOUT_SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": [
+            image_block,
+            {"type": "text", "text": LAYOUT_PROMPT.format(width=width, height=height, min_regions=MIN_REGIONS,
+                                                          max_regions=MAX_REGIONS)}
+        ]}]
+    }
+    started = time.time()
+    try:
+        layout = parse_layout(complete_message(data, api_key)["content"][0]["text"], width, height)
+    except (ResponseTruncated, ValueError):
+        router.record(route, time.time() - started, success=False)
+        raise
+    router.record(route, time.time() - started, success=len(layout.regions) >= MIN_REGIONS)
+    return layout
+
+
+def generate_region(region, image_block, api_key=None):
+    """Generate the component for one region from its crop; returns (source, issues)"""
+    router = get_model_router()
+    route = router.choose(IMAGE_ANALYSIS_REQUEST)
+    data = {
+        "model": route.model,
+        "max_tokens": route.max_tokens,
+        "temperature": 0.7,
+        "system": REGION_SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": [
+            image_block,
+            {"type": "text", "text": REGION_PROMPT.format(name=region.name, width=region.width,
+                                                          height=region.height, description=region.description)}
+        ]}]
+    }
+    started = time.time()
+    try:
+        response_data = complete_message(data, api_key)
+    except ResponseTruncated:
+        router.record(route, time.time() - started, success=False)
+        raise
+    source, issues = enforce_style(response_data["content"][0]["text"])
+    router.record(route, time.time() - started,
+                  is_complete_document(source) and all(issue.fixed for issue in issues))
+    return source, issues
+
+
+def relative(size, fraction):
+    """A QML expression for a fraction of the parent's width or height"""
+    return f"parent.{size} * {fraction:.4f}".rstrip("0").rstrip(".") if fraction else "0"
+
+
+def assemble_content(layout, width, height, names):
+    """Return a Content.qml that fills its parent and places each named region's component where it was found"""
+    items = []
+    for region in layout.regions:
+        if region.name not in names:
+            continue
+        items.append(f"""    {region.name} {{
+        x: {relative("width", region.x / width)}
+        y: {relative("height", region.y / height)}
+        width: {relative("width", region.width / width)}
+        height: {relative("height", region.height / height)}
+    }}""")
+    body = "\n\n".join(items)
+    return f"""import QtQuick
+{COMPONENTS_IMPORT}
+
+Rectangle {{
+    anchors.fill: parent
+    color: "{layout.background}"
+
+{body}
+}}
+"""
+
+
+def decompose_image(image_path, api_key=None, log=print, cancel_event=None):
+    """
+    Recreate a reference image as Content.qml plus one component per region
+    Returns {relative name: source}, or None when the layout has too few regions to be worth
+    splitting, in which case the image should be generated in one request
+    """
+    from PySide6.QtGui import QImage
+    from .visual_refine import crop_block
+    image = QImage(image_path)
+    if image.isNull():
+        raise Exception(f"Could not read {image_path}")
+    width, height = image.width(), image.height()
+
+    check_cancelled(cancel_event)
+    started = time.time()
+    layout = analyze_layout(encode_image(image_path), width, height, api_key)
+    if len(layout.regions) < MIN_REGIONS:
+        log(f"Layout pass found {len(layout.regions)} region(s); generating the image in one request")
+        return None
+    log(f"Layout pass found {len(layout.regions)} regions in {time.time() - started:.1f} s: "
+        f"{', '.join(region.name for region in layout.regions)}")
+
+    # The scheduler context is per thread, so each region request is made in the caller's
+    priority, session = current_context()
+
+    def generate(region):
+        check_cancelled(cancel_event)
+        with request_context(priority, session):
+            return generate_region(region, crop_block(image, region), api_key)
+
+    files = {}
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_REGIONS) as executor:
+        futures = [(region, executor.submit(generate, region)) for region in layout.regions]
+        for region, future in futures:
+            try:
+                source, issues = future.result()
+            except ImageAnalysisCancelled:
+                raise
+            except Exception as e:
+                log(f"Region {region.name} failed and is left out: {e}")
+                continue
+            if issues:
+                log(f"Style fixes in {region.name}:\n{format_issues(issues)}")
+            files[f"{COMPONENTS_DIR}/{region.name}.qml"] = source
+    if not files:
+        raise Exception("Every region failed to generate")
+
+    generated = {os.path.splitext(os.path.basename(name))[0] for name in files}
+    files[CONTENT_FILE] = assemble_content(layout, width, height, generated)
+    log(f"Generated {len(generated)} components in {time.time() - started:.1f} s")
+    return files
+
+
+def generate_skeleton(image_path, api_key=None):
+    """Return a quick low-detail Content.qml for the image, or None if the response is not usable QML"""
+    router = get_model_router()
+    route = router.choose(IMAGE_SKELETON)
+    data = {
+        "model": route.model,
+        "max_tokens": route.max_tokens,
+        "temperature": 0.0,
+        "system": SKELETON_SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": [
+            downscaled_image(image_path),
+            {"type": "text", "text": SKELETON_PROMPT}
+        ]}]
+    }
+    started = time.time()
+    try:
+        response_data = complete_message(data, api_key)
+    except ResponseTruncated:
+        router.record(route, time.time() - started, success=False)
+        raise
+    source, issues = enforce_style(response_data["content"][0]["text"])
+    valid = is_complete_document(source) and all(issue.fixed for issue in issues)
+    router.record(route, time.time() - started, valid)
+    return source if is_complete_document(source) else None
+
+
+def generate_image_qml(image_path, api_key=None, log=print):
+    """Recreate a reference image as one Content.qml in a single request"""
+    router = get_model_router()
+    route = router.choose(IMAGE_ANALYSIS_REQUEST)
+    data = {
+        "model": route.model,
+        "max_tokens": route.max_tokens,
+        "temperature": 0.7,
+        "system": IMAGE_SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": [encode_image(image_path), {"type": "text", "text": IMAGE_PROMPT}]}]
+    }
+    started = time.time()
+    try:
+        response_data = complete_message(data, api_key)
+    except ResponseTruncated:
+        router.record(route, time.time() - started, success=False)
+        raise
+    source, issues = enforce_style(response_data["content"][0]["text"])
+    if issues:
+        log(f"Style fixes:\n{format_issues(issues)}")
+    router.record(route, time.time() - started, is_complete_document(source) and all(issue.fixed for issue in issues))
+    return source
+
+
+def image_to_qml(image_path, api_key=None, log=print, cancel_event=None):
+    """
+    Recreate a reference image, by region when decomposition is enabled
+    Returns the Content.qml source, followed by any components in "// File:" sections
+    """
+    if decomposition_enabled():
+        try:
+            files = decompose_image(image_path, api_key, log, cancel_event)
+        except ImageAnalysisCancelled:
+            raise
+        except Exception as e:
+            log(f"Region decomposition failed, generating the image in one request: {e}")
+            files = None
+        if files:
+            return format_project_files(files)
+    check_cancelled(cancel_event)
+    return generate_image_qml(image_path, api_key, log)
+
+
+def analysis_key(image_path):
+    """Identify a request by the image content and everything that shapes its prompts"""
+    parameters = json.dumps([IMAGE_SYSTEM_PROMPT, IMAGE_PROMPT, decomposition_enabled()])
+    return get_session_store().image_hash(image_path) + hashlib.sha256(parameters.encode("utf-8")).hexdigest()[:16]
+
+
+class ImageAnalysis:
+    """One image-to-QML request in flight, shared by every ticket for the same key"""
+    def __init__(self, key, image_path, api_key, log, priority, session):
+        self.key = key
+        self.image_path = image_path
+        self.api_key = api_key
+        self.log = log
+        self.priority = priority
+        self.session = session
+        self.tickets = 0
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ImageTicket:
+    """A caller's claim on an ImageAnalysis; wait() returns its QML unless the ticket was cancelled"""
+    def __init__(self, analyzer, image_path, api_key, log, priority, session, replaces):
+        self.analyzer = analyzer
+        self.image_path = image_path
+        self.api_key = api_key
+        self.log = log
+        self.priority = priority
+        self.session = session
+        self.replaces = replaces
+        self.analysis = None
+        self.cancelled = False
+
+    def wait(self):
+        """Block until the analysis finishes; raises ImageAnalysisCancelled once this ticket is cancelled"""
+        if self.analysis is None:
+            self.analyzer.join(self)
+        while not self.analysis.done.wait(0.2):
+            if self.cancelled:
+                break
+        if self.cancelled or self.analysis.cancel_event.is_set():
+            raise ImageAnalysisCancelled("The image analysis was superseded")
+        if self.analysis.error is not None:
+            raise self.analysis.error
+        return self.analysis.result
+
+    def cancel(self):
+        self.analyzer.release(self)
+
+
+class ImageAnalyzer:
+    """Runs image-to-QML requests single-flight: concurrent callers for the same key share one request"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.analyses = {}
+
+    def submit(self, image_path, api_key=None, log=print, priority=None, session=None, replaces=None):
+        """
+        Return a ticket for the analysis of an image without reading it, so this is safe on the GUI thread
+        Requests are made in the given priority class and session, by default those of the calling thread
+        The ticket replaces another one, which is released only after the new ticket joined its analysis
+        """
+        context_priority, context_session = current_context()
+        return ImageTicket(self, image_path, api_key, log,
+                           context_priority if priority is None else priority, session or context_session, replaces)
+
+    def join(self, ticket):
+        """
+        Hash the ticket's image and join the analysis in flight for its key, or start one
+        An image analyzed before, also in an earlier run, is answered from the session store
+        """
+        try:
+            key = analysis_key(ticket.image_path)
+            saved_result = get_session_store().image_result(ticket.image_path)
+            with self.lock:
+                if ticket.cancelled:
+                    raise ImageAnalysisCancelled("The image analysis was superseded")
+                analysis = self.analyses.get(key)
+                if analysis is None and saved_result is not None:
+                    analysis = ImageAnalysis(key, ticket.image_path, ticket.api_key, ticket.log,
+                                             ticket.priority, ticket.session)
+                    analysis.result = saved_result
+                    analysis.done.set()
+                    ticket.log("This image was analyzed before; reusing its QML without an API call")
+                elif analysis is None:
+                    analysis = ImageAnalysis(key, ticket.image_path, ticket.api_key, ticket.log,
+                                             ticket.priority, ticket.session)
+                    self.analyses[key] = analysis
+                    thread = threading.Thread(target=self.run, args=(analysis,))
+                    thread.daemon = True
+                    thread.start()
+                else:
+                    ticket.log("The same image is already being analyzed; waiting for that result")
+                analysis.tickets += 1
+                ticket.analysis = analysis
+        finally:
+            # Analyzing the same image again keeps the replaced ticket's request
+            replaced, ticket.replaces = ticket.replaces, None
+            if replaced is not None:
+                replaced.cancel()
+
+    def release(self, ticket):
+        """Drop a ticket; an analysis without tickets is cancelled and forgotten, so a new one starts afresh"""
+        with self.lock:
+            if ticket.cancelled:
+                return
+            ticket.cancelled = True
+            analysis = ticket.analysis
+            if analysis is None:
+                return
+            analysis.tickets -= 1
+            if analysis.tickets == 0 and not analysis.done.is_set():
+                analysis.cancel_event.set()
+                if self.analyses.get(analysis.key) is analysis:
+                    del self.analyses[analysis.key]
+
+    def run(self, analysis):
+        try:
+            with request_context(analysis.priority, analysis.session):
+                result = image_to_qml(analysis.image_path, analysis.api_key, analysis.log, analysis.cancel_event)
+            check_cancelled(analysis.cancel_event)
+            get_session_store().save_image_result(analysis.image_path, result)
+            analysis.result = result
+        except Exception as e:
+            analysis.error = e
+        finally:
+            with self.lock:
+                if self.analyses.get(analysis.key) is analysis:
+                    del self.analyses[analysis.key]
+            analysis.done.set()
+
+
+_image_analyzer = None
+_image_analyzer_lock = threading.Lock()
+
+
+def get_image_analyzer():
+    """Return the process-wide image analyzer"""
+    global _image_analyzer
+    with _image_analyzer_lock:
+        if _image_analyzer is None:
+            _image_analyzer = ImageAnalyzer()
+        return _image_analyzer
@@ -0,0 +1,144 @@
+"""
+Reference image decoding and thumbnail cache
+"""
+import os
+import math
+import threading
+from collections import OrderedDict
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QSize, Qt, Signal, Slot
+from PySide6.QtGui import QImage, QImageReader
+
+
+# Thumbnails are decoded at sizes rounded up to a multiple of this, so small
+# resizes of the window are served from the same cached image
+BUCKET_STEP = 128
+
+
+def bucket_size(width, height):
+    """Round a requested display size up to its thumbnail bucket"""
+    width = max(BUCKET_STEP, int(math.ceil(width / BUCKET_STEP)) * BUCKET_STEP)
+    height = max(BUCKET_STEP, int(math.ceil(height / BUCKET_STEP)) * BUCKET_STEP)
+    return QSize(width, height)
+
+
+def decode_image(image_path, target_size):
+    """
+    Decode an image no larger than target_size, keeping its aspect ratio
+    The scaling happens inside QImageReader, so the full-resolution bitmap is never
+    built for formats that support scaled decoding (JPEG in particular)
+    Returns (image, error) where image is a null QImage on failure
+    """
+    reader = QImageReader(image_path)
+    reader.setAutoTransform(True)
+
+    source_size = reader.size()
+    if source_size.isValid():
+        scaled_size = source_size.scaled(target_size, Qt.KeepAspectRatio)
+        # Only ever scale down while decoding
+        if scaled_size.width() < source_size.width():
+            reader.setScaledSize(scaled_size)
+
+    image = reader.read()
+    if image.isNull():
+        return image, reader.errorString() or "Unable to load image"
+    return image, ""
+
+
+class ThumbnailCache:
+    """Thread-safe LRU cache of decoded thumbnails keyed by file, modification time and size bucket"""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, image_path, bucket):
+        try:
+            mtime = os.path.getmtime(image_path)
+        except OSError:
+            mtime = 0
+        return (os.path.abspath(image_path), mtime, bucket.width(), bucket.height())
+
+    def get(self, image_path, bucket):
+        key = self._key(image_path, bucket)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+            return image
+
+    def put(self, image_path, bucket, image):
+        key = self._key(image_path, bucket)
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ImageDecodeTask(QRunnable):
+    """Decodes one thumbnail on the thread pool"""
+
+    def __init__(self, loader, request_id, image_path, bucket):
+        super().__init__()
+        self.loader = loader
+        self.request_id = request_id
+        self.image_path = image_path
+        self.bucket = bucket
+
+    def run(self):
+        image, error = decode_image(self.image_path, self.bucket)
+        if image.isNull():
+            self.loader.decodeFailed.emit(self.request_id, self.image_path, error)
+            return
+
+        self.loader.cache.put(self.image_path, self.bucket, image)
+        self.loader.decodeFinished.emit(self.request_id, self.image_path, image)
+
+
+class ReferenceImageLoader(QObject):
+    """
+    Decodes reference images on a thread pool and serves resized thumbnails from a cache
+    Only the most recent request is reported; results of superseded requests are dropped
+    """
+    imageReady = Signal(str, QImage)
+    imageFailed = Signal(str, str)
+
+    # Emitted from pool threads and handled on the loader's thread
+    decodeFinished = Signal(int, str, QImage)
+    decodeFailed = Signal(int, str, str)
+
+    def __init__(self, cache=None, pool=None):
+        super().__init__()
+        self.cache = cache or ThumbnailCache()
+        self.pool = pool or QThreadPool.globalInstance()
+        self._request_id = 0
+
+        self.decodeFinished.connect(self.handle_decode_finished)
+        self.decodeFailed.connect(self.handle_decode_failed)
+
+    def request(self, image_path, width, height):
+        """Request the image at a display size; imageReady is emitted immediately on a cache hit"""
+        self._request_id += 1
+        bucket = bucket_size(width, height)
+
+        cached = self.cache.get(image_path, bucket)
+        if cached is not None:
+            self.imageReady.emit(image_path, cached)
+            return
+
+        self.pool.start(ImageDecodeTask(self, self._request_id, image_path, bucket))
+
+    @Slot(int, str, QImage)
+    def handle_decode_finished(self, request_id, image_path, image):
+        if request_id == self._request_id:
+            self.imageReady.emit(image_path, image)
+
+    @Slot(int, str, str)
+    def handle_decode_failed(self, request_id, image_path, error):
+        if request_id == self._request_id:
+            self.imageFailed.emit(image_path, error)
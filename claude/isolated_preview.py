@@ -0,0 +1,196 @@
+"""
+Process-isolated QML preview with a watchdog
+"""
+import os
+import sys
+import time
+from PySide6.QtCore import QObject, QProcess, QTimer, Signal, Slot
+from PySide6.QtGui import QWindow
+from PySide6.QtNetwork import QLocalServer
+from PySide6.QtWidgets import QWidget
+from .preview_host import encode_message, decode_messages
+
+
+MAX_RESTARTS_PER_MINUTE = 5
+
+
+class IsolatedPreview(QObject):
+    """
+    Runs the preview engine in a child process (claude.preview_host) and embeds its window
+
+    The child is pinged over a local socket; when it stops answering for longer than the
+    timeout, or exits unexpectedly, it is killed and started again with no content loaded,
+    so the QML that hung it is not immediately reloaded. The next content change reloads
+    normally.
+
+    Embedding another process's window only works on Windows and X11, so
+    isolated_preview_enabled() keeps the in-process preview on Wayland and macOS.
+    """
+    windowReady = Signal(QWidget)   # Container for the child's window, emitted again after each restart
+    restarted = Signal(str)         # Reason the child was restarted
+    warning = Signal(str)           # QML warnings reported by the child
+
+    def __init__(self, window_qml_file, ping_interval_ms=1000, unresponsive_timeout_ms=5000):
+        super().__init__()
+        self.window_qml_file = window_qml_file
+        self.unresponsive_timeout = unresponsive_timeout_ms / 1000.0
+
+        self.server_name = f"claudeqml-preview-{os.getpid()}-{id(self)}"
+        QLocalServer.removeServer(self.server_name)
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.handle_new_connection)
+        if not self.server.listen(self.server_name):
+            raise Exception(f"Could not start preview IPC server: {self.server.errorString()}")
+
+        self.process = None
+        self.socket = None
+        self.buffer = b""
+
+        # State replayed to the child whenever it (re)connects
+        self.content_source = ""
+        self.state = {"isLoading": False, "isImageProcessing": False}
+        self.status = ""
+
+        self.ping_seq = 0
+        self.last_pong = 0.0
+        self.restart_times = []
+        self.stopping = False
+
+        self.watchdog = QTimer(self)
+        self.watchdog.setInterval(ping_interval_ms)
+        self.watchdog.timeout.connect(self.check_alive)
+
+    def start(self, content_qml_file):
+        self.content_source = content_qml_file
+        self.launch()
+        self.watchdog.start()
+
+    def launch(self):
+        """Start a new preview child process"""
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.ForwardedChannels)
+        self.process.setWorkingDirectory(base_dir)
+        self.process.finished.connect(self.handle_process_finished)
+        self.process.start(sys.executable, [
+            "-m", "claude.preview_host",
+            "--server", self.server_name,
+            "--window", self.window_qml_file,
+            "--content", self.content_source,
+        ])
+
+        # Give the child time to start before expecting pongs
+        self.last_pong = time.monotonic()
+
+    def kill(self):
+        """Kill the current child process without triggering a restart"""
+        if self.socket is not None:
+            self.socket.abort()
+            self.socket = None
+        if self.process is not None:
+            self.process.finished.disconnect(self.handle_process_finished)
+            self.process.kill()
+            self.process.waitForFinished(1000)
+            self.process.deleteLater()
+            self.process = None
+
+    def restart(self, reason):
+        now = time.monotonic()
+        self.restart_times = [t for t in self.restart_times if now - t < 60]
+        self.kill()
+
+        if len(self.restart_times) >= MAX_RESTARTS_PER_MINUTE:
+            self.watchdog.stop()
+            self.restarted.emit(f"{reason}; too many restarts, preview disabled")
+            return
+
+        self.restart_times.append(now)
+        print(f"Restarting preview process: {reason}")
+
+        # Don't reload the content that hung or crashed the previous child
+        self.content_source = ""
+        self.launch()
+        self.restarted.emit(reason)
+
+    @Slot()
+    def check_alive(self):
+        if self.process is None:
+            return
+        if time.monotonic() - self.last_pong > self.unresponsive_timeout:
+            self.restart("Preview stopped responding")
+            return
+        self.ping_seq += 1
+        self.send({"type": "ping", "seq": self.ping_seq})
+
+    def handle_process_finished(self, exit_code, exit_status):
+        if not self.stopping:
+            self.restart(f"Preview process exited with code {exit_code}")
+
+    @Slot()
+    def handle_new_connection(self):
+        socket = self.server.nextPendingConnection()
+        if self.socket is not None:
+            self.socket.abort()
+        self.socket = socket
+        self.buffer = b""
+        self.socket.readyRead.connect(self.handle_ready_read)
+
+    @Slot()
+    def handle_ready_read(self):
+        if self.socket is None:
+            return
+        messages, self.buffer = decode_messages(self.socket, self.buffer)
+        for message in messages:
+            self.handle_message(message)
+
+    def handle_message(self, message):
+        message_type = message.get("type")
+        if message_type in ("hello", "pong"):
+            self.last_pong = time.monotonic()
+
+        if message_type == "hello":
+            # Bring the new child up to date
+            self.send({"type": "state", **self.state})
+            if self.status:
+                self.send({"type": "status", "text": self.status})
+
+            # Embed the child's native window
+            if message.get("winId"):
+                window = QWindow.fromWinId(message["winId"])
+                self.windowReady.emit(QWidget.createWindowContainer(window))
+        elif message_type == "warning":
+            self.warning.emit(message.get("text", ""))
+
+    def send(self, message):
+        if self.socket is not None:
+            self.socket.write(encode_message(message))
+            self.socket.flush()
+
+    def reload(self, content_source, clear_cache=True):
+        """Ask the child to reload the content, recompiling everything if clear_cache is set"""
+        self.content_source = content_source
+        self.send({"type": "reload", "source": content_source, "clearCache": clear_cache})
+
+    @Slot(bool)
+    def set_loading(self, loading):
+        self.state["isLoading"] = loading
+        self.send({"type": "state", **self.state})
+
+    @Slot(bool)
+    def set_image_processing(self, processing):
+        self.state["isImageProcessing"] = processing
+        self.send({"type": "state", **self.state})
+
+    @Slot(str)
+    def set_status(self, text):
+        self.status = text
+        self.send({"type": "status", "text": text})
+
+    def shutdown(self):
+        self.stopping = True
+        self.watchdog.stop()
+        self.send({"type": "quit"})
+        if self.process is not None and not self.process.waitForFinished(1000):
+            self.kill()
+        self.server.close()
@@ -0,0 +1,254 @@
+"""
+Bounded, virtualized output log
+"""
+import threading
+from PySide6.QtCore import (
+    QAbstractListModel, QModelIndex, QTimer, Qt, Signal, Slot
+)
+from PySide6.QtGui import QColor, QKeySequence
+from PySide6.QtWidgets import (
+    QApplication, QAbstractItemView, QComboBox, QHBoxLayout, QLabel, QListView,
+    QVBoxLayout, QWidget
+)
+
+
+LEVELS = ["debug", "info", "warning", "error"]
+
+LEVEL_COLORS = {
+    "debug": QColor("#888888"),
+    "warning": QColor("#e0a030"),
+    "error": QColor("#e05050"),
+}
+
+
+class RingBuffer:
+    """Fixed-capacity sequence with constant-time append, removal from the front and indexing"""
+    def __init__(self, capacity, items=()):
+        self._items = [None] * capacity
+        self._start = 0
+        self._length = 0
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self._items[(self._start + index) % len(self._items)]
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    def append(self, item):
+        if self._length == len(self._items):
+            raise IndexError("The ring buffer is full")
+        self._items[(self._start + self._length) % len(self._items)] = item
+        self._length += 1
+
+    def drop_front(self, count):
+        """Remove the first count items"""
+        for _ in range(count):
+            self._items[self._start] = None
+            self._start = (self._start + 1) % len(self._items)
+        self._length -= count
+
+    def clear(self):
+        self.drop_front(self._length)
+        self._start = 0
+
+
+class LogModel(QAbstractListModel):
+    """
+    List model over a ring buffer of log lines
+
+    append() is safe to call from any thread: lines are queued and flushed to the
+    model in one batch per interval on the GUI thread. Once max_lines is reached the
+    oldest lines are dropped, so each append stays constant-time. Lines below the
+    minimum level are kept in the buffer but hidden from views. Both the buffer and
+    the visible lines are indexable rings, so views read any row in constant time.
+    """
+    LevelRole = Qt.UserRole + 1
+
+    flushRequested = Signal()
+
+    def __init__(self, max_lines=100000, spill_file=None, flush_interval_ms=50):
+        super().__init__()
+        self.max_lines = max_lines
+        self.min_level = 0
+
+        # Entries are (sequence number, level index, text)
+        self._lines = RingBuffer(max_lines)
+        self._visible = RingBuffer(max_lines)
+        self._next_seq = 0
+
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+        # Optionally keep every line on disk, including the ones dropped from the buffer
+        self._spill = open(spill_file, "a", encoding="utf-8") if spill_file else None
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(flush_interval_ms)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flushRequested.connect(self.flush_timer.start)
+
+    def append(self, message, level="info"):
+        """Queue a message for the log; multi-line messages become one row per line"""
+        level_index = LEVELS.index(level) if level in LEVELS else LEVELS.index("info")
+        with self._pending_lock:
+            first = not self._pending
+            self._pending.extend((level_index, line) for line in str(message).split("\n"))
+        if first:
+            self.flushRequested.emit()
+
+    @Slot()
+    def flush(self):
+        """Move queued lines into the ring buffer and notify views in one batch"""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        if self._spill:
+            self._spill.write("".join(f"[{LEVELS[level]}] {text}\n" for level, text in batch))
+            self._spill.flush()
+
+        # A batch bigger than the whole buffer only keeps its tail
+        if len(batch) >= self.max_lines:
+            batch = batch[-self.max_lines:]
+            self.beginResetModel()
+            self._lines.clear()
+            self._visible.clear()
+            self._add(batch)
+            self.endResetModel()
+            return
+
+        # Drop the oldest lines to make room
+        overflow = len(self._lines) + len(batch) - self.max_lines
+        if overflow > 0:
+            last_dropped = self._lines[overflow - 1][0]
+            hidden = 0
+            while hidden < len(self._visible) and self._visible[hidden][0] <= last_dropped:
+                hidden += 1
+            if hidden:
+                self.beginRemoveRows(QModelIndex(), 0, hidden - 1)
+                self._visible.drop_front(hidden)
+                self.endRemoveRows()
+            self._lines.drop_front(overflow)
+
+        shown = sum(1 for level, _ in batch if level >= self.min_level)
+        if shown:
+            first_row = len(self._visible)
+            self.beginInsertRows(QModelIndex(), first_row, first_row + shown - 1)
+            self._add(batch)
+            self.endInsertRows()
+        else:
+            self._add(batch)
+
+    def _add(self, batch):
+        for level, text in batch:
+            entry = (self._next_seq, level, text)
+            self._next_seq += 1
+            self._lines.append(entry)
+            if level >= self.min_level:
+                self._visible.append(entry)
+
+    def set_min_level(self, level):
+        """Only show lines at or above this level"""
+        self.min_level = LEVELS.index(level)
+        self.beginResetModel()
+        self._visible = RingBuffer(self.max_lines, (entry for entry in self._lines if entry[1] >= self.min_level))
+        self.endResetModel()
+
+    def clear(self):
+        self.beginResetModel()
+        self._lines.clear()
+        self._visible.clear()
+        self.endResetModel()
+
+    def close(self):
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._visible)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._visible):
+            return None
+        _, level, text = self._visible[index.row()]
+        if role == Qt.DisplayRole:
+            return text
+        if role == Qt.ForegroundRole:
+            return LEVEL_COLORS.get(LEVELS[level])
+        if role == LogModel.LevelRole:
+            return LEVELS[level]
+        return None
+
+
+class LogView(QListView):
+    """Virtualized view over a LogModel that follows new output while scrolled to the bottom"""
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        # Uniform rows let the view lay out only what is visible
+        self.setUniformItemSizes(True)
+        self.setWordWrap(False)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        self._follow = True
+        self.verticalScrollBar().valueChanged.connect(self.handle_scrolled)
+        model.rowsInserted.connect(self.handle_rows_inserted)
+
+    def handle_scrolled(self, value):
+        self._follow = value >= self.verticalScrollBar().maximum()
+
+    def handle_rows_inserted(self, parent, first, last):
+        if self._follow:
+            self.scrollToBottom()
+
+    def keyPressEvent(self, event):
+        # Copy the selected lines as plain text
+        if event.matches(QKeySequence.Copy):
+            rows = sorted(index.row() for index in self.selectedIndexes())
+            lines = [self.model().data(self.model().index(row, 0)) for row in rows]
+            QApplication.clipboard().setText("\n".join(lines))
+            return
+        super().keyPressEvent(event)
+
+
+class LogPanel(QWidget):
+    """Output log view with a level filter"""
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addStretch()
+        filter_layout.addWidget(QLabel("Show:"))
+        self.level_combo = QComboBox()
+        self.level_combo.addItems([level.capitalize() for level in LEVELS])
+        self.level_combo.setCurrentIndex(LEVELS.index("info"))
+        self.level_combo.currentIndexChanged.connect(lambda index: self.model.set_min_level(LEVELS[index]))
+        filter_layout.addWidget(self.level_combo)
+        layout.addLayout(filter_layout)
+
+        self.view = LogView(model)
+        layout.addWidget(self.view)
+
+        self.model.set_min_level("info")
@@ -3,23 +3,30 @@ Main module for Claude QML Generator
 """
 import os
 import sys
+import time
 import threading
-import base64
-import requests
 from pathlib import Path
-from PySide6.QtCore import QUrl, Qt, Slot, Signal, QObject, QFile, QIODevice
-from PySide6.QtQml import QQmlApplicationEngine
-from PySide6.QtGui import QGuiApplication, QImageReader
+from PySide6.QtCore import Qt, Slot, Signal, QEvent, QFile, QIODevice, QTimer
+from PySide6.QtGui import QGuiApplication, QImage, QPixmap, QKeySequence, QShortcut
 from PySide6.QtWidgets import (
     QFileDialog, QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
-    QLabel, QPushButton, QTextEdit, QLineEdit, QWidget, QSplitter, 
+    QLabel, QPushButton, QLineEdit, QWidget, QSplitter, 
     QScrollArea, QDialog, QMessageBox, QSizePolicy
 )
 
-from .project_generator import get_valid_project_name, create_project_structure
-from .qml_reloader import QmlReloader
-from .ui import create_main_window_qml
-from .api import is_valid_api_key
+from .project_generator import get_valid_project_name, get_project_dir, ProjectCreationJob
+from .preview_session import PreviewSession, isolated_preview_enabled
+from .image_loader import ReferenceImageLoader
+from .log_view import LogModel, LogPanel
+from .qml_perf import QmlPerfJob, build_optimization_prompt
+from .visual_refine import RefinementJob, MAX_REFINEMENT_ITERATIONS
+from .profiler import EventLoopMonitor, ProfilerPanel, profiling_enabled
+from .session_store import get_session_store
+from .scheduler import IMAGE_ANALYSIS, request_context
+from .model_router import get_model_router
+from .worker import DEBUG_OUTPUT_FILE
+from .image_analysis import ImageAnalysisCancelled, get_image_analyzer, generate_skeleton, progressive_enabled
+from .api import is_valid_api_key, is_api_key_cached, cache_valid_api_key
 
 
 class ImageProcessingResult:
@@ -28,11 +35,18 @@ class ImageProcessingResult:
         self.is_complete = False
         self.qml_content = None
         self.error = None
+        # A quick layout skeleton shown until qml_content is ready
+        self.skeleton_qml = None
+        self.skeleton_applied = False
+        self.replaced_content = None  # What the skeleton was written over
+        # The claim on the shared analysis, cancelled when another image is selected
+        self.ticket = None
 
 
 class ClaudeWindow(QMainWindow):
     """Main application window for Claude QML Generator"""
     promptSubmitted = Signal(str)
+    apiKeyChecked = Signal(str, bool)
     
     def __init__(self):
         super().__init__()
@@ -42,15 +56,33 @@ class ClaudeWindow(QMainWindow):
         self.project_name = "QMLProject"
         self.content_qml_file = None
         self.reloader = None
+        self.project_job = None
+        self.refine_job = None
+        self.perf_job = None
+        
+        # One preview engine and worker are kept for the whole session
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.preview_session = PreviewSession(os.path.join(base_dir, "mainWindow.qml"), 
+                                              isolated=isolated_preview_enabled())
+        self.preview_session.previewMessage.connect(self.log_message)
+        self.pending_reference_image = None
         self.result = ImageProcessingResult()
         
+        # Reference images are decoded off the GUI thread
+        self.image_loader = ReferenceImageLoader()
+        self.image_loader.imageReady.connect(self.show_reference_image)
+        self.image_loader.imageFailed.connect(self.handle_reference_image_failed)
+        
+        # Coalesce resize events before re-requesting the thumbnail
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(100)
+        self.resize_timer.timeout.connect(self.request_reference_thumbnail)
+        
         # Set up the UI
         self.setWindowTitle("Claude QML Generator")
         self.setMinimumSize(1000, 800)
         
-        # Check API key
-        self.check_api_key()
-        
         # Create central widget and layout
         central_widget = QWidget()
         main_layout = QVBoxLayout(central_widget)
@@ -84,6 +116,13 @@ class ClaudeWindow(QMainWindow):
         self.select_image_button.clicked.connect(self.select_reference_image)
         left_control_layout.addWidget(self.select_image_button, alignment=Qt.AlignCenter)
         
+        # Open Project button, resumes a saved project without calling the API
+        self.open_project_button = QPushButton("Open Project")
+        self.open_project_button.setMinimumHeight(40)
+        self.open_project_button.setStyleSheet("font-size: 14px; font-weight: bold;")
+        self.open_project_button.clicked.connect(self.open_saved_project)
+        left_control_layout.addWidget(self.open_project_button, alignment=Qt.AlignCenter)
+        
         # Right control area (for Qt logo)
         right_control = QWidget()
         right_control_layout = QHBoxLayout(right_control)
@@ -100,7 +139,6 @@ class ClaudeWindow(QMainWindow):
         logo_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
                               "images", "Qt-Group-logo-white.png")
         if os.path.exists(logo_path):
-            from PySide6.QtGui import QPixmap
             pixmap = QPixmap(logo_path)
             # Make the logo significantly bigger
             pixmap = pixmap.scaledToHeight(65, Qt.SmoothTransformation)
@@ -160,9 +198,9 @@ class ClaudeWindow(QMainWindow):
         bottom_layout = QVBoxLayout(bottom_widget)
         
         # Output log
-        self.output_log = QTextEdit()
-        self.output_log.setReadOnly(True)
-        self.output_log.setPlaceholderText("Output will appear here...")
+        # Output log, a bounded ring buffer that can also be spilled to a file
+        self.log_model = LogModel(spill_file=os.environ.get("CLAUDEQML_LOG_FILE") or None)
+        self.output_log = LogPanel(self.log_model)
         bottom_layout.addWidget(self.output_log)
         
         # Command input area
@@ -177,6 +215,12 @@ class ClaudeWindow(QMainWindow):
         self.submit_button.clicked.connect(self.submit_command)
         command_layout.addWidget(self.submit_button)
         
+        # Cancel button, only shown while a project is being created
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_project_creation)
+        self.cancel_button.setVisible(False)
+        command_layout.addWidget(self.cancel_button)
+        
         bottom_layout.addLayout(command_layout)
         
         splitter.addWidget(bottom_widget)
@@ -189,17 +233,54 @@ class ClaudeWindow(QMainWindow):
         
         # Initial log message
         self.log_message("Claude QML Generator started. Select a reference image to begin.")
+        
+        # Check API key without blocking the window from showing
+        self.apiKeyChecked.connect(self.handle_api_key_checked)
+        self.check_api_key()
     
     def check_api_key(self):
-        """Check for valid API key and prompt if not found"""
+        """Check for an API key, validating it in the background unless a recent validation is cached"""
         api_key = os.environ.get("ANTHROPIC_API_KEY", "")
-        if not api_key or not is_valid_api_key(api_key):
-            api_key = self.prompt_for_api_key()
-            if not api_key:
-                QMessageBox.critical(self, "API Key Required", 
-                                   "No valid API key provided. The application will exit.")
-                sys.exit(1)
-            os.environ["ANTHROPIC_API_KEY"] = api_key
+        if not api_key:
+            # Wait for the event loop so the dialog opens over the visible window
+            QTimer.singleShot(0, self.request_api_key)
+            return
+            
+        # A recent successful validation lets warm starts skip the network entirely
+        if is_api_key_cached(api_key):
+            return
+            
+        self.statusBar().showMessage("Validating API key...")
+        
+        def validate_thread():
+            self.apiKeyChecked.emit(api_key, is_valid_api_key(api_key))
+            
+        thread = threading.Thread(target=validate_thread)
+        thread.daemon = True
+        thread.start()
+    
+    @Slot(str, bool)
+    def handle_api_key_checked(self, api_key, valid):
+        """Handle the result of a background API key validation"""
+        if api_key != os.environ.get("ANTHROPIC_API_KEY", ""):
+            return  # The key was replaced while this check was running
+            
+        if valid:
+            cache_valid_api_key(api_key)
+            self.statusBar().showMessage("Ready")
+        else:
+            self.request_api_key()
+    
+    def request_api_key(self):
+        """Prompt for an API key and validate it, quitting if none is provided"""
+        api_key = self.prompt_for_api_key()
+        if not api_key:
+            QMessageBox.critical(self, "API Key Required", 
+                               "No valid API key provided. The application will exit.")
+            QApplication.exit(1)
+            return
+        os.environ["ANTHROPIC_API_KEY"] = api_key
+        self.check_api_key()
     
     def prompt_for_api_key(self):
         """Prompt the user for API key"""
@@ -254,48 +335,72 @@ class ClaudeWindow(QMainWindow):
                                       f"Selected file is not a supported image type. Please use: {', '.join(valid_extensions)}")
     
     def set_reference_image(self, image_path):
-        """Set the reference image and display it"""
+        """Set the reference image and start decoding it for display"""
         self.reference_image_path = image_path
         
-        try:
-            # Display the image in the UI
-            from PySide6.QtGui import QPixmap, QImage
-            pixmap = QPixmap(image_path)
-            
-            if pixmap.isNull():
-                # Try alternative method
-                image = QImage(image_path)
-                if image.isNull():
-                    raise Exception("Unable to load image")
-                pixmap = QPixmap.fromImage(image)
-                
-            # Resize to fit within the label while maintaining aspect ratio
-            label_size = self.image_label.size()
-            if label_size.width() <= 1:  # If widget not yet sized, use default
-                pixmap = pixmap.scaled(450, 450, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            else:
-                pixmap = pixmap.scaled(
-                    label_size.width() - 10, 
-                    label_size.height() - 10, 
-                    Qt.KeepAspectRatio, 
-                    Qt.SmoothTransformation
-                )
-                
-            # Set the image to the label
-            self.image_label.setPixmap(pixmap)
-            # Clear placeholder text and set proper alignment
-            self.image_label.setText("")
-            self.image_label.setAlignment(Qt.AlignCenter)
-            self.log_message(f"Reference image set: {os.path.basename(image_path)}")
-            
-            # Keep the button visible so users can change the image if needed
-            self.select_image_button.setText("Change Reference Image")
+        # The project is set up once the first decode of this image succeeds
+        self.pending_reference_image = image_path
+        self.request_reference_thumbnail()
+    
+    def reference_image_display_size(self):
+        """Return the size the reference image should be shown at"""
+        label_size = self.image_label.size()
+        if label_size.width() <= 1:  # If widget not yet sized, use default
+            return 450, 450
+        return label_size.width() - 10, label_size.height() - 10
+    
+    def request_reference_thumbnail(self):
+        """Ask the image loader for the reference image at the current label size"""
+        if self.reference_image_path:
+            width, height = self.reference_image_display_size()
+            self.image_loader.request(self.reference_image_path, width, height)
+    
+    @Slot(str, QImage)
+    def show_reference_image(self, image_path, image):
+        """Display a decoded reference image, continuing setup if it was just selected"""
+        if image_path != self.reference_image_path:
+            return  # A different image has been selected since
             
-            # Initialize project and start QML generation
-            self.initialize_project()
-        except Exception as e:
-            self.log_message(f"Error loading image: {str(e)}")
-            QMessageBox.warning(self, "Error", f"Failed to load image: {image_path}\n{str(e)}")
+        # The decoded thumbnail is at most one size bucket larger, so this scale is cheap
+        width, height = self.reference_image_display_size()
+        pixmap = QPixmap.fromImage(image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        
+        # Set the image to the label
+        self.image_label.setPixmap(pixmap)
+        # Clear placeholder text and set proper alignment
+        self.image_label.setText("")
+        self.image_label.setAlignment(Qt.AlignCenter)
+        
+        if image_path != self.pending_reference_image:
+            return  # Just a resize
+        self.pending_reference_image = None
+        
+        self.log_message(f"Reference image set: {os.path.basename(image_path)}")
+        
+        # Keep the button visible so users can change the image if needed
+        self.select_image_button.setText("Change Reference Image")
+        
+        # Start analyzing the image right away so it overlaps with naming and scaffolding the project
+        self.statusBar().showMessage("Processing reference image...")
+        self.log_message("Claude is analyzing your image and generating QML...")
+        self.start_image_processing_thread()
+        
+        # Initialize project and start QML generation
+        self.initialize_project()
+    
+    @Slot(str, str)
+    def handle_reference_image_failed(self, image_path, error):
+        if image_path != self.pending_reference_image:
+            return
+        self.pending_reference_image = None
+        self.log_message(f"Error loading image: {error}", "error")
+        QMessageBox.warning(self, "Error", f"Failed to load image: {image_path}\n{error}")
+    
+    def resizeEvent(self, event):
+        """Re-request the reference thumbnail once resizing settles"""
+        super().resizeEvent(event)
+        if self.reference_image_path:
+            self.resize_timer.start()
     
     def initialize_project(self):
         """Initialize the project and set up the QML environment"""
@@ -306,6 +411,15 @@ class ClaudeWindow(QMainWindow):
                 self.log_message("Project creation cancelled.")
                 return
                 
+        # Confirm overwriting on the GUI thread before the background job starts
+        if os.path.exists(get_project_dir(self.project_name)):
+            result = QMessageBox.question(self, "Project Exists", 
+                                       f"Project directory {self.project_name} already exists. Overwrite?",
+                                       QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if result != QMessageBox.Yes:
+                self.log_message("Project creation cancelled.")
+                return
+                
         self.log_message(f"Creating project: {self.project_name}")
         
         # Create project structure
@@ -313,64 +427,84 @@ class ClaudeWindow(QMainWindow):
         if hasattr(self, 'result') and self.result.qml_content:
             image_content = self.result.qml_content
             
-        # Pass the log_message method as callback for project creation output
-        self.content_qml_file = create_project_structure(
-            self.project_name, 
-            image_content, 
-            gui_mode=True,
-            log_callback=self.log_message
-        )
-        
-        if not self.content_qml_file:
-            self.log_message("Project creation cancelled.")
-            return
+        # Skip generating a starter Content.qml when the image analysis will replace it anyway
+        image_pending = bool(self.reference_image_path) and not self.result.is_complete
+            
+        # Generate the project in the background, streaming its log output into ours
+        self.project_job = ProjectCreationJob(self.project_name, image_content, 
+                                              generate_content=not image_pending)
+        self.project_job.progress.connect(self.log_message)
+        self.project_job.fileCreated.connect(self.handle_project_file_created)
+        self.project_job.failed.connect(self.handle_project_failed)
+        self.project_job.cancelled.connect(self.handle_project_cancelled)
+        self.project_job.finished.connect(self.handle_project_created)
+        
+        self.set_project_job_running(True)
+        self.project_job.start()
+    
+    def set_project_job_running(self, running):
+        """Update the UI for a project creation job starting or ending"""
+        self.cancel_button.setVisible(running)
+        self.cancel_button.setEnabled(running)
+        self.select_image_button.setEnabled(not running)
+        self.open_project_button.setEnabled(not running)
+        self.statusBar().showMessage("Creating project..." if running else "Ready")
+    
+    def cancel_project_creation(self):
+        """Cancel the running project creation job"""
+        if self.project_job and self.project_job.is_running():
+            self.log_message("Cancelling project creation...")
+            self.cancel_button.setEnabled(False)
+            self.project_job.cancel()
+    
+    @Slot(str)
+    def handle_project_file_created(self, path):
+        self.statusBar().showMessage(f"Created {os.path.basename(path)}")
+    
+    @Slot(str)
+    def handle_project_failed(self, error):
+        self.set_project_job_running(False)
+        QMessageBox.critical(self, "Generation Error", f"Failed to create project: {error}")
+    
+    @Slot()
+    def handle_project_cancelled(self):
+        self.set_project_job_running(False)
+        self.project_name = "QMLProject"  # Ask for a name again next time
+    
+    @Slot(str)
+    def handle_project_created(self, content_qml_file):
+        """Set up the QML preview once the project files have been generated"""
+        self.set_project_job_running(False)
+        self.content_qml_file = content_qml_file
             
         self.log_message(f"Project created. Working on file: {os.path.relpath(self.content_qml_file)}")
         
-        # Initialize QML engine
         app = QGuiApplication.instance() or QGuiApplication(sys.argv)
         app.setApplicationName(f"{self.project_name} QML Generator")
-        engine = QQmlApplicationEngine()
-        
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        window_qml_file = os.path.join(base_dir, "mainWindow.qml")
-        
-        # Create main window QML with loading indicator
-        create_main_window_qml(window_qml_file)
-        
-        # Start image processing thread
-        if self.reference_image_path:
-            self.statusBar().showMessage("Processing reference image...")
-            self.log_message("Claude is analyzing your image and generating QML...")
-            self.start_image_processing_thread()
-            
-            # Set up QML reloader with reference image
-            self.reloader = QmlReloader(engine, window_qml_file, self.content_qml_file, 
-                                      self.reference_image_path, self.result)
-        else:
-            # Set up QML reloader without reference image
-            self.reloader = QmlReloader(engine, window_qml_file, self.content_qml_file)
-        
-        # Connect the prompt signal to the reloader
-        self.promptSubmitted.connect(self.reloader.submitPrompt)
-        
-        # Embed the QML window in our widget
-        engine.load(QUrl.fromLocalFile(window_qml_file))
-        
-        if not engine.rootObjects():
-            self.log_message("Error loading QML file!")
-            return
-        
-        # Get the root QML object and set it as our central widget
-        qml_root = engine.rootObjects()[0]
         
-        # Add QML view to the preview area
-        if hasattr(qml_root, "winId"):
-            # Create a container widget for the QML window
-            container = QWidget.createWindowContainer(qml_root)
-            container.setFixedHeight(450)
-            container.setMinimumWidth(450)
-            container.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        # The project was generated from scratch, so any saved conversation no longer applies
+        session_store = get_session_store()
+        session_store.clear_messages(content_qml_file)
+        session_store.save_project(self.project_name, content_qml_file, self.reference_image_path)
+        
+        # The image processing thread was started when the image was selected
+        image_processing_result = self.result if self.reference_image_path else None
+        self.open_preview(image_processing_result)
+        
+    def open_preview(self, image_processing_result=None):
+        """Show the current project in the preview, reusing the engine and worker from any previous project"""
+        first_project = self.preview_session.reloader is None
+        container = self.preview_session.open_project(self.content_qml_file, self.reference_image_path, 
+                                                      image_processing_result)
+        if container is None:
+            self.log_message("Error loading QML file!", "error")
+            return False
+        self.reloader = self.preview_session.reloader
+        
+        if first_project:
+            # Connect the prompt signal to the reloader, and its log messages to ours
+            self.promptSubmitted.connect(self.reloader.submitPrompt)
+            self.reloader.controller.logMessage.connect(self.log_message)
             
             # Clear any existing widgets in the QML preview area
             while self.qml_preview_layout.count():
@@ -381,6 +515,59 @@ class ClaudeWindow(QMainWindow):
             
             # Add the QML container to the preview area
             self.qml_preview_layout.addWidget(container)
+        return True
+    
+    def open_saved_project(self):
+        """Resume a saved project with its conversation, without any API calls"""
+        from PySide6.QtWidgets import QInputDialog
+        
+        if self.project_job and self.project_job.is_running():
+            return
+        projects = get_session_store().projects()
+        if not projects:
+            QMessageBox.information(self, "Open Project", "There are no saved projects yet.")
+            return
+            
+        labels = [f"{name}  ({time.strftime('%Y-%m-%d %H:%M', time.localtime(updated))})"
+                  for name, _, updated in projects]
+        label, ok = QInputDialog.getItem(self, "Open Project", "Project:", labels, 0, False)
+        if not ok:
+            return
+        content_qml_file = projects[labels.index(label)][1]
+        
+        session = get_session_store().load_session(content_qml_file)
+        if session is None:
+            self.log_message(f"Error: No saved session for {content_qml_file}", "error")
+            return
+            
+        self.project_name = session["name"]
+        self.content_qml_file = session["content_qml_file"]
+        self.reference_image_path = session["reference_image_path"]
+        self.pending_reference_image = None
+        
+        # Content.qml already holds the result of the image analysis, so nothing is pending
+        self.cancel_image_processing(self.result)
+        self.result = ImageProcessingResult()
+        self.result.qml_content = session["image_qml"]
+        self.result.is_complete = True
+        
+        if self.reference_image_path:
+            self.select_image_button.setText("Change Reference Image")
+            self.request_reference_thumbnail()
+        else:
+            self.image_label.clear()
+            self.image_label.setText("No Reference Image\n\nUse the button above to select an image")
+            
+        if not self.open_preview():
+            return
+        self.reloader.claude_worker.restore_session(session["history"])
+        
+        usage = session["usage"]
+        self.log_message(f"Opened project {self.project_name}: {len(session['prompts'])} prompts, "
+                         f"{len(session['history']) // 2} recent turns restored, "
+                         f"{usage['input_tokens']} input / {usage['output_tokens']} output tokens used so far")
+        for prompt in session["prompts"][-5:]:
+            self.log_message(f"  > {prompt}")
             
     def prompt_for_project_name(self):
         """Prompt for project name via GUI dialog"""
@@ -402,137 +589,75 @@ class ClaudeWindow(QMainWindow):
     
     def start_image_processing_thread(self):
         """Start a thread to process the reference image with Claude"""
+        previous = self.result
+        
         # Clear result from any previous runs
         self.result = ImageProcessingResult()
         
+        # The thread only touches its own result, so a newer selection can't be overwritten by it
+        result = self.result
+        reference_image_path = self.reference_image_path
+        
+        def post_status(message):
+            QApplication.instance().postEvent(self, StatusUpdateEvent(message))
+        
+        # The image is hashed on the processing thread, which joins the analysis of the same image if
+        # one is running; the superseded selection is released only afterwards, so selecting the same
+        # image again keeps its request
+        result.ticket = get_image_analyzer().submit(
+            reference_image_path, log=post_status, priority=IMAGE_ANALYSIS,
+            replaces=None if previous.is_complete else previous.ticket)
+        
+        # Sketch the layout from a downscaled image while the detailed pass runs
+        def skeleton_thread():
+            try:
+                with request_context(IMAGE_ANALYSIS):
+                    skeleton = generate_skeleton(reference_image_path)
+                if skeleton and not result.is_complete and not result.ticket.cancelled:
+                    result.skeleton_qml = skeleton
+                    post_status("Layout skeleton ready; the detailed QML follows.")
+            except Exception as e:
+                post_status(f"Layout skeleton failed: {e}")
+        
+        if progressive_enabled():
+            skeleton_image_thread = threading.Thread(target=skeleton_thread)
+            skeleton_image_thread.daemon = True
+            skeleton_image_thread.start()
+        
         # Define the thread function
         def process_image_thread():
             try:
-                # Read and encode the image
-                with open(self.reference_image_path, "rb") as image_file:
-                    image_data = image_file.read()
-                    base64_image = base64.b64encode(image_data).decode("utf-8")
-                    
-                # Determine media type based on file extension
-                media_type = "image/jpeg"  # default
-                if self.reference_image_path.lower().endswith(".png"):
-                    media_type = "image/png"
-                elif self.reference_image_path.lower().endswith(".gif"):
-                    media_type = "image/gif"
-                
-                # System prompt for image-to-QML conversion
-                system_prompt = """You are an expert QML developer assistant who specializes in recreating UI designs from images.
-
-Follow these style guidelines:
-1. Don't use version numbers in imports (use "import QtQuick" not "import QtQuick 2.15")
-2. Don't start IDs with capital letters (use "id: button" not "id: Button") 
-3. Make sure the code is suitable for a Loader component (no Window element)
-4. Make sure the root element utilizes a similar width and height to the image.
-5. Include all necessary QML imports for the components you use
-6. Make generous use of QtQuick.Layouts for proper responsive layout
-7. Use QtQuick.Controls 2 components for standard UI elements
-8. Implement custom graphics with Canvas when appropriate
-9. Be precise with colors, try to match the exact colors from the image
-10. Always use real numbers for decimal values (use 0.5 instead of 0 when appropriate)
-11. Always use PathAngleArc instead of PathArc for arcs in Path elements
-12. Never use QtGraphicalEffects
-13. If a gauge is created, 0 mph should always be at -210 degrees
-
-Return ONLY the QML code without any explanation or markdown formatting."""
-                
-                # Create message with image
-                prompt = """Please create QML code that recreates the UI shown in this reference image.
-
-Your task is to:
-1. Analyze the visual elements, layout, colors, and design of the image
-2. Create QML code that implements this interface as closely as possible
-3. Use standard Qt Quick components and custom elements as needed
-4. Ensure all interactive elements are functional
-5. Pay special attention to colors, gradients, and visual styling
-
-Please provide ONLY the complete QML code, with no explanation or markdown formatting."""
-                
-                # Process the image
-                api_key = os.environ.get("ANTHROPIC_API_KEY", "")
-                api_url = "https://api.anthropic.com/v1/messages"
-                
-                headers = {
-                    "x-api-key": api_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json"
-                }
-                
-                # Create message content with the image
-                message_content = [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": base64_image
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ]
-                
-                data = {
-                    "model": "claude-3-7-sonnet-20250219",
-                    "max_tokens": 4000,
-                    "temperature": 0.7,
-                    "system": system_prompt,
-                    "messages": [{"role": "user", "content": message_content}]
-                }
-                
-                # Make the API call to Anthropic directly
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=data
-                )
-                
-                # Check for errors
-                if response.status_code != 200:
-                    raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
-                
-                # Parse the response
-                response_data = response.json()
-                generated_qml = response_data['content'][0]['text'].strip()
-                
-                # Clean up the response to extract just the QML code
-                if generated_qml.startswith("```qml"):
-                    generated_qml = generated_qml[6:]
-                elif generated_qml.startswith("```"):
-                    generated_qml = generated_qml[3:]
-                
-                if generated_qml.endswith("```"):
-                    generated_qml = generated_qml[:-3]
-                
-                generated_qml = generated_qml.strip()
+                generated_qml = result.ticket.wait()
                 
                 # Save generated QML to a debug file for inspection
-                with open("debug_qml_output.txt", "w") as debug_file:
+                with open(DEBUG_OUTPUT_FILE, "w") as debug_file:
                     debug_file.write(generated_qml)
                 
                 # Set the result
-                self.result.qml_content = generated_qml
-                self.result.is_complete = True
+                result.qml_content = generated_qml
+                result.is_complete = True
                 
                 # Log via QMetaObject.invokeMethod to safely call from thread
-                QApplication.instance().postEvent(self, StatusUpdateEvent("Image analysis complete. QML code generated."))
+                post_status("Image analysis complete. QML code generated.")
                 
+            except ImageAnalysisCancelled:
+                result.error = "Another reference image was selected"
+                result.is_complete = True
             except Exception as e:
-                self.result.error = str(e)
-                self.result.is_complete = True
-                QApplication.instance().postEvent(self, StatusUpdateEvent(f"Error processing reference image: {e}"))
+                result.error = str(e)
+                result.is_complete = True
+                post_status(f"Error processing reference image: {e}")
         
         # Start the thread
         image_thread = threading.Thread(target=process_image_thread)
         image_thread.daemon = True
         image_thread.start()
     
+    def cancel_image_processing(self, result):
+        """Cancel the image analysis for a result that has been superseded"""
+        if result.ticket is not None and not result.is_complete:
+            result.ticket.cancel()
+    
     def submit_command(self):
         """Handle command input submission"""
         command = self.command_input.text().strip()
@@ -542,14 +667,51 @@ Please provide ONLY the complete QML code, with no explanation or markdown forma
         # Check for exit command
         if command.lower() in ['exit', 'quit', 'bye']:
             self.log_message("Shutting down...")
-            if self.reloader:
-                self.reloader.shutdown()
+            self.preview_session.shutdown()
+            self.reloader = None
             QApplication.quit()
             return
             
         # Log the command
         self.log_message(f"> {command}")
         
+        # Check for the performance profiling command
+        if command.lower() == 'profile':
+            self.command_input.clear()
+            self.profile_content()
+            return
+        
+        # Check for the visual refinement command
+        if command.lower() == 'refine' or command.lower().startswith('refine '):
+            self.command_input.clear()
+            self.refine_content(command.lower())
+            return
+        
+        # Prompts would race the refinement loop for the same files
+        if self.refine_job and self.refine_job.is_running():
+            self.log_message("Refinement is running; wait for it to finish.", "error")
+            return
+        
+        # Show what the model router has learned
+        if command.lower() == 'models':
+            self.command_input.clear()
+            summary = get_model_router().summary()
+            for line in summary or ["No requests routed yet."]:
+                self.log_message(line)
+            return
+        
+        # Check for the version history commands
+        if command.lower() in ['undo', 'redo', 'versions'] or command.lower().startswith('version '):
+            self.command_input.clear()
+            self.handle_version_command(command.lower())
+            return
+        
+        # The detailed image QML replaces the skeleton, and would replace an edit made to it too
+        if hasattr(self, 'result') and self.result.skeleton_applied and not self.result.is_complete:
+            self.log_message("The detailed QML for the reference image is still being generated; "
+                             "wait for it to finish.", "error")
+            return
+        
         # Clear the input field
         self.command_input.clear()
         
@@ -558,11 +720,142 @@ Please provide ONLY the complete QML code, with no explanation or markdown forma
             self.promptSubmitted.emit(command)
             self.statusBar().showMessage("Processing request...")
         else:
-            self.log_message("Error: Project not initialized. Please select a reference image first.")
+            self.log_message("Error: Project not initialized. Please select a reference image first.", "error")
+    
+    def handle_version_command(self, command):
+        """Undo, redo, list or restore versions of the project's QML files"""
+        if not self.reloader:
+            self.log_message("Error: Project not initialized. Please select a reference image first.", "error")
+            return
+            
+        if command == 'versions':
+            versions = self.reloader.claude_worker.snapshots.versions()
+            if not versions:
+                self.log_message("No versions saved yet.")
+            for number, prompt, created, current in versions:
+                marker = "*" if current else " "
+                self.log_message(f"{marker} {number}. {time.strftime('%H:%M:%S', time.localtime(created))} {prompt}")
+            return
+            
+        try:
+            if command.startswith('version '):
+                number = command.split(None, 1)[1]
+                if not number.isdigit():
+                    self.log_message("Usage: version <number>", "error")
+                    return
+                version = self.reloader.restore_version("jump", int(number))
+            else:
+                version = self.reloader.restore_version(command)
+            self.log_message(f"Restored version: {version['prompt']}")
+        except Exception as e:
+            self.log_message(f"Error: {e}", "error")
+    
+    def profile_content(self):
+        """Measure the runtime performance of the current Content.qml offscreen"""
+        if not self.content_qml_file or not os.path.exists(self.content_qml_file):
+            self.log_message("Error: Project not initialized. Please select a reference image first.", "error")
+            return
+        if self.perf_job and self.perf_job.is_running():
+            self.log_message("Profiling is already running.", "error")
+            return
+            
+        self.log_message("Profiling Content.qml offscreen...")
+        self.statusBar().showMessage("Profiling QML...")
+        self.perf_job = QmlPerfJob(self.content_qml_file)
+        self.perf_job.finished.connect(self.handle_profile_finished)
+        self.perf_job.failed.connect(self.handle_profile_failed)
+        self.perf_job.start()
+    
+    def refine_content(self, command):
+        """Score the preview against the reference image and refine the regions that differ most"""
+        if not self.reloader or not self.reference_image_path:
+            self.log_message("Error: Refinement needs a project with a reference image.", "error")
+            return
+        if self.refine_job and self.refine_job.is_running():
+            self.log_message("Refinement is already running.", "error")
+            return
+        # The detailed image QML would replace the refined skeleton
+        if self.result.skeleton_applied and not self.result.is_complete:
+            self.log_message("The detailed QML for the reference image is still being generated; "
+                             "wait for it to finish.", "error")
+            return
+            
+        parts = command.split()
+        if len(parts) > 1 and not parts[1].isdigit():
+            self.log_message("Usage: refine [iterations]", "error")
+            return
+        iterations = int(parts[1]) if len(parts) > 1 else MAX_REFINEMENT_ITERATIONS
+        
+        self.log_message("Rendering Content.qml and comparing it with the reference image...")
+        self.statusBar().showMessage("Refining against the reference image...")
+        self.refine_job = RefinementJob(self.reloader.claude_worker, self.content_qml_file,
+                                        self.reference_image_path, iterations)
+        self.refine_job.progress.connect(self.log_message)
+        self.refine_job.finished.connect(self.handle_refine_finished)
+        self.refine_job.failed.connect(self.handle_refine_failed)
+        self.refine_job.start()
     
-    def log_message(self, message):
-        """Add a message to the output log"""
-        self.output_log.append(message)
+    @Slot(dict)
+    def handle_refine_finished(self, result):
+        self.statusBar().showMessage("Ready")
+        self.log_message(f"Refinement finished after {result['iterations']} iteration(s): similarity "
+                         f"{result['start_score']:.3f} -> {result['score']:.3f}")
+    
+    @Slot(str)
+    def handle_refine_failed(self, error):
+        self.statusBar().showMessage("Ready")
+        self.log_message(f"Refinement failed: {error}", "error")
+    
+    @Slot(str)
+    def handle_profile_failed(self, error):
+        self.statusBar().showMessage("Ready")
+        self.log_message(f"Profiling failed: {error}", "error")
+    
+    @Slot(dict)
+    def handle_profile_finished(self, report):
+        """Log a QML performance report and offer to have Claude fix what it found"""
+        self.statusBar().showMessage("Ready")
+        frames = report["frames"]
+        self.log_message(f"Frames: {frames['count']}, mean {frames['mean_ms']} ms, "
+                         f"p95 {frames['p95_ms']} ms, max {frames['max_ms']} ms")
+        self.log_message(f"Items: {report['objects']['total']}, property changes: {report['property_changes']}")
+        for canvas in report["canvases"]:
+            self.log_message(f"Canvas {canvas['name']}: {canvas['paints']} paints, {canvas['mean_ms']} ms each")
+            
+        if not report["offenders"]:
+            self.log_message("No performance problems found.")
+            return
+            
+        for offender in report["offenders"]:
+            self.log_message(f"  {offender}", "warning")
+            
+        result = QMessageBox.question(self, "Optimize QML", 
+                                      "Ask Claude to optimize the problems found by the profiler?",
+                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if result == QMessageBox.Yes and self.reloader:
+            self.promptSubmitted.emit(build_optimization_prompt(report))
+            self.statusBar().showMessage("Processing request...")
+    
+    def attach_profiler(self, monitor):
+        """Show the event-loop profiler as a dock panel, toggled with Ctrl+Shift+P"""
+        self.profiler_panel = ProfilerPanel(monitor, self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.profiler_panel)
+        
+        toggle_shortcut = QShortcut(QKeySequence("Ctrl+Shift+P"), self)
+        toggle_shortcut.activated.connect(
+            lambda: self.profiler_panel.setVisible(not self.profiler_panel.isVisible()))
+    
+    def log_message(self, message, level="info"):
+        """Add a message to the output log; safe to call from any thread"""
+        self.log_model.append(message, level)
+        
+    def closeEvent(self, event):
+        """Release resources held by the window when it closes"""
+        self.preview_session.shutdown()
+        get_session_store().flush()
+        self.reloader = None
+        self.log_model.close()
+        super().closeEvent(event)
         
     def event(self, event):
         """Handle custom events"""
@@ -573,10 +866,12 @@ Please provide ONLY the complete QML code, with no explanation or markdown forma
         return super().event(event)
 
 
-class StatusUpdateEvent(QObject):
+class StatusUpdateEvent(QEvent):
     """Custom event for updating status from background threads"""
+    EVENT_TYPE = QEvent.Type(QEvent.registerEventType())
+    
     def __init__(self, message):
-        super().__init__()
+        super().__init__(StatusUpdateEvent.EVENT_TYPE)
         self.message = message
 
 
@@ -586,9 +881,20 @@ def main():
     app = QApplication(sys.argv)
     app.setApplicationName("Claude QML Generator")
     
+    # Start the event-loop monitor first so startup stalls are captured too
+    monitor = None
+    if profiling_enabled():
+        monitor = EventLoopMonitor()
+        monitor.start()
+    
     # Create and show the main window
     window = ClaudeWindow()
+    if monitor:
+        window.attach_profiler(monitor)
     window.show()
     
+    # Warm up the preview engine once the main window has been painted
+    QTimer.singleShot(0, window.preview_session.warm_up)
+    
     # Start the application
     return app.exec()
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Mock Anthropic messages endpoint for local testing
+
+Answers POST /v1/messages with canned project files and QML so the generator, the
+server mode and load tests can run without an API key or network access:
+
+    python -m claude.mock_upstream --port 8766
+    ANTHROPIC_API_URL=http://127.0.0.1:8766/v1/messages ANTHROPIC_API_KEY=mock-key-0000000000000 \
+        python -m claude.server
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+MOCK_CMAKELISTS = """cmake_minimum_required(VERSION 3.20)
+project(MockProject LANGUAGES CXX)
+find_package(Qt6 6.8 REQUIRED COMPONENTS Core Quick QuickControls2)
+qt_standard_project_setup(REQUIRES 6.8)
+qt_add_executable(appMockProject main.cpp)
+qt_add_qml_module(appMockProject URI MockProject VERSION 1.0 QML_FILES Main.qml Content.qml)
+target_link_libraries(appMockProject PRIVATE Qt6::Core Qt6::Quick Qt6::QuickControls2)
+"""
+
+MOCK_MAIN_QML = """import QtQuick
+import QtQuick.Controls
+
+ApplicationWindow {
+    visible: true
+    width: 800
+    height: 600
+    title: "Mock Project"
+
+    Loader {
+        anchors.fill: parent
+        source: "Content.qml"
+    }
+}
+"""
+
+MOCK_CONTENT_QML = """import QtQuick
+
+Rectangle {
+    anchors.fill: parent
+    color: "#202020"
+
+    Text {
+        anchors.centerIn: parent
+        text: %s
+        color: "white"
+        font.pixelSize: 18
+    }
+}
+"""
+
+
+def last_user_text(data):
+    """Return the text of the last user message in a request"""
+    for message in reversed(data.get("messages", [])):
+        if message.get("role") != "user":
+            continue
+        return message_text(message)
+    return ""
+
+
+def message_text(message):
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if block.get("type") == "text")
+
+
+def mock_reply(data):
+    """Pick a plausible reply for a request"""
+    text = last_user_text(data)
+    if text.startswith("Create a CMakeLists.txt"):
+        return MOCK_CMAKELISTS
+    if text.startswith("Create a Main.qml"):
+        return MOCK_MAIN_QML
+    first_line = text.strip().splitlines()[0] if text.strip() else "Mock"
+    return MOCK_CONTENT_QML % json.dumps(first_line[:80])
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"type": "error", "error": {"type": "invalid_request_error", "message": "Bad JSON"}})
+            return
+
+        if not self.headers.get("x-api-key"):
+            self.send_json(401, {"type": "error", "error": {"type": "authentication_error",
+                                                            "message": "Missing x-api-key"}})
+            return
+
+        if self.latency:
+            time.sleep(self.latency)
+        with MockHandler.lock:
+            MockHandler.requests_served += 1
+
+        reply = mock_reply(data)
+        messages = data.get("messages", [])
+        if messages and messages[-1].get("role") == "assistant":
+            # Continue a prefilled reply from where it stops
+            prefill = message_text(messages[-1])
+            reply = reply[len(prefill):] if reply.startswith(prefill) else reply
+
+        # Roughly four characters per token, so a small max_tokens cuts the reply off
+        stop_reason = "end_turn"
+        limit = max(1, data.get("max_tokens", 4000)) * 4
+        if data.get("max_tokens", 4000) <= 1:
+            reply, stop_reason = "H", "max_tokens"
+        elif len(reply) > limit:
+            reply, stop_reason = reply[:limit], "max_tokens"
+        prompt_chars = len(json.dumps(data.get("messages", []))) + len(str(data.get("system", "")))
+        self.send_json(200, {
+            "id": f"msg_mock_{MockHandler.requests_served}",
+            "type": "message",
+            "role": "assistant",
+            "model": data.get("model", "mock"),
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": stop_reason,
+            "usage": {"input_tokens": prompt_chars // 4, "output_tokens": len(reply) // 4},
+        })
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Keep test output quiet
+
+
+def start_mock_upstream(host="127.0.0.1", port=0, latency=0.0):
+    """Start the mock endpoint on a background thread; returns the server (server.server_port has the port)"""
+    MockHandler.latency = latency
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Anthropic messages endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each reply")
+    args = parser.parse_args(argv)
+
+    MockHandler.latency = args.latency
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    print(f"Mock upstream listening on http://{args.host}:{server.server_port}/v1/messages")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Model routing per request class
+
+Picks the model and max_tokens for each kind of request from a policy, so that the
+fast model handles checks, boilerplate and small edits and the large model is kept
+for structural edits and image analysis. The router learns from every request it
+routes: latency and validation success are tracked per class and model as
+exponentially weighted averages, and a model that is too slow or produces too much
+invalid QML for a class is passed over in favour of the next candidate.
+
+The default policy can be overridden with a JSON file at ~/.claudeqml/model_policy.json
+(or the path in CLAUDEQML_MODEL_POLICY), for example:
+
+    {"small_edit": {"models": ["claude-3-7-sonnet-20250219"], "max_tokens": 4000}}
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import namedtuple
+from .api import CACHE_DIR, DEFAULT_MODEL
+
+
+FAST_MODEL = "claude-3-5-haiku-20241022"
+
+# Request classes
+AUTH_CHECK = "auth_check"
+BOILERPLATE = "boilerplate"
+SMALL_EDIT = "small_edit"
+STRUCTURAL_EDIT = "structural_edit"
+IMAGE_ANALYSIS = "image_analysis"
+LAYOUT_ANALYSIS = "layout_analysis"
+IMAGE_SKELETON = "image_skeleton"
+
+# Candidates in order of preference (cheapest first), the output budget and the latency
+# in seconds above which the next candidate is preferred
+DEFAULT_POLICY = {
+    AUTH_CHECK: {"models": [FAST_MODEL], "max_tokens": 1, "latency_budget": 5.0},
+    BOILERPLATE: {"models": [FAST_MODEL, DEFAULT_MODEL], "max_tokens": 2000, "latency_budget": 20.0},
+    SMALL_EDIT: {"models": [FAST_MODEL, DEFAULT_MODEL], "max_tokens": 4000, "latency_budget": 20.0},
+    STRUCTURAL_EDIT: {"models": [DEFAULT_MODEL], "max_tokens": 4000, "latency_budget": 60.0},
+    IMAGE_ANALYSIS: {"models": [DEFAULT_MODEL], "max_tokens": 4000, "latency_budget": 120.0},
+    LAYOUT_ANALYSIS: {"models": [FAST_MODEL, DEFAULT_MODEL], "max_tokens": 1500, "latency_budget": 20.0},
+    IMAGE_SKELETON: {"models": [FAST_MODEL], "max_tokens": 3000, "latency_budget": 15.0},
+}
+
+POLICY_FILE = os.environ.get("CLAUDEQML_MODEL_POLICY", os.path.join(CACHE_DIR, "model_policy.json"))
+STATS_FILE = os.path.join(CACHE_DIR, "model_stats.json")
+
+EWMA_ALPHA = 0.2
+MIN_SUCCESS_RATE = 0.85
+MIN_SAMPLES = 3       # Below this a model is assumed to meet its targets
+PROBE_INTERVAL = 20   # Every this many requests of a class, a passed-over model is tried again
+
+# Prompts that change the structure of the UI rather than a few property values
+STRUCTURAL_WORDS_RE = re.compile(
+    r"\b(add|create|insert|new|remove|delete|replace|redesign|rebuild|restructure|rearrange|reorganize|"
+    r"layout|move|split|merge|component|page|screen|dashboard|section|panel|list|grid|table|animat\w*|"
+    r"states?|transitions?)\b", re.I)
+MAX_SMALL_EDIT_PROMPT_CHARS = 200
+
+# Sizing max_tokens from the code the response has to reproduce
+CHARS_PER_TOKEN = 3.5
+OUTPUT_HEADROOM = 1.5      # Room for the code the prompt adds
+OUTPUT_BASE_TOKENS = 1024
+MAX_OUTPUT_TOKENS = {FAST_MODEL: 8192, DEFAULT_MODEL: 16000}  # Longer output is fetched by continuation
+DEFAULT_MAX_OUTPUT_TOKENS = 8192
+
+Route = namedtuple("Route", "request_class model max_tokens")
+
+
+def classify_edit(prompt):
+    """Return SMALL_EDIT for a short prompt that only tweaks existing properties, otherwise STRUCTURAL_EDIT"""
+    if len(prompt) > MAX_SMALL_EDIT_PROMPT_CHARS or STRUCTURAL_WORDS_RE.search(prompt):
+        return STRUCTURAL_EDIT
+    return SMALL_EDIT
+
+
+def sized_route(route, source_chars):
+    """
+    Return the route with max_tokens raised to fit a response that rewrites source_chars of code
+    The policy's max_tokens is the floor and the model's output limit the ceiling
+    """
+    needed = int(source_chars / CHARS_PER_TOKEN * OUTPUT_HEADROOM) + OUTPUT_BASE_TOKENS
+    limit = MAX_OUTPUT_TOKENS.get(route.model, DEFAULT_MAX_OUTPUT_TOKENS)
+    return route._replace(max_tokens=min(limit, max(route.max_tokens, needed)))
+
+
+def load_policy(path=POLICY_FILE):
+    """Return the default policy with the overrides from the policy file applied"""
+    policy = {name: dict(entry) for name, entry in DEFAULT_POLICY.items()}
+    if not os.path.exists(path):
+        return policy
+    try:
+        with open(path, "r") as f:
+            overrides = json.load(f)
+        for name, entry in overrides.items():
+            if name in policy and isinstance(entry, dict):
+                policy[name].update(entry)
+            else:
+                print(f"Ignoring unknown request class {name!r} in {path}")
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable model policy: {e}")
+    return policy
+
+
+class ModelRouter:
+    """Chooses a model per request class and learns from the outcome of each request"""
+    def __init__(self, policy=None, stats_file=STATS_FILE):
+        self.policy = policy or load_policy()
+        self.stats_file = stats_file
+        self.lock = threading.Lock()
+        self.requests = {}  # Requests routed per class, for probing
+        self.stats = self.load_stats()
+
+    def load_stats(self):
+        if self.stats_file and os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable model statistics: {e}")
+        return {}
+
+    def save_stats(self):
+        if not self.stats_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+            with open(self.stats_file + ".tmp", "w") as f:
+                json.dump(self.stats, f, indent=1)
+            os.replace(self.stats_file + ".tmp", self.stats_file)
+        except OSError as e:
+            print(f"Could not write model statistics: {e}")
+
+    def model_stats(self, request_class, model):
+        return self.stats.get(request_class, {}).get(model)
+
+    def meets_targets(self, request_class, model):
+        stats = self.model_stats(request_class, model)
+        if stats is None or stats["samples"] < MIN_SAMPLES:
+            return True
+        return (stats["success"] >= MIN_SUCCESS_RATE
+                and stats["latency"] <= self.policy[request_class].get("latency_budget", float("inf")))
+
+    def choose(self, request_class):
+        """Return the Route for a request of this class"""
+        entry = self.policy[request_class]
+        candidates = entry["models"]
+        with self.lock:
+            count = self.requests.get(request_class, 0) + 1
+            self.requests[request_class] = count
+
+            passed_over = [model for model in candidates if not self.meets_targets(request_class, model)]
+            suitable = [model for model in candidates if model not in passed_over]
+            if passed_over and count % PROBE_INTERVAL == 0:
+                # Give the first passed-over model another chance; providers and prompts change
+                model = passed_over[0]
+            elif suitable:
+                model = suitable[0]
+            else:
+                # Nothing meets its targets: take the most reliable, then the fastest
+                model = max(candidates, key=lambda name: (self.model_stats(request_class, name)["success"],
+                                                          -self.model_stats(request_class, name)["latency"]))
+        return Route(request_class, model, entry["max_tokens"])
+
+    def record(self, route, seconds, success=True):
+        """Update the averages for a route with the latency and validation result of one request"""
+        with self.lock:
+            stats = self.stats.setdefault(route.request_class, {}).get(route.model)
+            if stats is None:
+                stats = {"samples": 0, "latency": seconds, "success": 1.0 if success else 0.0}
+            else:
+                stats["latency"] += EWMA_ALPHA * (seconds - stats["latency"])
+                stats["success"] += EWMA_ALPHA * ((1.0 if success else 0.0) - stats["success"])
+            stats["samples"] += 1
+            stats["updated"] = time.time()
+            self.stats[route.request_class][route.model] = stats
+            self.save_stats()
+
+    def summary(self):
+        """Return one line per class and model with the learned latency and success rate"""
+        with self.lock:
+            return [f"{request_class} / {model}: {stats['latency']:.1f} s, {stats['success']:.0%} valid "
+                    f"({stats['samples']} requests)"
+                    for request_class, models in sorted(self.stats.items())
+                    for model, stats in sorted(models.items())]
+
+
+_model_router = None
+_model_router_lock = threading.Lock()
+
+
+def get_model_router():
+    """Return the process-wide model router, loading the policy on first use"""
+    global _model_router
+    with _model_router_lock:
+        if _model_router is None:
+            _model_router = ModelRouter()
+        return _model_router
@@ -0,0 +1,122 @@
+"""
+Out-of-process QML preview host
+
+IsolatedPreview runs this module in a child process so that runaway generated QML
+(a Canvas repainting forever, a huge Repeater, a binding loop) can only freeze or
+crash the child, never the generator UI. Messages are exchanged as JSON lines
+over a QLocalSocket.
+"""
+import sys
+import json
+import argparse
+from PySide6.QtCore import QObject, QTimer, QUrl, Slot
+from PySide6.QtGui import QGuiApplication
+from PySide6.QtNetwork import QLocalSocket
+from PySide6.QtQml import QQmlApplicationEngine
+from .controller import QmlReloaderController
+
+
+def encode_message(message):
+    """Encode a message as one JSON line"""
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+def decode_messages(socket, buffer):
+    """
+    Read all complete JSON lines available on a socket
+    Returns (messages, buffer) where buffer holds any incomplete trailing line
+    """
+    buffer += bytes(socket.readAll().data())
+    messages = []
+    while b"\n" in buffer:
+        line, buffer = buffer.split(b"\n", 1)
+        if not line.strip():
+            continue
+        try:
+            messages.append(json.loads(line))
+        except ValueError:
+            print(f"Ignoring malformed preview message: {line[:80]!r}")
+    return messages, buffer
+
+
+class PreviewHost(QObject):
+    """Hosts the preview engine in the child process and answers the parent's messages"""
+    def __init__(self, server_name, window_qml_file, content_qml_file):
+        super().__init__()
+        self.engine = QQmlApplicationEngine()
+        self.engine.warnings.connect(self.handle_warnings)
+
+        # Mirror of the parent's controller, driven by state messages
+        self.controller = QmlReloaderController(self.engine)
+        self.engine.rootContext().setContextProperty("reloaderController", self.controller)
+        self.controller.set_content_source(content_qml_file)
+
+        self.engine.load(QUrl.fromLocalFile(window_qml_file))
+
+        self.buffer = b""
+        self.socket = QLocalSocket(self)
+        self.socket.connected.connect(self.handle_connected)
+        self.socket.readyRead.connect(self.handle_ready_read)
+        self.socket.disconnected.connect(QGuiApplication.quit)
+        self.socket.connectToServer(server_name)
+
+    def send(self, message):
+        if self.socket.state() == QLocalSocket.ConnectedState:
+            self.socket.write(encode_message(message))
+            self.socket.flush()
+
+    @Slot()
+    def handle_connected(self):
+        # Tell the parent which native window to embed
+        roots = self.engine.rootObjects()
+        win_id = int(roots[0].winId()) if roots and hasattr(roots[0], "winId") else 0
+        self.send({"type": "hello", "winId": win_id})
+
+    @Slot()
+    def handle_ready_read(self):
+        messages, self.buffer = decode_messages(self.socket, self.buffer)
+        for message in messages:
+            self.handle_message(message)
+
+    def handle_message(self, message):
+        message_type = message.get("type")
+        if message_type == "ping":
+            # Answered from the GUI thread, so a blocked event loop shows up as missing pongs
+            self.send({"type": "pong", "seq": message.get("seq")})
+        elif message_type == "reload":
+            if message.get("clearCache", True):
+                self.engine.clearComponentCache()
+                self.controller.set_content_source("")
+                self.controller.set_content_source(message.get("source", ""))
+            else:
+                # A new revision of Content.qml; cached component types are reused
+                self.controller.set_content_source(message.get("source", ""))
+                QTimer.singleShot(0, self.engine.trimComponentCache)
+        elif message_type == "state":
+            self.controller.set_is_loading(message.get("isLoading", False))
+            self.controller.set_is_image_processing(message.get("isImageProcessing", False))
+        elif message_type == "status":
+            self.controller.updatePromptStatus(message.get("text", ""))
+        elif message_type == "quit":
+            QGuiApplication.quit()
+
+    def handle_warnings(self, warnings):
+        self.send({"type": "warning", "text": "\n".join(warning.toString() for warning in warnings)})
+
+
+def main(argv=None):
+    """Entry point of the preview child process"""
+    parser = argparse.ArgumentParser(description="ClaudeQML out-of-process preview")
+    parser.add_argument("--server", required=True, help="Local socket name of the parent")
+    parser.add_argument("--window", required=True, help="Preview window QML file")
+    parser.add_argument("--content", default="", help="Content QML file to load initially")
+    args = parser.parse_args(argv)
+
+    app = QGuiApplication(sys.argv[:1])
+    # Kept on the application so the host lives as long as the event loop
+    app.host = PreviewHost(args.server, args.window, args.content)
+    return app.exec()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
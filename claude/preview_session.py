@@ -0,0 +1,198 @@
+"""
+Preview session module
+"""
+import os
+import sys
+from PySide6.QtCore import QObject, QTimer, QUrl, Signal, Slot
+from PySide6.QtWidgets import QWidget, QSizePolicy, QVBoxLayout
+from .ui import MAIN_WINDOW_QML, WARMUP_QML_DOCUMENTS, create_main_window_qml
+
+
+def isolated_preview_enabled():
+    """
+    The preview runs in a child process with CLAUDEQML_ISOLATED_PREVIEW=1 or --isolated-preview
+    where the child's window can be embedded; elsewhere the in-process preview is used
+    """
+    requested = os.environ.get("CLAUDEQML_ISOLATED_PREVIEW", "") == "1" or "--isolated-preview" in sys.argv
+    if requested and not foreign_windows_supported():
+        print("The isolated preview can't embed another process's window on Wayland or macOS; "
+              "using the in-process preview")
+        return False
+    return requested
+
+
+def foreign_windows_supported():
+    """QWindow.fromWinId only embeds windows of other processes on Windows and X11"""
+    if sys.platform == "darwin":
+        return False
+    from PySide6.QtGui import QGuiApplication
+    if QGuiApplication.instance() is not None:
+        platform = QGuiApplication.platformName()
+    else:
+        platform = os.environ.get("QT_QPA_PLATFORM") or ("wayland" if os.environ.get("WAYLAND_DISPLAY") else "")
+    return not platform.startswith("wayland")
+
+
+class PreviewSession(QObject):
+    """
+    Owns the preview QML engine, window and QmlReloader for the lifetime of the app
+    Opening another project retargets the existing reloader and worker instead of
+    building a new engine, watcher and worker thread each time
+    """
+    previewMessage = Signal(str, str)  # Message and log level
+    
+    def __init__(self, window_qml_file, isolated=False):
+        super().__init__()
+        self.window_qml_file = window_qml_file
+        self.isolated = isolated
+        self.engine = None
+        self.preview = None
+        self.reloader = None
+        self.container = None
+        self.shell_component = None
+        self.shell_window = None
+        self.warmup_steps = []
+        
+    def create_engine(self):
+        from PySide6.QtQml import QQmlApplicationEngine
+        self.engine = QQmlApplicationEngine()
+        
+    def warm_up(self):
+        """
+        Create the engine and compile the preview shell ahead of the first project
+        Each module is loaded in its own event-loop iteration so the main window stays responsive
+        """
+        if self.isolated or self.engine is not None:
+            return
+        self.create_engine()
+        self.warmup_steps = list(WARMUP_QML_DOCUMENTS) + [None]  # None compiles the shell
+        QTimer.singleShot(0, self.warm_up_step)
+        
+    @Slot()
+    def warm_up_step(self):
+        if self.engine is None or not self.warmup_steps:
+            return
+        from PySide6.QtQml import QQmlComponent
+        
+        source = self.warmup_steps.pop(0)
+        if source is None:
+            self.compile_shell()
+        else:
+            component = QQmlComponent(self.engine)
+            component.setData(source.encode("utf-8"), QUrl("warmup.qml"))
+            
+            # Instantiating registers the types and initializes the Controls style
+            instance = component.create()
+            if instance is None:
+                print(f"Preview warm-up failed: {component.errorString()}")
+            else:
+                instance.deleteLater()
+                
+        if self.warmup_steps:
+            QTimer.singleShot(0, self.warm_up_step)
+        
+    def compile_shell(self):
+        """Compile the preview window from the embedded QML"""
+        from PySide6.QtQml import QQmlComponent
+        
+        if self.shell_component is not None:
+            return self.shell_component
+        self.shell_component = QQmlComponent(self.engine)
+        self.shell_component.setData(MAIN_WINDOW_QML.encode("utf-8"), QUrl.fromLocalFile(self.window_qml_file))
+        if self.shell_component.isError():
+            self.previewMessage.emit(f"Preview window failed to compile: {self.shell_component.errorString()}",
+                                     "error")
+        return self.shell_component
+        
+    def open_project(self, content_qml_file, reference_image_path=None, image_processing_result=None):
+        """
+        Show a project in the preview
+        Returns the widget hosting the preview window, or None if the preview failed to load
+        """
+        # Reuse the warm engine and preview window
+        if self.reloader is not None:
+            self.reloader.retarget(content_qml_file, reference_image_path, image_processing_result)
+            return self.container
+            
+        if self.isolated:
+            return self.open_isolated_preview(content_qml_file, reference_image_path, image_processing_result)
+            
+        from .qml_reloader import QmlReloader
+        
+        # The engine and shell are normally warm by now; otherwise they are created cold here
+        self.warmup_steps = []
+        if self.engine is None:
+            self.create_engine()
+        shell = self.compile_shell()
+        
+        self.reloader = QmlReloader(self.engine, self.window_qml_file, content_qml_file, 
+                                    reference_image_path, image_processing_result)
+        
+        # Create the preview window now that reloaderController is set
+        qml_root = shell.create() if not shell.isError() else None
+        if qml_root is None or not hasattr(qml_root, "winId"):
+            self.shutdown()
+            return None
+        self.shell_window = qml_root
+            
+        # Create a container widget for the QML window
+        self.container = QWidget.createWindowContainer(qml_root)
+        self.container.setFixedHeight(450)
+        self.container.setMinimumWidth(450)
+        self.container.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        return self.container
+        
+    def open_isolated_preview(self, content_qml_file, reference_image_path, image_processing_result):
+        """Start the preview in a child process and return a widget its window is embedded into"""
+        from .isolated_preview import IsolatedPreview
+        from .qml_reloader import QmlReloader
+        
+        create_main_window_qml(self.window_qml_file)
+        
+        self.preview = IsolatedPreview(self.window_qml_file)
+        self.preview.windowReady.connect(self.show_preview_window)
+        self.preview.restarted.connect(
+            lambda reason: self.previewMessage.emit(f"Preview restarted: {reason}", "warning"))
+        self.preview.warning.connect(lambda text: self.previewMessage.emit(text, "warning"))
+        
+        self.reloader = QmlReloader(None, self.window_qml_file, content_qml_file, 
+                                    reference_image_path, image_processing_result, preview=self.preview)
+        
+        # The child's window is embedded here once it has started, and again after each restart
+        self.container = QWidget()
+        self.container.setFixedHeight(450)
+        self.container.setMinimumWidth(450)
+        self.container.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        container_layout = QVBoxLayout(self.container)
+        container_layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.preview.start(content_qml_file)
+        return self.container
+        
+    @Slot(QWidget)
+    def show_preview_window(self, window_container):
+        """Replace the embedded window of a previous preview process with the new one"""
+        container_layout = self.container.layout()
+        while container_layout.count():
+            widget = container_layout.takeAt(0).widget()
+            if widget:
+                widget.deleteLater()
+        container_layout.addWidget(window_container)
+        
+    def shutdown(self):
+        """Stop the worker thread and release the engine"""
+        if self.reloader:
+            self.reloader.shutdown()
+        if self.preview:
+            self.preview.shutdown()
+        if self.shell_window:
+            self.shell_window.deleteLater()
+        if self.engine:
+            self.engine.deleteLater()
+        self.reloader = None
+        self.preview = None
+        self.engine = None
+        self.container = None
+        self.shell_component = None
+        self.shell_window = None
+        self.warmup_steps = []
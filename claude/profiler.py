@@ -0,0 +1,223 @@
+"""
+GUI event-loop lag monitor and blocking-call profiler
+"""
+import os
+import sys
+import time
+import json
+import threading
+import traceback
+from PySide6.QtCore import QObject, QTimer, Qt, Signal, Slot
+from PySide6.QtWidgets import QDockWidget, QPlainTextEdit
+
+
+# Functions known to block the GUI thread, matched against sampled stacks
+HOT_SPOTS = {
+    "check_api_key": "API key check",
+    "create_project_structure": "Project scaffolding",
+    "set_reference_image": "Reference image decode/scaling",
+    "show_reference_image": "Reference image decode/scaling",
+    "check_file": "QmlReloader.check_file recompile",
+    "log_message": "Output log append",
+}
+
+DEFAULT_REPORT_FILE = "gui_lag_report.jsonl"
+
+
+def profiling_enabled():
+    """Profiling is switched on with CLAUDEQML_PROFILE=1 or the --profile flag"""
+    return os.environ.get("CLAUDEQML_PROFILE", "") == "1" or "--profile" in sys.argv
+
+
+def attribute_stall(samples):
+    """
+    Work out which known hot spot a stall was spent in
+    Returns (label, frame) for the hot spot seen in the most samples, or the
+    innermost frame of the first sample when no hot spot matches
+    """
+    counts = {}
+    for stack in samples:
+        # Walk from the innermost frame out so nested hot spots win
+        for frame in reversed(stack):
+            if frame["function"] in HOT_SPOTS:
+                key = frame["function"]
+                counts[key] = counts.get(key, 0) + 1
+                break
+
+    if counts:
+        function = max(counts, key=counts.get)
+        return HOT_SPOTS[function], function
+    if samples and samples[0]:
+        frame = samples[0][-1]
+        return "unknown", f"{frame['function']} ({os.path.basename(frame['file'])}:{frame['line']})"
+    return "unknown", ""
+
+
+class EventLoopMonitor(QObject):
+    """
+    Measures Qt event-loop latency and samples the GUI thread's stack while it is blocked
+
+    A timer on the GUI thread records a heartbeat every interval. A watchdog thread
+    notices when the heartbeat stops for longer than the threshold and samples the GUI
+    thread's Python stack until it resumes; each stall is then attributed to a hot spot
+    and written to the report file.
+    """
+    stallDetected = Signal(dict)
+
+    def __init__(self, interval_ms=50, threshold_ms=200, report_file=None):
+        super().__init__()
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.report_file = report_file or os.environ.get("CLAUDEQML_PROFILE_REPORT", DEFAULT_REPORT_FILE)
+
+        # Latency statistics, only touched on the GUI thread
+        self.tick_count = 0
+        self.total_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.stalls = []
+
+        self._gui_thread_id = None
+        self._heartbeat = time.perf_counter()
+        self._last_tick = None
+        self._running = False
+        self._lock = threading.Lock()
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+
+        self.watchdog = None
+
+        # Stalls are reported from the watchdog thread and collected on the GUI thread
+        self.stallDetected.connect(self.handle_stall)
+
+    def start(self):
+        """Start monitoring; must be called from the GUI thread"""
+        self._gui_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._last_tick = self._heartbeat
+        self._running = True
+        self.timer.start()
+
+        self.watchdog = threading.Thread(target=self.watch)
+        self.watchdog.daemon = True
+        self.watchdog.start()
+        print(f"Event-loop monitor running, reporting stalls over {self.threshold_ms} ms to {self.report_file}")
+
+    def stop(self):
+        self._running = False
+        self.timer.stop()
+
+    def tick(self):
+        """Heartbeat from the GUI thread; the lateness of each tick is the event-loop lag"""
+        now = time.perf_counter()
+        lag_ms = max(0.0, (now - self._last_tick) * 1000 - self.interval_ms)
+        self._last_tick = now
+        with self._lock:
+            self._heartbeat = now
+
+        self.tick_count += 1
+        self.total_lag_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    def sample_gui_stack(self):
+        """Capture the GUI thread's current Python stack as a list of frames"""
+        frame = sys._current_frames().get(self._gui_thread_id)
+        if frame is None:
+            return []
+        return [
+            {"file": entry.filename, "line": entry.lineno, "function": entry.name}
+            for entry in traceback.extract_stack(frame)
+        ]
+
+    def watch(self):
+        """Watchdog thread: sample the GUI thread whenever its heartbeat stops"""
+        sample_interval = self.interval_ms / 2000.0
+        samples = []
+        stall_start = None
+
+        while self._running:
+            time.sleep(sample_interval)
+            with self._lock:
+                heartbeat = self._heartbeat
+            blocked_ms = (time.perf_counter() - heartbeat) * 1000
+
+            if blocked_ms > self.threshold_ms:
+                if stall_start is None:
+                    stall_start = heartbeat
+                samples.append(self.sample_gui_stack())
+            elif stall_start is not None:
+                # The GUI thread is responsive again, so the stall is over
+                self.record_stall(stall_start, heartbeat, samples)
+                samples = []
+                stall_start = None
+
+    def record_stall(self, start, end, samples):
+        hot_spot, location = attribute_stall(samples)
+        stall = {
+            "time": time.time(),
+            "duration_ms": round((end - start) * 1000, 1),
+            "hot_spot": hot_spot,
+            "location": location,
+            "samples": len(samples),
+            "stack": samples[len(samples) // 2] if samples else [],
+        }
+
+        try:
+            with open(self.report_file, "a") as f:
+                f.write(json.dumps(stall) + "\n")
+        except OSError as e:
+            print(f"Could not write lag report: {e}")
+
+        self.stallDetected.emit(stall)
+
+    @Slot(dict)
+    def handle_stall(self, stall):
+        self.stalls.append(stall)
+        print(f"GUI thread blocked for {stall['duration_ms']:.0f} ms in {stall['hot_spot']} ({stall['location']})")
+
+    def summary(self):
+        """Return a short text summary of event-loop latency and stalls so far"""
+        average = self.total_lag_ms / self.tick_count if self.tick_count else 0.0
+        lines = [
+            f"Event-loop lag: avg {average:.1f} ms, max {self.max_lag_ms:.1f} ms over {self.tick_count} ticks",
+            f"Stalls over {self.threshold_ms} ms: {len(self.stalls)}",
+        ]
+
+        # Total blocked time per hot spot, worst first
+        totals = {}
+        for stall in self.stalls:
+            totals[stall["hot_spot"]] = totals.get(stall["hot_spot"], 0.0) + stall["duration_ms"]
+        for hot_spot, total in sorted(totals.items(), key=lambda item: -item[1]):
+            lines.append(f"  {hot_spot}: {total:.0f} ms")
+        return "\n".join(lines)
+
+
+class ProfilerPanel(QDockWidget):
+    """Debug panel listing event-loop stalls as they are detected"""
+
+    def __init__(self, monitor, parent=None):
+        super().__init__("Event Loop Profiler", parent)
+        self.monitor = monitor
+
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setMaximumBlockCount(500)
+        self.setWidget(self.text)
+
+        monitor.stallDetected.connect(self.refresh)
+
+        # Refresh the latency summary once a second
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+        self.refresh()
+
+    def refresh(self):
+        lines = [self.monitor.summary(), ""]
+        for stall in reversed(self.monitor.stalls[-50:]):
+            lines.append(f"{time.strftime('%H:%M:%S', time.localtime(stall['time']))}  "
+                         f"{stall['duration_ms']:.0f} ms  {stall['hot_spot']}  {stall['location']}")
+        self.text.setPlainText("\n".join(lines))
@@ -2,33 +2,77 @@
 Project generation module
 """
 import os
-from PySide6.QtCore import Qt
+import threading
+from PySide6.QtCore import Qt, QObject, Signal
 from .api import ask_claude
+from .scheduler import SCAFFOLDING, request_context
+from .qml_style import enforce_style, format_issues
+from .components import CONTENT_FILE, split_response
 
 
-def create_project_structure(project_name, image_generated_qml=None, gui_mode=True, log_callback=None):
+# Written instead of a generated Content.qml while image analysis is still running
+PLACEHOLDER_CONTENT_QML = """import QtQuick
+
+Rectangle {
+    anchors.fill: parent
+    color: "#000000"
+}
+"""
+
+
+class ProjectCreationCancelled(Exception):
+    """Raised between generation steps when project creation has been cancelled"""
+
+
+def get_project_dir(project_name):
+    """Return the directory a project with this name is created in"""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, project_name)
+
+
+def create_project_structure(project_name, image_generated_qml=None, gui_mode=True, log_callback=None,
+                             progress_callback=None, error_callback=None, cancel_event=None, overwrite=None,
+                             generate_content=True, project_dir=None):
     """Create a complete Qt project structure using Claude API
     
     Args:
         project_name: Name of the project
         image_generated_qml: Pre-generated QML from image analysis
         gui_mode: Whether to use GUI dialogs instead of CLI prompts
-        log_callback: Function to call for logging messages in GUI mode
+        log_callback: Function to call for logging messages
+        progress_callback: Function called with the path of each file once it is written
+        error_callback: Function called with the error message if generation fails
+        cancel_event: threading.Event that aborts generation between steps when set
+        overwrite: Overwrite an existing project directory without asking
+        generate_content: Whether to ask Claude for a starter Content.qml when no image QML is
+            given; when False a local placeholder is written because image QML is on its way
+        project_dir: Directory to create the project in instead of the default for its name
     """
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    project_dir = os.path.join(base_dir, project_name)
+    project_dir = project_dir or get_project_dir(project_name)
     
     # Helper function for logging
     def log(message):
-        if gui_mode and log_callback:
+        if log_callback:
             log_callback(message)
         print(message)
     
+    # Helper function to stop between steps once cancelled
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise ProjectCreationCancelled()
+    
+    # Helper function to write a generated file and report it
+    def write_file(path, content):
+        with open(path, "w") as f:
+            f.write(content)
+        if progress_callback:
+            progress_callback(path)
+    
     # Initialize conversation history
     conversation_history = []
     
     # Create project directory
-    if os.path.exists(project_dir):
+    if os.path.exists(project_dir) and not overwrite:
         if gui_mode:
             from PySide6.QtWidgets import QMessageBox
             result = QMessageBox.question(None, "Project Exists", 
@@ -54,8 +98,10 @@ def create_project_structure(project_name, image_generated_qml=None, gui_mode=Tr
         from PySide6.QtWidgets import QApplication
         QApplication.setOverrideCursor(Qt.WaitCursor)
     
-    log("Generating CMakeLists.txt...")
-    cmakelists_prompt = f"""Create a CMakeLists.txt file for a Qt 6.8 Quick application with the following details:
+    try:
+        check_cancelled()
+        log("Generating CMakeLists.txt...")
+        cmakelists_prompt = f"""Create a CMakeLists.txt file for a Qt 6.8 Quick application with the following details:
 - Project name: {project_name}
 - Minimum CMake version: 3.20
 - Minimum Qt version: 6.8
@@ -70,31 +116,24 @@ def create_project_structure(project_name, image_generated_qml=None, gui_mode=Tr
     QML_FILES
       Main.qml
       Content.qml
+      ${{COMPONENT_QML_FILES}}
   )
+- Before qt_add_qml_module, collect the reusable components with file(GLOB COMPONENT_QML_FILES RELATIVE ${{CMAKE_CURRENT_SOURCE_DIR}} CONFIGURE_DEPENDS components/*.qml)
 - Create an executable from main.cpp and link it to the QML module
 - Set up proper linking to the Qt libraries
 - Include any modern best practices for Qt 6.8 CMake projects
 
 Please provide only the complete CMakeLists.txt content without any explanation or markdown formatting."""
 
-    try:
         cmakelists_content, conversation_history = ask_claude(cmakelists_prompt, conversation_history)
         if not cmakelists_content:
             raise Exception("Failed to generate CMakeLists.txt")
-            
-        with open(cmakelists_path, "w") as f:
-            f.write(cmakelists_content)
-    except Exception as e:
-        log(f"Error generating CMakeLists.txt: {e}")
-        if gui_mode:
-            from PySide6.QtWidgets import QMessageBox
-            QMessageBox.critical(None, "Generation Error", f"Failed to generate CMakeLists.txt: {e}")
-            QApplication.restoreOverrideCursor()
-        return None
-    
-    # Generate main.cpp
-    log("Generating main.cpp...")
-    main_cpp_content = """#include <QGuiApplication>
+        write_file(cmakelists_path, cmakelists_content)
+        
+        # Generate main.cpp
+        check_cancelled()
+        log("Generating main.cpp...")
+        main_cpp_content = """#include <QGuiApplication>
 #include <QQmlApplicationEngine>
 int main(int argc, char *argv[])
 {
@@ -112,16 +151,15 @@ int main(int argc, char *argv[])
     engine.loadFromModule("PROJECTNAME", "Main");
     return app.exec();
 }"""
-    
-    # Replace the project name placeholder
-    main_cpp_content = main_cpp_content.replace("PROJECTNAME", project_name)
-    
-    with open(main_cpp_path, "w") as f:
-        f.write(main_cpp_content)
-    
-    # Generate Main.qml
-    log("Generating Main.qml...")
-    main_qml_prompt = f"""Create a Main.qml file for a Qt 6.8 application with the following details:
+        
+        # Replace the project name placeholder
+        main_cpp_content = main_cpp_content.replace("PROJECTNAME", project_name)
+        write_file(main_cpp_path, main_cpp_content)
+        
+        # Generate Main.qml
+        check_cancelled()
+        log("Generating Main.qml...")
+        main_qml_prompt = f"""Create a Main.qml file for a Qt 6.8 application with the following details:
 - The file will be the entry point for a {project_name} QML module
 - Create a main ApplicationWindow (not just Window) element with a title, width, and height
 - Add proper import statements with no version numbers (QtQuick, QtQuick.Controls, QtQuick.Layouts)
@@ -134,35 +172,65 @@ int main(int argc, char *argv[])
 
 Please provide only the complete Main.qml content without any explanation or markdown formatting."""
 
-    main_qml_content, conversation_history = ask_claude(main_qml_prompt, conversation_history)
-    with open(main_qml_path, "w") as f:
-        f.write(main_qml_content)
-    
-    # Generate Content.qml
-    log("Generating Content.qml...")
-    
-    # If we have pre-generated QML from image analysis, use that instead of generating new content
-    if image_generated_qml:
-        log("Using pre-generated QML from image analysis...")
-        content_qml_content = image_generated_qml
-    else:
-        # Generate default Content.qml if no image-based QML is available
-        content_qml_prompt = f"""Create a Content.qml file for a Qt 6.8 application with the following details:
+        main_qml_content, conversation_history = ask_claude(main_qml_prompt, conversation_history)
+        if not main_qml_content:
+            raise Exception("Failed to generate Main.qml")
+        write_file(main_qml_path, main_qml_content)
+        
+        # Generate Content.qml
+        check_cancelled()
+        log("Generating Content.qml...")
+        
+        # If we have pre-generated QML from image analysis, use that instead of generating new content
+        if image_generated_qml:
+            log("Using pre-generated QML from image analysis...")
+            # A decomposed image comes with its components in "// File:" sections
+            image_files = split_response(image_generated_qml)
+            content_qml_content = image_files.pop(CONTENT_FILE, PLACEHOLDER_CONTENT_QML)
+            for name, source in image_files.items():
+                check_cancelled()
+                os.makedirs(os.path.dirname(os.path.join(project_dir, name)), exist_ok=True)
+                write_file(os.path.join(project_dir, name), source)
+        elif not generate_content:
+            log("Writing placeholder until the image analysis completes...")
+            content_qml_content = PLACEHOLDER_CONTENT_QML
+        else:
+            # Generate default Content.qml if no image-based QML is available
+            content_qml_prompt = f"""Create a Content.qml file for a Qt 6.8 application with the following details:
 - This file will be loaded by the Main.qml Loader
 - Create a Rectangle as the root element that fills its parent
 - Add a Text element centered in the rectangle with a welcome message for {project_name}
-- Follow these style guidelines:
-  1. Don't use version numbers in imports (use "import QtQuick" not "import QtQuick 2.15")
-  2. Don't start IDs with capital letters (use "id: root" not "id: Root")
-  3. Make sure the root element has anchors.fill: parent
+- Make sure the root element has anchors.fill: parent
 
 Please provide only the complete Content.qml content without any explanation or markdown formatting."""
 
-        content_qml_content, conversation_history = ask_claude(content_qml_prompt, conversation_history)
+            content_qml_content, conversation_history = ask_claude(content_qml_prompt, conversation_history)
+            if not content_qml_content:
+                raise Exception("Failed to generate Content.qml")
+            content_qml_content, issues = enforce_style(content_qml_content)
+            if issues:
+                log(f"Style fixes:\n{format_issues(issues)}")
+        
+        # Write Content.qml
+        check_cancelled()
+        write_file(content_qml_path, content_qml_content)
+    except ProjectCreationCancelled:
+        log("Project creation cancelled.")
+        if gui_mode:
+            QApplication.restoreOverrideCursor()
+        return None
+    except Exception as e:
+        log(f"Error generating project files: {e}")
+        if error_callback:
+            error_callback(str(e))
+        if gui_mode:
+            from PySide6.QtWidgets import QMessageBox
+            QApplication.restoreOverrideCursor()
+            QMessageBox.critical(None, "Generation Error", f"Failed to generate project files: {e}")
+        return None
     
-    # Write Content.qml
-    with open(content_qml_path, "w") as f:
-        f.write(content_qml_content)
+    if gui_mode:
+        QApplication.restoreOverrideCursor()
     
     log(f"\nProject {project_name} created successfully in {project_dir}")
     log("Directory structure:")
@@ -170,7 +238,8 @@ Please provide only the complete Content.qml content without any explanation or
     log(f"├── CMakeLists.txt")
     log(f"├── main.cpp")
     log(f"├── Main.qml")
-    log(f"└── Content.qml")
+    log(f"├── Content.qml")
+    log("└── components/  (reusable components added by later prompts)")
     log("\nTo build the project:")
     log(f"cd {project_name}")
     log("mkdir build && cd build")
@@ -180,6 +249,57 @@ Please provide only the complete Content.qml content without any explanation or
     return content_qml_path  # Return the path to the Content.qml file for QML reloading
 
 
+class ProjectCreationJob(QObject):
+    """Runs create_project_structure on a background thread and reports back through signals"""
+    progress = Signal(str)      # Log output from the generator
+    fileCreated = Signal(str)   # Path of each project file as it is written
+    failed = Signal(str)        # Error message if generation fails
+    cancelled = Signal()
+    finished = Signal(str)      # Path to the generated Content.qml
+    
+    def __init__(self, project_name, image_generated_qml=None, generate_content=True):
+        super().__init__()
+        self.project_name = project_name
+        self.image_generated_qml = image_generated_qml
+        self.generate_content = generate_content
+        self.cancel_event = threading.Event()
+        self.thread = None
+        
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        
+    def cancel(self):
+        """Request cancellation; the job stops before its next generation step"""
+        self.cancel_event.set()
+        
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+        
+    def run(self):
+        errors = []
+        with request_context(SCAFFOLDING):
+            content_qml_path = create_project_structure(
+                self.project_name,
+                self.image_generated_qml,
+                gui_mode=False,
+                log_callback=self.progress.emit,
+                progress_callback=self.fileCreated.emit,
+                error_callback=errors.append,
+                cancel_event=self.cancel_event,
+                overwrite=True,  # The caller confirms overwriting on the GUI thread
+                generate_content=self.generate_content
+            )
+        
+        if content_qml_path:
+            self.finished.emit(content_qml_path)
+        elif self.cancel_event.is_set():
+            self.cancelled.emit()
+        else:
+            self.failed.emit(errors[-1] if errors else "Project creation failed")
+
+
 def get_valid_project_name():
     """
     Prompt the user for a project name and validate it.
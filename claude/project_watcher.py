@@ -0,0 +1,149 @@
+"""
+Project-wide debounced file watching
+"""
+import os
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal, Slot
+
+
+# Files that can change what the preview shows
+WATCHED_EXTENSIONS = (
+    ".qml", ".js", ".mjs", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".bmp",
+    ".ttf", ".otf", ".frag", ".vert", ".qsb",
+)
+WATCHED_NAMES = ("qmldir",)
+
+# The app's own outputs and files the preview never loads, relative to the project root
+IGNORED_NAMES = (
+    "Main.qml", "main.cpp", "CMakeLists.txt", "debug_qml_output.txt", "gui_lag_report.jsonl",
+)
+IGNORED_DIRS = ("build", "__pycache__")  # Hidden directories such as .git are skipped as well
+
+# Quiet period before a burst of events is reported, and the longest a burst can delay a reload
+DEBOUNCE_MS = 150
+MAX_DELAY_MS = 1000
+
+
+def is_relevant(path, project_dir):
+    """Whether a file can affect the loaded QML tree"""
+    name = os.path.basename(path)
+    if name.startswith(".") or name.endswith("~"):
+        return False
+    # Only the top-level files are the app's own; a components/Main.qml is loaded like any other
+    if os.path.relpath(path, project_dir) in IGNORED_NAMES:
+        return False
+    return name in WATCHED_NAMES or name.lower().endswith(WATCHED_EXTENSIONS)
+
+
+def is_ignored_dir(name):
+    return name in IGNORED_DIRS or name.startswith(("build-", "cmake-build-", "."))
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ProjectWatcher(QObject):
+    """
+    Watches every relevant file in a project directory and its subdirectories
+
+    Events are coalesced: a batch is reported once no event has arrived for DEBOUNCE_MS,
+    or at the latest MAX_DELAY_MS after the first one. Each batch is checked against
+    the size and modification time recorded for every file, so only files that really
+    changed, appeared or disappeared are reported. Editors that save by writing a
+    temporary file and renaming it over the original show up as a directory change;
+    the rescan picks up the new file and watches it again.
+    """
+    changed = Signal(list)  # Paths of the files that changed, were added or were removed
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.project_dir = None
+        self.signatures = {}
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.handle_event)
+        self.watcher.directoryChanged.connect(self.handle_event)
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(DEBOUNCE_MS)
+        self.debounce_timer.timeout.connect(self.flush)
+
+        self.max_delay_timer = QTimer(self)
+        self.max_delay_timer.setSingleShot(True)
+        self.max_delay_timer.setInterval(MAX_DELAY_MS)
+        self.max_delay_timer.timeout.connect(self.flush)
+
+    def set_project(self, project_dir):
+        """Watch another project directory, discarding pending events of the previous one"""
+        self.stop()
+        self.project_dir = project_dir
+        self.signatures = self.scan()
+        self.update_watched_paths()
+
+    def scan(self):
+        """Return {path: (mtime, size)} for every relevant file in the project"""
+        signatures = {}
+        if not self.project_dir or not os.path.isdir(self.project_dir):
+            return signatures
+        for directory, dirs, files in os.walk(self.project_dir):
+            dirs[:] = [name for name in dirs if not is_ignored_dir(name)]
+            for name in files:
+                path = os.path.join(directory, name)
+                if is_relevant(path, self.project_dir):
+                    signature = file_signature(path)
+                    if signature is not None:
+                        signatures[path] = signature
+        return signatures
+
+    def update_watched_paths(self):
+        """Watch every directory (for added, removed and renamed files) and every relevant file"""
+        paths = set(self.signatures)
+        if self.project_dir and os.path.isdir(self.project_dir):
+            for directory, dirs, _ in os.walk(self.project_dir):
+                dirs[:] = [name for name in dirs if not is_ignored_dir(name)]
+                paths.add(directory)
+
+        watched = set(self.watcher.files()) | set(self.watcher.directories())
+        stale = watched - paths
+        if stale:
+            self.watcher.removePaths(list(stale))
+        # A file replaced by a rename drops out of the watcher and is added again here
+        new = [path for path in paths - watched if os.path.exists(path)]
+        if new:
+            self.watcher.addPaths(new)
+
+    @Slot(str)
+    def handle_event(self, path):
+        if not self.max_delay_timer.isActive():
+            self.max_delay_timer.start()
+        self.debounce_timer.start()
+
+    @Slot()
+    def flush(self):
+        """Report the files that changed since the last batch"""
+        self.debounce_timer.stop()
+        self.max_delay_timer.stop()
+
+        signatures = self.scan()
+        changed = sorted(
+            path for path in set(signatures) | set(self.signatures)
+            if signatures.get(path) != self.signatures.get(path)
+        )
+        self.signatures = signatures
+        self.update_watched_paths()
+
+        if changed:
+            self.changed.emit(changed)
+
+    def stop(self):
+        self.debounce_timer.stop()
+        self.max_delay_timer.stop()
+        watched = self.watcher.files() + self.watcher.directories()
+        if watched:
+            self.watcher.removePaths(watched)
+        self.signatures = {}
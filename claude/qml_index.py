@@ -0,0 +1,237 @@
+"""
+QML object index and context selection
+
+Indexes the objects of a QML document (types, ids, property spans and line ranges)
+so that a prompt about one part of a large UI can be answered by sending only that
+part, and the edited part can be spliced back into the document by span.
+"""
+import re
+import textwrap
+from .qml_tokenizer import (
+    tokenize, next_significant, object_members, root_object, walk_objects
+)
+from .qml_style import strip_code_fences, import_statements
+
+
+# Documents smaller than this are always sent whole
+MIN_SELECTION_SOURCE_CHARS = 4000
+
+# A selection covering more than this fraction of the document isn't worth it
+MAX_SELECTION_FRACTION = 0.6
+
+# Words that name too many things to identify an object
+GENERIC_WORDS = {"item", "rectangle", "text", "root", "parent", "the", "it", "this", "all", "background"}
+
+
+class QmlObject:
+    """One object in the index"""
+    def __init__(self, type_name, start, end, body_start, body_end, first_line, last_line, parent=None):
+        self.type_name = type_name
+        self.start = start              # Offset of the type name
+        self.end = end                  # Offset just past the closing brace
+        self.body_start = body_start    # Offset of the opening brace
+        self.body_end = body_end
+        self.first_line = first_line
+        self.last_line = last_line
+        self.parent = parent
+        self.children = []
+        self.id = None
+        self.properties = {}            # Property name -> (start, end) span of the value
+        self.strings = []               # String literal values of the object's properties
+
+    def ancestors(self):
+        node = self.parent
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def label(self):
+        return f"{self.type_name} {{ id: {self.id} }}" if self.id else self.type_name
+
+    def __repr__(self):
+        return f"QmlObject({self.label()}, lines {self.first_line}-{self.last_line})"
+
+
+class QmlSelection:
+    """A part of a document selected for a prompt"""
+    def __init__(self, index, node):
+        self.index = index
+        self.node = node
+        self.original = index.source[node.start:node.end]
+
+        # Indentation of the object's first line, removed before sending and restored after
+        line_start = index.source.rfind("\n", 0, node.start) + 1
+        self.indent = index.source[line_start:node.start]
+
+    def text(self):
+        """The selected object, dedented"""
+        return textwrap.dedent(self.indent + self.original)
+
+    def context(self):
+        """Describe where the selection sits and what it can refer to"""
+        path = " > ".join(node.label() for node in reversed(list(self.node.ancestors())))
+        inside = {id(node) for node in self.index.subtree(self.node)}
+        other_ids = sorted(node.id for node in self.index.objects if node.id and id(node) not in inside)
+        lines = [f"Imports:\n{self.index.imports_text()}", f"It is nested inside: {path}"]
+        if other_ids:
+            lines.append(f"Other ids in the file that it may refer to: {', '.join(other_ids)}")
+        return "\n".join(lines)
+
+
+class QmlIndex:
+    """Object tree of a QML document"""
+    def __init__(self, source):
+        self.source = source
+        self.tokens = tokenize(source)
+        self.root = None
+        self.objects = []
+        self.by_id = {}
+
+        root = root_object(self.tokens)
+        if root is None:
+            return
+
+        nodes = {}
+        for type_name, type_index, open_index, close_index, parent in walk_objects(self.tokens, *root):
+            node = QmlObject(
+                type_name,
+                self.tokens[type_index].start,
+                self.tokens[close_index].end,
+                self.tokens[open_index].start,
+                self.tokens[close_index].end,
+                self.tokens[type_index].line,
+                self.tokens[close_index].line,
+                nodes.get(parent[1]) if parent else None,
+            )
+            nodes[type_index] = node
+            if node.parent is not None:
+                node.parent.children.append(node)
+            else:
+                self.root = node
+            self.objects.append(node)
+
+            for member in object_members(self.tokens, open_index, close_index):
+                if member[0] != "property":
+                    continue
+                value_start, value_end = self.tokens[member[3]], self.tokens[member[4]]
+                node.properties[member[1]] = (value_start.start, value_end.end)
+                if member[1] == "id" and value_start.kind == "ident":
+                    node.id = value_start.text
+                    self.by_id[node.id] = node
+                elif value_start.kind == "string" and member[3] == member[4]:
+                    node.strings.append(value_start.text[1:-1])
+
+    def subtree(self, node):
+        yield node
+        for child in node.children:
+            yield from self.subtree(child)
+
+    def object_at(self, offset):
+        """Return the innermost object containing a source offset"""
+        found = None
+        for node in self.objects:
+            if node.start <= offset < node.end and (found is None or node.start >= found.start):
+                found = node
+        return found
+
+    def imports_text(self):
+        return "\n".join(
+            self.source[self.tokens[i].start:self.tokens[end].end]
+            for i, _, end, _ in import_statements(self.tokens)
+        )
+
+    def mentioned_objects(self, prompt):
+        """Find the objects a prompt refers to by id, by visible text, or by a type used only once"""
+        words = [word.lower() for word in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", prompt)]
+        word_set = set(words)
+        lowered_prompt = prompt.lower()
+
+        mentioned = []
+        for node in self.objects:
+            if node.id:
+                parts = [part.lower() for part in re.findall(r"[a-z0-9]+|[A-Z][a-z0-9]*", node.id)]
+                if node.id.lower() in word_set or (len(parts) > 1 and word_set.issuperset(parts)):
+                    mentioned.append(node)
+                    continue
+            if any(len(text) >= 3 and text.lower() in lowered_prompt for text in node.strings):
+                mentioned.append(node)
+
+        type_counts = {}
+        for node in self.objects:
+            type_counts[node.type_name] = type_counts.get(node.type_name, 0) + 1
+        for node in self.objects:
+            type_word = node.type_name.split(".")[-1].lower()
+            if type_counts[node.type_name] == 1 and type_word in word_set and type_word not in GENERIC_WORDS \
+                    and node not in mentioned:
+                mentioned.append(node)
+        return mentioned
+
+    def select(self, prompt):
+        """
+        Select the smallest object covering everything the prompt mentions
+        Returns a QmlSelection, or None when the whole document should be sent
+        """
+        if self.root is None or len(self.source) < MIN_SELECTION_SOURCE_CHARS:
+            return None
+
+        mentioned = self.mentioned_objects(prompt)
+        if not mentioned:
+            return None
+
+        # Lowest common ancestor of the mentioned objects
+        common = [mentioned[0]] + list(mentioned[0].ancestors())
+        for node in mentioned[1:]:
+            chain = {id(n) for n in [node] + list(node.ancestors())}
+            common = [n for n in common if id(n) in chain]
+        if not common or common[0] is self.root:
+            return None
+
+        node = common[0]
+        if node.end - node.start > len(self.source) * MAX_SELECTION_FRACTION:
+            return None
+        return QmlSelection(self, node)
+
+
+def split_imports(text):
+    """Split a QML fragment into its import lines and the rest"""
+    tokens = tokenize(text)
+    imports = []
+    body_start = 0
+    for i, _, end, _ in import_statements(tokens):
+        imports.append(text[tokens[i].start:tokens[end].end])
+        body_start = tokens[end].end
+    return imports, text[body_start:].strip()
+
+
+def splice(selection, response):
+    """
+    Put the edited object from a response back in place of the selection
+    Returns the new document source; raises if the response isn't a single object
+    """
+    source = selection.index.source
+    imports, fragment = split_imports(strip_code_fences(response))
+
+    tokens = tokenize(fragment)
+    root = root_object(tokens)
+    if root is None or root[1] != next_significant(tokens, -1) or next_significant(tokens, root[3]) < len(tokens):
+        raise Exception("The response is not a single QML object")
+
+    # Restore the original indentation on every line after the first
+    lines = fragment.split("\n")
+    fragment = "\n".join([lines[0]] + [selection.indent + line if line.strip() else line for line in lines[1:]])
+
+    node = selection.node
+    spliced = source[:node.start] + fragment + source[node.end:]
+
+    # Add any imports the edited object needs
+    existing = set(selection.index.imports_text().split("\n"))
+    new_imports = [line for line in imports if line not in existing]
+    if new_imports:
+        header_tokens = tokenize(spliced)
+        statements = list(import_statements(header_tokens))
+        if statements:
+            position = header_tokens[statements[-1][2]].end
+            spliced = spliced[:position] + "".join(f"\n{line}" for line in new_imports) + spliced[position:]
+        else:
+            spliced = "".join(f"{line}\n" for line in new_imports) + spliced
+    return spliced
@@ -0,0 +1,316 @@
+"""
+Runtime performance profiler for generated QML
+
+Loads a Content.qml offscreen in a child process, drives it through an idle phase
+and a scripted mouse interaction phase, and reports frame times, object counts,
+Canvas repaint cost and property-change churn (a proxy for binding evaluations).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from PySide6.QtCore import QObject, Signal
+
+
+# Thresholds used to flag offenders
+FRAME_BUDGET_MS = 1000.0 / 60
+SLOW_CANVAS_PAINT_MS = 4.0
+MAX_OBJECTS = 2000
+MAX_INSTRUMENTED_OBJECTS = 500  # Objects whose property notifications are counted
+MAX_IDLE_CHANGES_PER_SECOND = 60
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def find_offenders(report):
+    """Return human-readable descriptions of the worst performance problems in a report"""
+    offenders = []
+    idle_seconds = report["idle_seconds"] or 1.0
+
+    frames = report["frames"]
+    if frames["p95_ms"] > FRAME_BUDGET_MS:
+        offenders.append(f"95th percentile frame time is {frames['p95_ms']:.1f} ms "
+                         f"(budget {FRAME_BUDGET_MS:.1f} ms)")
+    if report["idle_frames"] / idle_seconds > 1:
+        offenders.append(f"The scene renders {report['idle_frames'] / idle_seconds:.0f} frames/s "
+                         f"while nothing is happening")
+
+    for canvas in report["canvases"]:
+        if canvas["idle_paints"]:
+            offenders.append(f"Canvas '{canvas['name']}' repaints {canvas['idle_paints'] / idle_seconds:.0f} "
+                             f"times/s while idle")
+        if canvas["mean_ms"] > SLOW_CANVAS_PAINT_MS:
+            offenders.append(f"Canvas '{canvas['name']}' takes {canvas['mean_ms']:.1f} ms per paint")
+
+    objects = report["objects"]
+    if objects["total"] > MAX_OBJECTS:
+        worst_type, worst_count = max(objects["by_type"].items(), key=lambda item: item[1])
+        offenders.append(f"{objects['total']} items in the scene ({worst_count} of type {worst_type})")
+
+    for name, changes in report["hot_properties"]:
+        if changes["idle"] / idle_seconds > MAX_IDLE_CHANGES_PER_SECOND:
+            offenders.append(f"Property '{name}' changes {changes['idle'] / idle_seconds:.0f} times/s while idle")
+
+    return offenders
+
+
+def build_optimization_prompt(report):
+    """Build a follow-up prompt asking Claude to fix the offenders found by the profiler"""
+    findings = "\n".join(f"- {offender}" for offender in report["offenders"])
+    return f"""Optimize this QML for an embedded dashboard with a weak CPU and GPU. A runtime profile found:
+{findings}
+
+Keep the visual result the same. Prefer Shape/ShapePath or static Images over Canvas for graphics that don't change, only call requestPaint() when the drawn data actually changes, avoid timers and animations that run while nothing changes, and reduce the number of items created by Repeaters."""
+
+
+class ProfileRun(QObject):
+    """Child-process side: instruments a QQuickView and collects the measurements"""
+
+    def __init__(self, view, duration):
+        super().__init__()
+        self.view = view
+        self.duration = duration
+        self.idle_seconds = min(2.0, duration / 2)
+        self.phase = "idle"
+
+        self.frame_times = []
+        self.frame_start = None
+        self.frame_counts = {"idle": 0, "interaction": 0}
+        self.canvases = {}
+        self.property_changes = {}
+        self.checkpoint = time.perf_counter()
+
+        view.beforeSynchronizing.connect(self.handle_frame_start)
+        view.frameSwapped.connect(self.handle_frame_end)
+        view.afterAnimating.connect(self.handle_checkpoint)
+
+    def object_name(self, obj):
+        from PySide6.QtQml import QQmlEngine
+        context = QQmlEngine.contextForObject(obj)
+        name = context.nameForObject(obj) if context is not None else ""
+        return name or f"{obj.metaObject().className()}@{id(obj):x}"
+
+    def instrument(self, root):
+        """Walk the item tree, counting objects and hooking Canvas paints and property notifications"""
+        from PySide6.QtCore import SIGNAL
+
+        by_type = {}
+        items = [root]
+        index = 0
+        while index < len(items):
+            item = items[index]
+            index += 1
+            items.extend(item.childItems())
+
+            class_name = item.metaObject().className().split("_QML")[0]
+            by_type[class_name] = by_type.get(class_name, 0) + 1
+            if index > MAX_OBJECTS * 5:
+                break  # Enough to know the scene is far too big
+
+            if item.inherits("QQuickCanvasItem"):
+                name = self.object_name(item)
+                self.canvases[name] = {"paints": 0, "idle_paints": 0, "total_ms": 0.0}
+                item.painted.connect(lambda name=name: self.handle_canvas_painted(name))
+
+            # Count property change notifications as a proxy for binding evaluations
+            if index <= MAX_INSTRUMENTED_OBJECTS:
+                meta = item.metaObject()
+                for i in range(meta.propertyCount()):
+                    prop = meta.property(i)
+                    if not prop.hasNotifySignal():
+                        continue
+                    key = f"{self.object_name(item)}.{prop.name()}"
+                    signature = bytes(prop.notifySignal().methodSignature().data()).decode()
+                    QObject.connect(item, SIGNAL(signature),
+                                    lambda *args, key=key: self.handle_property_changed(key))
+
+        self.object_counts = by_type
+
+    def handle_frame_start(self):
+        self.frame_start = time.perf_counter()
+
+    def handle_frame_end(self):
+        if self.frame_start is not None:
+            self.frame_times.append((time.perf_counter() - self.frame_start) * 1000)
+            self.frame_start = None
+        self.frame_counts[self.phase] += 1
+
+    def handle_checkpoint(self):
+        # Canvas paints happen after animations advance; each paint is timed from the previous checkpoint
+        self.checkpoint = time.perf_counter()
+
+    def handle_canvas_painted(self, name):
+        now = time.perf_counter()
+        canvas = self.canvases[name]
+        canvas["paints"] += 1
+        canvas["total_ms"] += (now - self.checkpoint) * 1000
+        if self.phase == "idle":
+            canvas["idle_paints"] += 1
+        self.checkpoint = now
+
+    def handle_property_changed(self, key):
+        counts = self.property_changes.setdefault(key, {"idle": 0, "interaction": 0})
+        counts[self.phase] += 1
+
+    def run_interaction(self, app):
+        """Move the mouse over a grid and click a few points, processing events between steps"""
+        from PySide6.QtCore import QPoint, Qt
+        try:
+            from PySide6.QtTest import QTest
+        except ImportError:
+            QTest = None
+
+        width, height = self.view.width(), self.view.height()
+        points = [QPoint(int(width * x / 8), int(height * y / 8)) for y in range(1, 8) for x in range(1, 8)]
+        end = time.perf_counter() + self.duration - self.idle_seconds
+        step = 0
+        while time.perf_counter() < end:
+            point = points[step % len(points)]
+            if QTest is not None:
+                QTest.mouseMove(self.view, point)
+                if step % 7 == 3:
+                    QTest.mouseClick(self.view, Qt.LeftButton, Qt.NoModifier, point)
+            self.view.update()
+            app.processEvents()
+            time.sleep(0.016)
+            step += 1
+
+    def report(self):
+        canvases = []
+        for name, canvas in self.canvases.items():
+            mean = canvas["total_ms"] / canvas["paints"] if canvas["paints"] else 0.0
+            canvases.append({"name": name, "paints": canvas["paints"], "idle_paints": canvas["idle_paints"],
+                             "total_ms": round(canvas["total_ms"], 2), "mean_ms": round(mean, 2)})
+        canvases.sort(key=lambda canvas: -canvas["total_ms"])
+
+        hot_properties = sorted(self.property_changes.items(),
+                                key=lambda item: -(item[1]["idle"] + item[1]["interaction"]))[:20]
+
+        total_frames = sum(self.frame_counts.values())
+        report = {
+            "duration": self.duration,
+            "idle_seconds": self.idle_seconds,
+            "frames": {
+                "count": total_frames,
+                "mean_ms": round(sum(self.frame_times) / len(self.frame_times), 2) if self.frame_times else 0.0,
+                "p95_ms": round(percentile(self.frame_times, 0.95), 2),
+                "max_ms": round(max(self.frame_times), 2) if self.frame_times else 0.0,
+            },
+            "idle_frames": self.frame_counts["idle"],
+            "objects": {"total": sum(self.object_counts.values()), "by_type": self.object_counts},
+            "canvases": canvases,
+            "property_changes": sum(c["idle"] + c["interaction"] for c in self.property_changes.values()),
+            "hot_properties": hot_properties,
+        }
+        report["offenders"] = find_offenders(report)
+        return report
+
+
+def profile_main(argv=None):
+    """Entry point of the profiler child process"""
+    parser = argparse.ArgumentParser(description="Profile a QML file offscreen")
+    parser.add_argument("content", help="QML file to profile")
+    parser.add_argument("--output", required=True, help="File to write the JSON report to")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run for")
+    parser.add_argument("--width", type=int, default=450)
+    parser.add_argument("--height", type=int, default=450)
+    args = parser.parse_args(argv)
+
+    from PySide6.QtCore import QUrl
+    from PySide6.QtGui import QGuiApplication
+    from PySide6.QtQuick import QQuickView
+
+    app = QGuiApplication(sys.argv[:1])
+    view = QQuickView()
+    view.setResizeMode(QQuickView.SizeRootObjectToView)
+    view.resize(args.width, args.height)
+
+    run = ProfileRun(view, args.duration)
+    view.setSource(QUrl.fromLocalFile(os.path.abspath(args.content)))
+    if view.status() != QQuickView.Ready or view.rootObject() is None:
+        errors = "\n".join(error.toString() for error in view.errors())
+        with open(args.output, "w") as f:
+            json.dump({"error": errors or "Failed to load QML"}, f)
+        return 1
+
+    run.instrument(view.rootObject())
+    view.show()
+
+    # Idle phase: anything that renders now is wasted work
+    end = time.perf_counter() + run.idle_seconds
+    while time.perf_counter() < end:
+        app.processEvents()
+        time.sleep(0.005)
+
+    run.phase = "interaction"
+    run.run_interaction(app)
+
+    with open(args.output, "w") as f:
+        json.dump(run.report(), f)
+    return 0
+
+
+class QmlPerfJob(QObject):
+    """Runs the profiler in a child process on a background thread and reports the result"""
+    finished = Signal(dict)
+    failed = Signal(str)
+
+    def __init__(self, content_qml_file, duration=5.0):
+        super().__init__()
+        self.content_qml_file = content_qml_file
+        self.duration = duration
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env["QT_QPA_PLATFORM"] = "offscreen"
+        env["QSG_RENDER_LOOP"] = "basic"  # Keep rendering on the thread being measured
+        env.setdefault("QT_QUICK_BACKEND", "software")
+
+        fd, output_file = tempfile.mkstemp(suffix=".json", prefix="qml_perf_")
+        os.close(fd)
+        try:
+            process = subprocess.run(
+                [sys.executable, "-m", "claude.qml_perf", self.content_qml_file,
+                 "--output", output_file, "--duration", str(self.duration)],
+                cwd=base_dir, env=env, timeout=self.duration + 60,
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            # A crash leaves no report; what the child printed says why
+            stderr = process.stderr.decode("utf-8", "replace").strip()
+            if not os.path.getsize(output_file):
+                raise Exception(stderr or f"Profiling exited with code {process.returncode}")
+            with open(output_file, "r") as f:
+                report = json.load(f)
+            if "error" in report:
+                raise Exception("\n".join(part for part in (report["error"], stderr) if part))
+            self.finished.emit(report)
+        except subprocess.TimeoutExpired:
+            self.failed.emit("The QML did not finish loading in time (possible infinite loop)")
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+
+if __name__ == "__main__":
+    sys.exit(profile_main())
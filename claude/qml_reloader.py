@@ -2,48 +2,91 @@
 QML Reloader module
 """
 import os
-from PySide6.QtCore import QObject, Signal, Slot, QFileSystemWatcher, QUrl, QTimer
+from PySide6.QtCore import QObject, Signal, Slot, QUrl, QTimer
 from .controller import QmlReloaderController
 from .worker import ClaudeApiWorker
+from .project_watcher import ProjectWatcher
+from .components import CONTENT_FILE, load_project_files, split_response, write_project_files
 
 
 class QmlReloader(QObject):
-    def __init__(self, engine, window_qml_file, content_qml_file, reference_image_path=None, image_processing_result=None):
+    def __init__(self, engine, window_qml_file, content_qml_file, reference_image_path=None, image_processing_result=None,
+                 preview=None):
         super().__init__()
         self.engine = engine
         self.window_qml_file = window_qml_file
         self.content_qml_file = content_qml_file
         self.image_processing_result = image_processing_result
         
+        # With an IsolatedPreview the engine lives in a child process and engine is None
+        self.preview = preview
+        
         self.controller = QmlReloaderController(engine)
-        self.engine.rootContext().setContextProperty("reloaderController", self.controller)
-        engine.rootContext().setContextProperty("qmlReloader", self)
+        if engine is not None:
+            self.engine.rootContext().setContextProperty("reloaderController", self.controller)
+            engine.rootContext().setContextProperty("qmlReloader", self)
+        if preview is not None:
+            # Mirror the controller state into the preview process
+            self.controller.isLoadingChanged.connect(preview.set_loading)
+            self.controller.isImageProcessingChanged.connect(preview.set_image_processing)
+            self.controller.promptStatusChanged.connect(preview.set_status)
         
         self.claude_worker = ClaudeApiWorker(content_qml_file, self.controller, reference_image_path)
         self.claude_worker.start()
         
-        self.watcher = QFileSystemWatcher([content_qml_file])
-        self.watcher.fileChanged.connect(self.handle_file_changed)
+        # Content.qml changes reload only Content.qml; other changes need a full cache clear
+        self.revision = 0
+        
+        self.watcher = ProjectWatcher(self)
+        self.watcher.changed.connect(self.handle_project_changed)
+        self.watcher.set_project(os.path.dirname(content_qml_file))
         
-        self.timer = QTimer(self)
-        self.timer.setSingleShot(True)
-        self.timer.timeout.connect(self.check_file)
+        # Timer to check if the background image processing is complete
+        self.check_image_processing_timer = QTimer(self)
+        self.check_image_processing_timer.setInterval(200)  # The check is just a flag read
+        self.check_image_processing_timer.timeout.connect(self.check_image_processing)
         
         # Set the content source initially
-        self.controller.set_content_source(content_qml_file)
+        self.controller.set_content_source(self.content_url())
+        self.watch_image_processing()
         
-        # Start a timer to check if the background image processing is complete
-        if self.image_processing_result is not None:
-            # Set the image processing flag to show loading indicator
-            self.controller.set_is_image_processing(True)
+        print(f"Watching {os.path.dirname(content_qml_file)} for changes...")
+    
+    def watch_image_processing(self):
+        """Show the processing indicator until the background image analysis result is applied"""
+        if self.image_processing_result is None:
+            self.controller.set_is_image_processing(False)
+            return
             
-            # Start timer to check completion
-            self.check_image_processing_timer = QTimer(self)
-            self.check_image_processing_timer.setInterval(1000)  # Check every 1 second
-            self.check_image_processing_timer.timeout.connect(self.check_image_processing)
-            self.check_image_processing_timer.start()
+        # Set the image processing flag to show loading indicator
+        self.controller.set_is_image_processing(True)
+        self.check_image_processing_timer.start()
         
-        print(f"Watching {content_qml_file} for changes...")
+        # The analysis starts before the project is scaffolded, so it may already be done
+        QTimer.singleShot(0, self.check_image_processing)
+    
+    def retarget(self, content_qml_file, reference_image_path=None, image_processing_result=None):
+        """Switch the reloader, its watcher and its worker to another project's content file"""
+        # A skeleton still waiting for its detailed QML is not left behind in the previous project
+        if (self.check_image_processing_timer.isActive() and self.image_processing_result
+                and self.image_processing_result.skeleton_applied):
+            self.remove_skeleton()
+        self.check_image_processing_timer.stop()
+        
+        self.content_qml_file = content_qml_file
+        self.watcher.set_project(os.path.dirname(content_qml_file))
+        
+        self.image_processing_result = image_processing_result
+        self.claude_worker.retarget(content_qml_file, reference_image_path)
+        
+        self.controller.set_is_loading(False)
+        self.controller.updatePromptStatus("")
+        
+        # Reload from the new file; its components are different types
+        self.check_file(clear_cache=True)
+        self.watch_image_processing()
+        
+        print(f"Watching {os.path.dirname(content_qml_file)} for changes...")
     
     @Slot(str)
     def submitPrompt(self, prompt):
@@ -51,28 +94,84 @@ class QmlReloader(QObject):
         self.controller.updatePromptStatus("Processing your request...")
         self.claude_worker.submit_prompt(prompt)
         
-    def handle_file_changed(self, path):
-        print(f"Detected change in {path}")
-        self.timer.start(100)
+    def restore_version(self, action, number=None):
+        """
+        Undo, redo or jump to a version of the project files without calling the API
+        The watcher reloads the preview once the files are written
+        Returns the restored version
+        """
+        snapshots = self.claude_worker.snapshots
+        if action == "undo":
+            return snapshots.undo(self.content_qml_file)
+        if action == "redo":
+            return snapshots.redo(self.content_qml_file)
+        return snapshots.restore(number, self.content_qml_file)
+        
+    def content_url(self):
+        """
+        URL of Content.qml for the Loader
+        A new revision gives Content.qml a new cache key, so it is recompiled while the
+        cached component types it uses are kept
+        """
+        url = QUrl.fromLocalFile(self.content_qml_file)
+        if self.revision:
+            url.setQuery(f"rev={self.revision}")
+        return url.toString()
+        
+    @Slot(list)
+    def handle_project_changed(self, paths):
+        project_dir = os.path.dirname(self.content_qml_file)
+        print(f"Detected changes in {', '.join(os.path.relpath(path, project_dir) for path in paths)}")
+        
+        # Qt has no public API to evict a single type, so anything besides Content.qml clears the cache
+        self.check_file(clear_cache=any(path != self.content_qml_file for path in paths))
 
-    def check_file(self):
-        if os.path.exists(self.content_qml_file):
-            if not self.watcher.files():
-                self.watcher.addPath(self.content_qml_file)
-            
-            print("Reloading QML content...")
-            self.engine.clearComponentCache()
-            
-            # Update the content source to trigger a reload
-            self.controller.set_content_source("")
-            self.controller.set_content_source(self.content_qml_file)
+    def check_file(self, clear_cache=False):
+        if not os.path.exists(self.content_qml_file):
+            # The watcher reports the file again once it is (re)created
+            print("Content file not found, waiting...")
+            return
             
-            print("Content reload triggered")
+        self.revision += 1
+        
+        print("Reloading QML content..." if clear_cache else "Reloading Content.qml...")
+        if self.preview is not None:
+            self.preview.reload(self.content_url(), clear_cache)
         else:
-            print("Content file not found, waiting...")
-            self.timer.start(500)
+            if clear_cache:
+                self.engine.clearComponentCache()
+                
+                # Update the content source to trigger a reload
+                self.controller.set_content_source("")
+                self.controller.set_content_source(self.content_url())
+            else:
+                self.controller.set_content_source(self.content_url())
+                
+                # Drop the previous revision of Content.qml once the Loader has released it
+                QTimer.singleShot(0, self.engine.trimComponentCache)
+        
+        print("Content reload triggered")
     
     def check_image_processing(self):
+        # Nothing to do once the result has been applied
+        if not self.check_image_processing_timer.isActive():
+            return
+            
+        # Show the layout skeleton while the detailed pass runs; the timer keeps going for the result
+        result = self.image_processing_result
+        if result and not result.is_complete and result.skeleton_qml and not result.skeleton_applied:
+            result.skeleton_applied = True
+            print("Showing layout skeleton from reference image...")
+            try:
+                # Kept in case the project has no version to go back to if the detailed pass fails
+                result.replaced_content = load_project_files(self.content_qml_file).get(CONTENT_FILE)
+                write_project_files(self.content_qml_file, {CONTENT_FILE: result.skeleton_qml})
+                self.controller.set_is_image_processing(False)
+                self.controller.updatePromptStatus("Showing a layout skeleton; the detailed QML follows...")
+            except Exception as e:
+                print(f"Error applying layout skeleton: {e}")
+            return
+        
         # Check if the async image processing has completed
         if self.image_processing_result and self.image_processing_result.is_complete:
             # Stop the timer
@@ -84,12 +183,9 @@ class QmlReloader(QObject):
             if self.image_processing_result.qml_content:
                 print("Applying QML generated from reference image...")
                 try:
-                    # Write the QML content to the file
-                    with open(self.content_qml_file, "w") as f:
-                        f.write(self.image_processing_result.qml_content)
-                    
-                    # Trigger a reload
-                    self.check_file()
+                    # Write Content.qml and any components generated with it; the watcher reloads them
+                    write_project_files(self.content_qml_file, split_response(self.image_processing_result.qml_content))
+                    self.claude_worker.snapshots.record_project(self.content_qml_file, "Generated from reference image")
                     
                     # Update status message
                     self.controller.updatePromptStatus("Reference image QML applied successfully!")
@@ -101,8 +197,28 @@ class QmlReloader(QObject):
                 error_msg = f"Image processing error: {self.image_processing_result.error}"
                 print(error_msg)
                 self.controller.updatePromptStatus(error_msg)
+                
+            # The skeleton is only a stand-in, so it must not outlive a failed or superseded analysis
+            if not self.image_processing_result.qml_content and self.image_processing_result.skeleton_applied:
+                self.remove_skeleton()
+    
+    def remove_skeleton(self):
+        """Put back the project content the layout skeleton replaced"""
+        snapshots = self.claude_worker.snapshots
+        try:
+            if snapshots.current_number():
+                snapshots.restore(snapshots.current_number(), self.content_qml_file)
+            elif self.image_processing_result.replaced_content is not None:
+                write_project_files(self.content_qml_file,
+                                    {CONTENT_FILE: self.image_processing_result.replaced_content})
+            print("Removed the layout skeleton")
+        except Exception as e:
+            print(f"Error removing layout skeleton: {e}")
     
     def shutdown(self):
         self.claude_worker.stop()
-        if hasattr(self, 'check_image_processing_timer') and self.check_image_processing_timer.isActive():
-            self.check_image_processing_timer.stop()
\ No newline at end of file
+        self.check_image_processing_timer.stop()
+        self.watcher.stop()
+            
+        # The worker polls its queue once a second, so this returns promptly
+        self.claude_worker.join(timeout=2)
\ No newline at end of file
@@ -0,0 +1,446 @@
+"""
+Local QML style enforcer
+
+Checks generated QML against the style rules that can be applied mechanically and
+rewrites it in place, so those rules no longer need to be sent with every request
+and a violation no longer costs another generation.
+"""
+import math
+import re
+from collections import namedtuple
+from .qml_tokenizer import (
+    tokenize, statement_end, next_significant, previous_significant,
+    dotted_name_end, object_members, root_object, walk_objects
+)
+
+
+StyleIssue = namedtuple("StyleIssue", "rule message line fixed")
+
+# A ';' ending a statement and the spaces after it, up to the next statement on the line
+STATEMENT_SEPARATOR_RE = re.compile(r"[ \t]*;[ \t]*")
+
+WINDOW_TYPES = ("Window", "ApplicationWindow")
+
+# Window properties that have no meaning on an Item loaded by a Loader
+WINDOW_ONLY_PROPERTIES = (
+    "title", "visible", "visibility", "flags", "modality", "screen", "transientParent",
+    "minimumWidth", "minimumHeight", "maximumWidth", "maximumHeight", "onClosing",
+)
+
+# ApplicationWindow properties that can't be mapped onto an Item automatically
+APPLICATION_WINDOW_PROPERTIES = ("header", "footer", "menuBar", "background")
+
+# Modules to import when their types are used without the import
+MODULE_TYPES = {
+    "QtQuick.Controls": (
+        "Button", "Label", "Slider", "RangeSlider", "Switch", "CheckBox", "ComboBox", "TextField",
+        "TextArea", "ProgressBar", "BusyIndicator", "Dial", "SpinBox", "RadioButton", "RoundButton",
+        "DelayButton", "TabBar", "TabButton", "ToolBar", "ToolButton", "ScrollView", "Popup", "Dialog",
+        "Drawer", "Pane", "Frame", "GroupBox", "Page", "StackView", "SwipeView", "Menu", "MenuItem",
+        "MenuBar", "Tumbler", "ItemDelegate", "SwitchDelegate", "ToolTip",
+    ),
+    "QtQuick.Layouts": ("RowLayout", "ColumnLayout", "GridLayout", "StackLayout", "Layout"),
+    "QtQuick.Shapes": ("Shape", "ShapePath"),
+    "QtQuick.Effects": ("MultiEffect", "RectangularShadow"),
+}
+
+# Path elements whose end point is given by x/y
+POINT_PATH_ELEMENTS = ("PathLine", "PathMove", "PathQuad", "PathCubic", "PathCurve", "PathArc")
+
+# Keywords that must never be produced when renaming an id
+RESERVED_NAMES = (
+    "parent", "root", "model", "modelData", "index", "console", "Qt", "Math", "this",
+    "true", "false", "null", "undefined", "function", "var", "let", "const", "property",
+)
+
+
+def strip_code_fences(text):
+    """Remove the markdown code fences Claude sometimes wraps around QML"""
+    text = text.strip()
+    if text.startswith("```qml"):
+        text = text[6:]
+    elif text.startswith("```"):
+        text = text[3:]
+
+    if text.endswith("```"):
+        text = text[:-3]
+
+    return text.strip()
+
+
+def apply_edits(source, edits):
+    """Apply (start, end, replacement) edits to the source; edits must not overlap"""
+    for start, end, replacement in sorted(edits, reverse=True):
+        source = source[:start] + replacement + source[end:]
+    return source
+
+
+def line_span(source, start, end):
+    """Widen a span to whole lines when nothing else shares those lines"""
+    line_start = source.rfind("\n", 0, start) + 1
+    line_end = source.find("\n", end)
+    if line_end == -1:
+        line_end = len(source)
+    before = source[line_start:start]
+    after = source[end:line_end]
+    if before.strip() or (after.strip() and not after.strip().startswith("//")):
+        return start, end
+    return line_start, min(line_end + 1, len(source))
+
+
+def import_statements(tokens):
+    """
+    Yield (import_index, module_start, module_end, version_index) for each import statement
+    version_index is None when the import has no version
+    """
+    root = root_object(tokens)
+    limit = root[1] if root else len(tokens)
+    i = next_significant(tokens, -1)
+    while i < limit:
+        if tokens[i].text == "import":
+            module_start = next_significant(tokens, i)
+            if module_start >= limit:
+                break
+            module_end = module_start
+            if tokens[module_start].kind == "ident":
+                module_end = dotted_name_end(tokens, module_start)
+            version = next_significant(tokens, module_end)
+            version_index = version if version < limit and tokens[version].kind == "number" else None
+            yield i, module_start, module_end, version_index
+        i = next_significant(tokens, statement_end(tokens, i))
+
+
+def imported_modules(source, tokens=None):
+    tokens = tokens or tokenize(source)
+    return {source[tokens[start].start:tokens[end].end] for _, start, end, _ in import_statements(tokens)}
+
+
+def fix_import_versions(source):
+    """Rule: don't use version numbers in imports ("import QtQuick", not "import QtQuick 2.15")"""
+    tokens = tokenize(source)
+    edits = []
+    issues = []
+    for _, module_start, module_end, version_index in import_statements(tokens):
+        if version_index is None:
+            continue
+        # Also remove a minor version tokenized separately, e.g. "2 .15"
+        version_end = version_index
+        following = next_significant(tokens, version_index)
+        if following < len(tokens) and tokens[following].text == "." :
+            minor = next_significant(tokens, following)
+            if minor < len(tokens) and tokens[minor].kind == "number":
+                version_end = minor
+        edits.append((tokens[module_end].end, tokens[version_end].end, ""))
+        module = source[tokens[module_start].start:tokens[module_end].end]
+        issues.append(StyleIssue("import-version", f"Removed version from import {module}",
+                                 tokens[module_start].line, True))
+    return apply_edits(source, edits), issues
+
+
+def fix_graphical_effects(source):
+    """Rule: never use QtGraphicalEffects; Qt 6 provides the same types in Qt5Compat.GraphicalEffects"""
+    tokens = tokenize(source)
+    edits = []
+    issues = []
+    for _, module_start, module_end, _ in import_statements(tokens):
+        module = source[tokens[module_start].start:tokens[module_end].end]
+        if module == "QtGraphicalEffects":
+            edits.append((tokens[module_start].start, tokens[module_end].end, "Qt5Compat.GraphicalEffects"))
+            issues.append(StyleIssue("graphical-effects", "Replaced QtGraphicalEffects with Qt5Compat.GraphicalEffects",
+                                     tokens[module_start].line, True))
+    return apply_edits(source, edits), issues
+
+
+def fix_window_root(source):
+    """Rule: the code is loaded by a Loader, so the root element can't be a Window"""
+    tokens = tokenize(source)
+    root = root_object(tokens)
+    if root is None or root[0].split(".")[-1] not in WINDOW_TYPES:
+        return source, []
+
+    type_name, type_index, open_index, close_index = root
+    members = object_members(tokens, open_index, close_index)
+    property_names = [member[1] for member in members if member[0] == "property"]
+
+    # Rectangle keeps the window's background color, otherwise a plain Item will do
+    new_type = "Rectangle" if "color" in property_names else "Item"
+    edits = [(tokens[type_index].start, tokens[dotted_name_end(tokens, type_index)].end, new_type)]
+    issues = [StyleIssue("window-root", f"Replaced root {type_name} with {new_type}", tokens[type_index].line, True)]
+
+    for member in members:
+        if member[0] != "property":
+            continue
+        name = member[1]
+        if name in WINDOW_ONLY_PROPERTIES:
+            # A property sharing its line with others goes together with its ';'
+            end = tokens[member[4]].end
+            separator = STATEMENT_SEPARATOR_RE.match(source, end)
+            if separator:
+                end = separator.end()
+            edits.append(line_span(source, tokens[member[2]].start, end) + ("",))
+        elif name in APPLICATION_WINDOW_PROPERTIES:
+            issues.append(StyleIssue("window-root", f"ApplicationWindow.{name} has no Item equivalent",
+                                     tokens[member[2]].line, False))
+    return apply_edits(source, edits), issues
+
+
+def fix_id_case(source):
+    """Rule: ids start with a lowercase letter ("id: button", not "id: Button")"""
+    tokens = tokenize(source)
+
+    # Collect ids and the names used as properties, which a renamed id must not shadow
+    ids = {}
+    taken = set(RESERVED_NAMES)
+    for i, token in enumerate(tokens):
+        if token.kind != "ident":
+            continue
+        colon = next_significant(tokens, i)
+        if colon >= len(tokens) or tokens[colon].text != ":":
+            continue
+        previous = previous_significant(tokens, i)
+        if previous >= 0 and tokens[previous].text == ".":
+            continue
+        taken.add(token.text)
+        value = next_significant(tokens, colon)
+        if token.text == "id" and value < len(tokens) and tokens[value].kind == "ident":
+            ids[tokens[value].text] = value
+            taken.add(tokens[value].text)
+
+    renames = {}
+    for old_id in ids:
+        if not old_id[0].isupper():
+            continue
+        base = old_id[0].lower() + old_id[1:]
+        new_id = base
+        suffix = 1
+        while new_id in taken:
+            new_id = f"{base}Item" if suffix == 1 else f"{base}Item{suffix}"
+            suffix += 1
+        taken.add(new_id)
+        renames[old_id] = new_id
+
+    if not renames:
+        return source, []
+
+    edits = []
+    for i, token in enumerate(tokens):
+        if token.kind != "ident" or token.text not in renames:
+            continue
+        previous = previous_significant(tokens, i)
+        following = next_significant(tokens, i)
+        if previous >= 0 and tokens[previous].text in (".", "property", "import", "as"):
+            continue
+        if following < len(tokens) and tokens[following].text == "{":
+            continue  # A type instantiation, not a reference to the id
+        edits.append((token.start, token.end, renames[token.text]))
+
+    issues = [StyleIssue("id-case", f"Renamed id {old} to {new}", tokens[ids[old]].line, True)
+              for old, new in renames.items()]
+    return apply_edits(source, edits), issues
+
+
+def numeric_value(source, tokens, start, end):
+    """Return the number a property value evaluates to if it is a plain numeric literal"""
+    text = source[tokens[start].start:tokens[end].end].strip()
+    if re.fullmatch(r"[-+]?\s*(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?", text):
+        return float(text.replace(" ", ""))
+    return None
+
+
+def arc_to_angle_arc(x1, y1, x2, y2, rx, ry, large_arc, clockwise):
+    """
+    Convert an endpoint arc (PathArc) to a center arc (PathAngleArc)
+    Returns (center_x, center_y, radius_x, radius_y, start_angle, sweep_angle) with angles in
+    degrees, measured clockwise from 3 o'clock as PathAngleArc expects
+    """
+    rx, ry = abs(rx), abs(ry)
+    half_dx = (x1 - x2) / 2
+    half_dy = (y1 - y2) / 2
+
+    # Scale radii up if they are too small to span the end points
+    scale = (half_dx ** 2) / (rx ** 2) + (half_dy ** 2) / (ry ** 2)
+    if scale > 1:
+        rx *= math.sqrt(scale)
+        ry *= math.sqrt(scale)
+
+    numerator = rx ** 2 * ry ** 2 - rx ** 2 * half_dy ** 2 - ry ** 2 * half_dx ** 2
+    denominator = rx ** 2 * half_dy ** 2 + ry ** 2 * half_dx ** 2
+    factor = math.sqrt(max(0.0, numerator / denominator)) if denominator else 0.0
+    if large_arc == clockwise:
+        factor = -factor
+    center_dx = factor * rx * half_dy / ry
+    center_dy = -factor * ry * half_dx / rx
+
+    center_x = center_dx + (x1 + x2) / 2
+    center_y = center_dy + (y1 + y2) / 2
+
+    start_angle = math.degrees(math.atan2((half_dy - center_dy) / ry, (half_dx - center_dx) / rx))
+    end_angle = math.degrees(math.atan2((-half_dy - center_dy) / ry, (-half_dx - center_dx) / rx))
+    sweep = (end_angle - start_angle) % 360
+    if not clockwise and sweep > 0:
+        sweep -= 360
+    return center_x, center_y, rx, ry, start_angle, sweep
+
+
+def format_real(value):
+    """Format a number as a QML real literal"""
+    value = round(value, 3)
+    return f"{value:.1f}" if value == int(value) else f"{value:g}"
+
+
+def fix_path_arcs(source):
+    """Rule: use PathAngleArc instead of PathArc; arcs with literal coordinates are converted"""
+    tokens = tokenize(source)
+    root = root_object(tokens)
+    if root is None:
+        return source, []
+
+    edits = []
+    issues = []
+    for type_name, _, open_index, close_index, _ in walk_objects(tokens, *root):
+        members = object_members(tokens, open_index, close_index)
+        if not any(member[0] == "object" and member[1] == "PathArc" for member in members):
+            continue
+
+        # Track the current point through the path elements
+        properties = {m[1]: (m[3], m[4]) for m in members if m[0] == "property"}
+        current = (
+            numeric_value(source, tokens, *properties["startX"]) if "startX" in properties else 0.0,
+            numeric_value(source, tokens, *properties["startY"]) if "startY" in properties else 0.0,
+        )
+        for member in members:
+            if member[0] != "object":
+                continue
+            element_type, element_index, element_open, element_close = member[1:]
+            values = {}
+            for child in object_members(tokens, element_open, element_close):
+                if child[0] == "property":
+                    values[child[1]] = source[tokens[child[3]].start:tokens[child[4]].end].strip()
+                    values[child[1] + "#"] = numeric_value(source, tokens, child[3], child[4])
+
+            end_point = None
+            if element_type in POINT_PATH_ELEMENTS and None not in current:
+                if "relativeX#" in values or "relativeY#" in values:
+                    end_point = (current[0] + (values.get("relativeX#") or 0.0),
+                                 current[1] + (values.get("relativeY#") or 0.0))
+                elif values.get("x#") is not None and values.get("y#") is not None:
+                    end_point = (values["x#"], values["y#"])
+                if ("relativeX" in values and values.get("relativeX#") is None) or \
+                        ("relativeY" in values and values.get("relativeY#") is None):
+                    end_point = None
+
+            if element_type == "PathArc":
+                radius_x = values.get("radiusX#")
+                radius_y = values.get("radiusY#")
+                rotation = values.get("xAxisRotation#") or 0.0
+                if end_point is None or not radius_x or not radius_y or rotation:
+                    issues.append(StyleIssue("path-arc", "PathArc with computed values can't be converted to "
+                                             "PathAngleArc automatically", tokens[element_index].line, False))
+                else:
+                    center_x, center_y, rx, ry, start, sweep = arc_to_angle_arc(
+                        current[0], current[1], end_point[0], end_point[1], radius_x, radius_y,
+                        values.get("useLargeArc") == "true",
+                        values.get("direction") != "PathArc.Counterclockwise")
+                    line_start = source.rfind("\n", 0, tokens[element_index].start) + 1
+                    indent = source[line_start:tokens[element_index].start]
+                    inner = indent + "    "
+                    replacement = (f"PathAngleArc {{\n"
+                                   f"{inner}centerX: {format_real(center_x)}\n"
+                                   f"{inner}centerY: {format_real(center_y)}\n"
+                                   f"{inner}radiusX: {format_real(rx)}\n"
+                                   f"{inner}radiusY: {format_real(ry)}\n"
+                                   f"{inner}startAngle: {format_real(start)}\n"
+                                   f"{inner}sweepAngle: {format_real(sweep)}\n"
+                                   f"{inner}moveToStart: false\n"
+                                   f"{indent}}}")
+                    edits.append((tokens[element_index].start, tokens[element_close].end, replacement))
+                    issues.append(StyleIssue("path-arc", "Converted PathArc to PathAngleArc",
+                                             tokens[element_index].line, True))
+
+            if element_type == "PathAngleArc":
+                # The current point moves to the end of the arc
+                try:
+                    angle = math.radians(values["startAngle#"] + values["sweepAngle#"])
+                    end_point = (values["centerX#"] + values["radiusX#"] * math.cos(angle),
+                                 values["centerY#"] + values["radiusY#"] * math.sin(angle))
+                except (KeyError, TypeError):
+                    end_point = None
+            elif element_type not in POINT_PATH_ELEMENTS:
+                end_point = None if element_type.startswith("Path") and element_type != "PathAttribute" \
+                    and element_type != "PathPercent" else current
+
+            current = end_point if end_point is not None else (None, None)
+    return apply_edits(source, edits), issues
+
+
+def fix_missing_imports(source):
+    """Rule: include the imports for the types that are used"""
+    tokens = tokenize(source)
+    root = root_object(tokens)
+    if root is None:
+        return source, []
+
+    # Collect the unqualified types and attached objects in use
+    used = set()
+    for type_name, *_ in walk_objects(tokens, *root):
+        used.add(type_name)
+    for i, token in enumerate(tokens):
+        if token.kind == "ident" and token.text == "Layout":
+            following = next_significant(tokens, i)
+            if following < len(tokens) and tokens[following].text == ".":
+                used.add("Layout")
+
+    modules = imported_modules(source, tokens)
+    missing = []
+    if "QtQuick" not in modules:
+        missing.append("QtQuick")
+    for module, types in MODULE_TYPES.items():
+        if module not in modules and used.intersection(types):
+            missing.append(module)
+    if not missing:
+        return source, []
+
+    # Insert after the last import, or at the very top
+    imports = list(import_statements(tokens))
+    if imports:
+        position = tokens[statement_end(tokens, imports[-1][0])].end
+        text = "".join(f"\nimport {module}" for module in missing)
+    else:
+        position = 0
+        text = "".join(f"import {module}\n" for module in missing) + "\n"
+
+    issues = [StyleIssue("missing-import", f"Added import {module}", 1, True) for module in missing]
+    return source[:position] + text + source[position:], issues
+
+
+RULES = (
+    fix_import_versions,
+    fix_graphical_effects,
+    fix_window_root,
+    fix_id_case,
+    fix_path_arcs,
+    fix_missing_imports,
+)
+
+
+def enforce_style(text):
+    """
+    Clean up a QML response and apply every mechanical style rule
+    Returns (qml, issues) where issues lists what was fixed and what still needs attention
+    """
+    source = strip_code_fences(text)
+    issues = []
+    for rule in RULES:
+        try:
+            source, found = rule(source)
+        except Exception as e:
+            # A rule tripping over unusual code must never lose the response
+            found = [StyleIssue(rule.__name__, f"Style check failed: {e}", 0, False)]
+        issues.extend(found)
+    return source, issues
+
+
+def format_issues(issues):
+    """Summarize style issues for logging"""
+    return "\n".join(f"{'Fixed' if issue.fixed else 'Unfixed'} (line {issue.line}): {issue.message}"
+                     for issue in issues)
@@ -0,0 +1,225 @@
+"""
+QML tokenizer
+
+Splits QML source into tokens that keep their exact source spans, so rewriters can
+edit the text in place without disturbing formatting or comments.
+"""
+import re
+from collections import namedtuple
+
+
+Token = namedtuple("Token", "kind text start end line")
+
+TOKEN_RE = re.compile(r"""
+    (?P<ws>[ \t\r\n]+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_$][\w$]*)
+  | (?P<punct>.)
+""", re.S | re.X)
+
+
+def tokenize(source):
+    """Return every token in the source, including whitespace and comments"""
+    tokens = []
+    line = 1
+    for match in TOKEN_RE.finditer(source):
+        text = match.group()
+        tokens.append(Token(match.lastgroup, text, match.start(), match.end(), line))
+        line += text.count("\n")
+    return tokens
+
+
+def significant(tokens):
+    """Drop whitespace and comments"""
+    return [token for token in tokens if token.kind not in ("ws", "comment")]
+
+
+def matching_brace(tokens, index):
+    """Return the index of the bracket closing the one at tokens[index]"""
+    pairs = {"{": "}", "(": ")", "[": "]"}
+    opening = tokens[index].text
+    closing = pairs[opening]
+    depth = 0
+    for i in range(index, len(tokens)):
+        if tokens[i].kind != "punct":
+            continue
+        if tokens[i].text == opening:
+            depth += 1
+        elif tokens[i].text == closing:
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
+
+
+def statement_end(tokens, index):
+    """
+    Return the index of the last token of the statement starting at tokens[index]
+    A statement ends at a newline or ';' outside brackets, or before the enclosing '}'
+    """
+    depth = 0
+    last = index
+    for i in range(index, len(tokens)):
+        token = tokens[i]
+        if token.kind == "punct":
+            if token.text in "([{":
+                depth += 1
+            elif token.text in ")]}":
+                if depth == 0:
+                    return last
+                depth -= 1
+            elif token.text == ";" and depth == 0:
+                return i
+        elif token.kind == "ws" and depth == 0 and "\n" in token.text and i > index:
+            # A binary operator or open expression continues on the next line
+            if tokens[last].kind == "punct" and tokens[last].text in "+-*/%&|?:,=<>!":
+                continue
+            return last
+        if token.kind not in ("ws", "comment"):
+            last = i
+    return last
+
+
+def next_significant(tokens, index):
+    """Return the index of the first significant token after tokens[index], or len(tokens)"""
+    index += 1
+    while index < len(tokens) and tokens[index].kind in ("ws", "comment"):
+        index += 1
+    return index
+
+
+def previous_significant(tokens, index):
+    """Return the index of the last significant token before tokens[index], or -1"""
+    index -= 1
+    while index >= 0 and tokens[index].kind in ("ws", "comment"):
+        index -= 1
+    return index
+
+
+def dotted_name_end(tokens, index):
+    """Return the index of the last identifier of a dotted name such as anchors.fill starting at index"""
+    end = index
+    while True:
+        dot = next_significant(tokens, end)
+        if dot < len(tokens) and tokens[dot].text == ".":
+            name = next_significant(tokens, dot)
+            if name < len(tokens) and tokens[name].kind == "ident":
+                end = name
+                continue
+        return end
+
+
+def is_type_name(name):
+    """QML object types start with an uppercase letter (the last part of a qualified name)"""
+    return name.split(".")[-1][:1].isupper()
+
+
+def object_members(tokens, open_index, close_index):
+    """
+    List the direct members of the object whose braces are at open_index and close_index
+
+    Returns tuples of:
+        ("property", name, name_index, value_start, value_end) for assignments like "width: 10"
+        ("object", type_name, type_index, open_index, close_index) for child objects
+        ("declaration", keyword, start, end) for property/signal/function/... declarations
+    """
+    members = []
+    i = next_significant(tokens, open_index)
+    while i < close_index:
+        token = tokens[i]
+        if token.kind != "ident":
+            i = next_significant(tokens, statement_end(tokens, i))
+            continue
+
+        name_end = dotted_name_end(tokens, i)
+        name = "".join(t.text for t in tokens[i:name_end + 1] if t.kind not in ("ws", "comment"))
+        following = next_significant(tokens, name_end)
+        following_text = tokens[following].text if following < len(tokens) else ""
+
+        if following_text == ":":
+            value_start = next_significant(tokens, following)
+            statement = statement_end(tokens, value_start)
+            value_end = statement
+            if tokens[value_end].text == ";" and value_end > value_start:
+                value_end = previous_significant(tokens, value_end)
+            members.append(("property", name, i, value_start, value_end))
+            i = next_significant(tokens, statement)
+        elif following_text == "{" and is_type_name(name):
+            close = matching_brace(tokens, following)
+            members.append(("object", name, i, following, close))
+            i = next_significant(tokens, close)
+        elif following_text == "on":
+            # Property value sources such as "NumberAnimation on x { ... }"
+            brace = next_significant(tokens, next_significant(tokens, following))
+            if brace < len(tokens) and tokens[brace].text == "{":
+                close = matching_brace(tokens, brace)
+                members.append(("object", name, i, brace, close))
+                i = next_significant(tokens, close)
+            else:
+                i = next_significant(tokens, statement_end(tokens, i))
+        else:
+            end = statement_end(tokens, i)
+            members.append(("declaration", name, i, end))
+            i = next_significant(tokens, end)
+    return members
+
+
+def root_object(tokens):
+    """
+    Find the root object of a QML document
+    Returns (type_name, type_index, open_index, close_index) or None
+    """
+    i = next_significant(tokens, -1)
+    while i < len(tokens):
+        token = tokens[i]
+        if token.kind == "ident" and token.text in ("import", "pragma"):
+            i = next_significant(tokens, statement_end(tokens, i))
+            continue
+        if token.kind == "ident":
+            name_end = dotted_name_end(tokens, i)
+            brace = next_significant(tokens, name_end)
+            if brace < len(tokens) and tokens[brace].text == "{":
+                name = "".join(t.text for t in tokens[i:name_end + 1] if t.kind not in ("ws", "comment"))
+                return name, i, brace, matching_brace(tokens, brace)
+        i = next_significant(tokens, i)
+    return None
+
+
+def is_complete_document(source):
+    """Whether the source has a root object and no unbalanced brackets or unterminated strings"""
+    tokens = tokenize(source)
+    if root_object(tokens) is None:
+        return False
+    depth = 0
+    for token in tokens:
+        if token.kind != "punct":
+            continue
+        if token.text in "\"'`":
+            return False
+        if token.text in "{([":
+            depth += 1
+        elif token.text in "})]":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def walk_objects(tokens, type_name, type_index, open_index, close_index, parent=None):
+    """Yield (type_name, type_index, open_index, close_index, parent) for an object and all objects inside it"""
+    yield type_name, type_index, open_index, close_index, parent
+    current = (type_name, type_index, open_index, close_index)
+    for member in object_members(tokens, open_index, close_index):
+        if member[0] == "object":
+            yield from walk_objects(tokens, member[1], member[2], member[3], member[4], current)
+        elif member[0] == "property":
+            # Objects assigned to properties, e.g. "delegate: Rectangle { ... }"
+            value_start = member[3]
+            name_end = dotted_name_end(tokens, value_start)
+            brace = next_significant(tokens, name_end)
+            if (tokens[value_start].kind == "ident" and brace < len(tokens) and tokens[brace].text == "{"
+                    and is_type_name(tokens[value_start].text)):
+                name = "".join(t.text for t in tokens[value_start:name_end + 1] if t.kind not in ("ws", "comment"))
+                yield from walk_objects(tokens, name, value_start, brace, matching_brace(tokens, brace), current)
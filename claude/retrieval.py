@@ -0,0 +1,235 @@
+"""
+Retrieval over past generations
+
+Indexes the prompts and QML of every kept snapshot version of every saved project
+with TF-IDF, so that a prompt can be answered from earlier output:
+
+- The same prompt, up to case, punctuation and filler words, applied to the same
+  starting files reuses the earlier result directly, without an API call.
+- Otherwise the closest earlier components are added to the prompt as short
+  examples, so gauges, tell-tale rows and other recurring widgets start from a
+  version that was already accepted.
+
+Similarity search is a single matrix-vector product, and is only used for examples:
+prompts that differ in a number or a negation are similar but ask for different results. numpy is imported when the
+index is first searched, and retrieval is skipped if it is not installed.
+"""
+import os
+import re
+import math
+import threading
+from collections import Counter, namedtuple
+from .snapshots import SnapshotStore, SNAPSHOT_DIR, content_hash
+from .session_store import get_session_store
+
+
+# Similarity above which an earlier component is offered as an example
+EXAMPLE_MIN_SCORE = 0.3
+MAX_EXAMPLES = 2
+MAX_EXAMPLE_CHARS = 3000
+MAX_INDEXED_PROJECTS = 200
+
+# Prompt words count this many times as much as identifiers found in the QML
+PROMPT_WEIGHT = 3
+
+WORD_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+STOP_WORDS = frozenset("""
+    a an and are as at be by can for from in into is it its make of on or so that the this to
+    use with should would please qml import property id parent anchors true false
+""".split())
+
+# Reuse keys keep numbers, single letters, quoted text and colors; only these words are dropped
+REUSE_TOKEN_RE = re.compile(r"\"[^\"]*\"|'[^']*'|#[0-9A-Fa-f]+|\d+(?:\.\d+)?|[^\W\d_]+|[-+%]")
+FILLER_WORDS = frozenset("a an the please".split())
+
+Generation = namedtuple("Generation", "prompt key base files response store number")
+Example = namedtuple("Example", "prompt name source")
+
+
+def words(text):
+    """Lowercase words of a text, splitting camelCase identifiers and dropping stop words"""
+    return [word.lower() for word in WORD_RE.findall(text)
+            if len(word) > 1 and word.lower() not in STOP_WORDS]
+
+
+def reuse_key(prompt):
+    """Normalize a prompt for exact matching: words lowercased, quoted text kept as is"""
+    tokens = [token if token[0] in "\"'" else token.lower() for token in REUSE_TOKEN_RE.findall(prompt)]
+    return tuple(token for token in tokens if token not in FILLER_WORDS)
+
+
+def manifest(files):
+    """Return {name: content hash} for a set of project files, as stored in snapshot versions"""
+    return {name: content_hash(text) for name, text in files.items()}
+
+
+class TfidfMatrix:
+    """L2-normalized TF-IDF vectors of a set of documents, searched with one matrix-vector product"""
+    def __init__(self, documents):
+        import numpy as np
+        self.np = np
+        counts = [Counter(document) for document in documents]
+        self.vocabulary = {}
+        for document_counts in counts:
+            for word in document_counts:
+                self.vocabulary.setdefault(word, len(self.vocabulary))
+
+        document_frequency = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for document_counts in counts:
+            document_frequency[[self.vocabulary[word] for word in document_counts]] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        # Weight of a query word that no document contains
+        self.unseen_idf = math.log(1 + len(documents)) + 1
+
+        self.matrix = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for row, document_counts in enumerate(counts):
+            for word, count in document_counts.items():
+                self.matrix[row, self.vocabulary[word]] = 1 + math.log(count)
+        self.matrix *= self.idf
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= np.maximum(norms, 1e-9)
+
+    def scores(self, query_words):
+        """Return the cosine similarity of the query to every document"""
+        np = self.np
+        query = np.zeros(len(self.vocabulary), dtype=np.float32)
+        unseen = 0.0  # Squared weight of the query words no document contains
+        for word, count in Counter(query_words).items():
+            if word in self.vocabulary:
+                query[self.vocabulary[word]] = 1 + math.log(count)
+            else:
+                unseen += ((1 + math.log(count)) * self.unseen_idf) ** 2
+        query *= self.idf
+        # Words the documents lack still count towards the query's length, so a prompt that
+        # asks for more than an earlier one is less similar to it
+        norm = math.sqrt(float(query @ query) + unseen)
+        if not norm:
+            return np.zeros(len(self.matrix), dtype=np.float32)
+        return self.matrix @ (query / norm)
+
+
+class GenerationIndex:
+    """
+    Searchable index of kept generations across projects; safe to use from any thread
+    Unless load_saved is False, every project in the session store is indexed on first use
+    """
+    def __init__(self, load_saved=True):
+        self.lock = threading.RLock()
+        self.generations = []
+        self.examples = []
+        self.indexed_versions = set()  # (project_dir, number)
+        self.indexed_blobs = set()
+        self.loaded = not load_saved
+        self.example_matrix = None
+        self.unavailable = False
+
+    def load(self):
+        """Index every saved project the first time the index is used"""
+        # Held throughout, so nobody searches a partly loaded index
+        with self.lock:
+            if self.loaded:
+                return
+            try:
+                for _, content_qml_file, _ in get_session_store().projects()[:MAX_INDEXED_PROJECTS]:
+                    self.add_project(os.path.dirname(content_qml_file))
+            finally:
+                self.loaded = True
+
+    def add_project(self, project_dir):
+        """Index the kept versions of a project that are not indexed yet"""
+        if not os.path.isdir(os.path.join(project_dir, SNAPSHOT_DIR)):
+            return
+        store = SnapshotStore(project_dir)
+        with self.lock:
+            for number, version, parent in store.accepted_versions():
+                key = (os.path.abspath(project_dir), number)
+                if parent is None or key in self.indexed_versions:
+                    continue  # The initial version has no prompt
+                self.indexed_versions.add(key)
+                self.generations.append(Generation(version["prompt"], reuse_key(version["prompt"]), parent["files"],
+                                                   version["files"], version.get("response"), store, number))
+                for name, blob_hash in version["files"].items():
+                    if blob_hash in self.indexed_blobs or version["files"][name] == parent["files"].get(name):
+                        continue  # Only files this prompt produced are examples of it
+                    self.indexed_blobs.add(blob_hash)
+                    try:
+                        source = store.get_blob(blob_hash)
+                    except Exception:
+                        continue
+                    if len(source) <= MAX_EXAMPLE_CHARS:
+                        self.examples.append(Example(version["prompt"], name, source))
+            self.example_matrix = None
+
+    def matrices(self):
+        """Build the TF-IDF matrix if the index changed; returns False if numpy is missing"""
+        if self.unavailable:
+            return False
+        if self.example_matrix is None:
+            try:
+                self.example_matrix = TfidfMatrix([words(example.prompt) * PROMPT_WEIGHT + words(example.source)
+                                                   for example in self.examples])
+            except ImportError:
+                print("Install numpy to reuse past generations")
+                self.unavailable = True
+                return False
+        return True
+
+    def reuse(self, prompt, files):
+        """
+        Return (files, response) from the latest earlier generation of the same prompt made from
+        the same files, or None
+        """
+        self.load()
+        current = manifest(files)
+        key = reuse_key(prompt)
+        with self.lock:
+            for generation in reversed(self.generations):
+                if generation.key != key or generation.base != current or generation.files == current:
+                    continue
+                try:
+                    result = {name: generation.store.get_blob(blob_hash)
+                              for name, blob_hash in generation.files.items()}
+                    response = generation.store.get_blob(generation.response) if generation.response else None
+                except Exception:
+                    continue
+                print(f"Reusing the result of an earlier prompt: {generation.prompt}")
+                return result, response
+        return None
+
+    def similar_examples(self, prompt, files, limit=MAX_EXAMPLES):
+        """Return up to limit earlier components similar to the prompt that are not already in files"""
+        self.load()
+        present = {content_hash(text) for text in files.values()}
+        with self.lock:
+            if not self.examples or not self.matrices():
+                return []
+            scores = self.example_matrix.scores(words(prompt) * PROMPT_WEIGHT)
+            found = []
+            for row in scores.argsort()[::-1]:
+                if scores[row] < EXAMPLE_MIN_SCORE or len(found) == limit:
+                    break
+                example = self.examples[row]
+                if content_hash(example.source) not in present:
+                    present.add(content_hash(example.source))
+                    found.append(example)
+            return found
+
+
+def format_examples(examples):
+    """Format examples for the prompt"""
+    parts = [f"// Example: {example.name}, made for \"{example.prompt}\"\n{example.source.strip()}"
+             for example in examples]
+    return "\n\n".join(parts)
+
+
+_generation_index = None
+_generation_index_lock = threading.Lock()
+
+
+def get_generation_index():
+    """Return the process-wide index of past generations"""
+    global _generation_index
+    with _generation_index_lock:
+        if _generation_index is None:
+            _generation_index = GenerationIndex()
+        return _generation_index
@@ -0,0 +1,177 @@
+"""
+Central scheduler for API requests
+
+Every request to the API passes through one RequestScheduler, which decides the
+order in which waiting requests are sent:
+
+- Priority classes: an interactive prompt is always sent before queued image
+  analysis, project scaffolding or background work.
+- Fairness: within a class, sessions take turns, so one session with many queued
+  requests cannot hold up the others. This only covers requests that reach the
+  scheduler; the server's job layer hands each session one job at a time so that
+  a session's backlog never occupies the threads that make those requests.
+- Admission control: requests below the interactive class leave part of the rate
+  budget and of the concurrent connections free for interactive ones, and are
+  refused outright when the queue ahead of them would take too long to drain.
+
+Requests already sent are never interrupted; preemption happens in the queue.
+The class and session of a request come from request_context(), so callers deep
+inside a job (such as ask_claude during project scaffolding) need no extra arguments.
+A request made outside any request_context() is treated as interactive, so a path
+that forgets to tag its requests is never deprioritized or refused.
+"""
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+# Priority classes, most urgent first
+INTERACTIVE = 0      # Edit prompts and the API key check, with a designer waiting
+IMAGE_ANALYSIS = 1   # Turning a reference image into QML
+SCAFFOLDING = 2      # Generating the files of a new project
+BACKGROUND = 3       # Batch and other unattended work
+PRIORITY_NAMES = ("interactive", "image_analysis", "scaffolding", "background")
+
+MAX_CONCURRENT_REQUESTS = 4
+INTERACTIVE_RESERVED_REQUESTS = 1  # Connections only interactive requests may use
+# Requests of the other classes that can be in flight at once
+MAX_NON_INTERACTIVE_REQUESTS = max(1, MAX_CONCURRENT_REQUESTS - INTERACTIVE_RESERVED_REQUESTS)
+INTERACTIVE_RESERVED_TOKENS = 1    # Rate-limit tokens kept back for interactive requests
+
+# Requests below the interactive class are refused when they would wait longer than this
+MAX_ADMISSION_WAIT = 120.0
+MAX_QUEUED_PER_SESSION = 50
+
+DEFAULT_SESSION = "local"
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request is refused by admission control"""
+
+
+_context = threading.local()
+
+
+@contextmanager
+def request_context(priority, session=None):
+    """Run API requests made by this thread in the given priority class and session"""
+    previous = getattr(_context, "value", None)
+    _context.value = (priority, session or DEFAULT_SESSION)
+    try:
+        yield
+    finally:
+        _context.value = previous
+
+
+def current_context():
+    """Return (priority, session) for API requests made by this thread"""
+    return getattr(_context, "value", None) or (INTERACTIVE, DEFAULT_SESSION)
+
+
+class RequestScheduler:
+    """Orders API requests by priority class and session, within the rate and connection budgets"""
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, rate_limiter=None):
+        self.max_concurrent = max_concurrent
+        self.rate_limiter = rate_limiter
+        self.condition = threading.Condition()
+        self.active = 0
+        # One queue per class; each maps session -> waiting tickets, in the order sessions take turns
+        self.queues = [OrderedDict() for _ in PRIORITY_NAMES]
+        self.sent = [0] * len(PRIORITY_NAMES)
+
+    def set_rate_limiter(self, limiter):
+        with self.condition:
+            self.rate_limiter = limiter
+            self.condition.notify_all()
+
+    def head(self):
+        """Return (priority, session) of the request that goes next, or None"""
+        for priority, sessions in enumerate(self.queues):
+            for session in sessions:
+                return priority, session
+        return None
+
+    def queued(self, priority=None, session=None):
+        classes = self.queues if priority is None else self.queues[:priority + 1]
+        return sum(len(tickets) for sessions in classes for name, tickets in sessions.items()
+                   if session is None or name == session)
+
+    def admit(self, priority, session):
+        """Refuse a request that cannot be served within the budget"""
+        if priority == INTERACTIVE:
+            return
+        if self.queued(session=session) >= MAX_QUEUED_PER_SESSION:
+            raise SchedulerBusy(f"Too many requests queued for session {session}")
+        if self.rate_limiter is not None:
+            wait = self.queued(priority) / self.rate_limiter.rate
+            if wait > MAX_ADMISSION_WAIT:
+                raise SchedulerBusy(f"The API is busy; {PRIORITY_NAMES[priority]} requests would wait "
+                                    f"about {wait:.0f} s")
+
+    def has_connection(self, priority):
+        limit = self.max_concurrent
+        if priority != INTERACTIVE:
+            limit = max(1, limit - INTERACTIVE_RESERVED_REQUESTS)
+        return self.active < limit
+
+    def acquire(self, priority, session):
+        """Block until this request may be sent"""
+        ticket = object()
+        with self.condition:
+            self.admit(priority, session)
+            self.queues[priority].setdefault(session, deque()).append(ticket)
+            try:
+                while True:
+                    wait = None
+                    if self.head() == (priority, session) and self.queues[priority][session][0] is ticket \
+                            and self.has_connection(priority):
+                        wait = 0.0
+                        if self.rate_limiter is not None:
+                            reserve = 0 if priority == INTERACTIVE else INTERACTIVE_RESERVED_TOKENS
+                            wait = self.rate_limiter.try_acquire(reserve)
+                        if wait == 0.0:
+                            break
+                    self.condition.wait(wait)
+            finally:
+                tickets = self.queues[priority][session]
+                tickets.remove(ticket)
+                # The session goes to the back of its class so others get a turn
+                del self.queues[priority][session]
+                if tickets:
+                    self.queues[priority][session] = tickets
+                self.condition.notify_all()
+            self.active += 1
+            self.sent[priority] += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def request(self, priority=None, session=None):
+        """Hold a turn to send one request; class and session default to the thread's request_context()"""
+        context_priority, context_session = current_context()
+        priority = context_priority if priority is None else priority
+        self.acquire(priority, session or context_session)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "active": self.active,
+                "queued": {name: sum(len(tickets) for tickets in self.queues[priority].values())
+                           for priority, name in enumerate(PRIORITY_NAMES)},
+                "sent": dict(zip(PRIORITY_NAMES, self.sent)),
+            }
+
+
+_scheduler = RequestScheduler()
+
+
+def get_scheduler():
+    """Return the process-wide request scheduler"""
+    return _scheduler
@@ -0,0 +1,482 @@
+"""
+Multi-client generation server
+
+Runs the generation pipeline as a shared HTTP service instead of one desktop process
+per designer. Each client works in its own session with its own project directory and
+conversation; jobs run on a shared worker pool, API requests share one connection pool
+and a global rate limiter, and progress is streamed to clients as server-sent events.
+
+    python -m claude.server --port 8765 --sessions-dir ./server_sessions
+
+Endpoints (JSON bodies):
+    POST /sessions                        -> {"session_id"}
+    POST /sessions/<id>/projects          {"name"}                     -> {"job_id"}
+    POST /sessions/<id>/prompts           {"prompt"}                   -> {"job_id"}
+    POST /sessions/<id>/images            {"data": base64, "media_type"} -> {"job_id"}
+    GET  /sessions/<id>/events[?since=N]  text/event-stream of progress events
+    GET  /sessions/<id>/files/<path>      current project file, e.g. Content.qml
+    GET  /health
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import queue
+import shutil
+import argparse
+import itertools
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from .api import RateLimiter, set_rate_limiter
+from .scheduler import (INTERACTIVE, IMAGE_ANALYSIS, SCAFFOLDING, PRIORITY_NAMES, get_scheduler,
+                        request_context)
+from .worker import ClaudeApiWorker, DEBUG_OUTPUT_FILE
+from .retrieval import GenerationIndex
+from .project_generator import create_project_structure
+from .components import CONTENT_FILE, project_file_name
+
+
+MAX_SESSIONS = 200
+SESSION_IDLE_TIMEOUT = 2 * 60 * 60  # Seconds without requests after which a session is removed
+EVICTION_INTERVAL = 60
+MAX_EVENTS_PER_SESSION = 1000
+MAX_PENDING_JOBS_PER_SESSION = 20
+MAX_REQUEST_BYTES = 20 * 1024 * 1024  # Reference images are sent inline
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+IMAGE_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif"}
+
+
+class ApiError(Exception):
+    """An error answered with an HTTP status"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class HeadlessController:
+    """Stands in for QmlReloaderController, publishing state changes as session events"""
+    def __init__(self, session):
+        self.session = session
+
+    def updatePromptStatus(self, status):
+        self.session.publish("status", {"text": status})
+
+    def log(self, message):
+        self.session.publish("log", {"text": message})
+
+    def set_is_loading(self, loading):
+        self.session.publish("loading", {"value": loading})
+
+    def set_is_image_processing(self, processing):
+        self.session.publish("image_processing", {"value": processing})
+
+    def set_content_source(self, source):
+        pass
+
+
+class ServerSession:
+    """One client's project, conversation and event stream"""
+    def __init__(self, session_id, sessions_dir):
+        self.id = session_id
+        self.directory = os.path.join(sessions_dir, session_id)
+        os.makedirs(self.directory, exist_ok=True)
+        self.controller = HeadlessController(self)
+        self.worker = None  # Created with the project; its thread is never started
+        self.content_qml_file = None
+        self.image_path = None  # The latest reference image; older image jobs are superseded
+        self.last_active = time.time()
+
+        # Jobs of one session run one at a time and in order: only the head of this queue is
+        # handed to the shared pool, so a busy session never ties up more than one thread
+        self.queued_jobs = deque()
+        self.job_running = False
+        self.pending_jobs = 0
+
+        self.events = deque(maxlen=MAX_EVENTS_PER_SESSION)
+        self.next_event_id = 1
+        self.events_changed = threading.Condition()
+
+    def is_idle(self, now, timeout):
+        """A session is idle once it has no jobs and no request arrived for timeout seconds"""
+        return not self.job_running and not self.pending_jobs and now - self.last_active > timeout
+
+    def publish(self, event_type, payload, job_id=None):
+        with self.events_changed:
+            event = {"id": self.next_event_id, "type": event_type, "time": time.time(), **payload}
+            if job_id:
+                event["job_id"] = job_id
+            self.next_event_id += 1
+            self.events.append(event)
+            self.events_changed.notify_all()
+
+    def events_since(self, since, timeout):
+        """Return events with an id above since, waiting up to timeout seconds for one to arrive"""
+        with self.events_changed:
+            if not self.events or self.events[-1]["id"] <= since:
+                self.events_changed.wait(timeout)
+            return [event for event in self.events if event["id"] > since]
+
+    def project_path(self, name):
+        relative = project_file_name(name)
+        if relative is None or self.content_qml_file is None:
+            return None
+        return os.path.join(os.path.dirname(self.content_qml_file), relative)
+
+
+class GenerationService:
+    """Sessions and the shared worker pool behind the HTTP handler"""
+    def __init__(self, sessions_dir, workers=4, requests_per_minute=50, max_sessions=MAX_SESSIONS,
+                 idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.sessions_dir = os.path.abspath(sessions_dir)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.stopped = threading.Event()
+
+        # The next job of each session waits here in priority order, so a prompt is picked up
+        # before queued scaffolding; sessions with jobs of the same class take turns
+        self.jobs = queue.PriorityQueue()
+        self.job_order = itertools.count()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self.job_loop, name=f"generation-{i}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        # Idle sessions, their workers and their project directories are removed periodically
+        thread = threading.Thread(target=self.eviction_loop, name="session-eviction")
+        thread.daemon = True
+        thread.start()
+
+        if requests_per_minute:
+            set_rate_limiter(RateLimiter(requests_per_minute))
+
+    def create_session(self):
+        self.evict_idle_sessions()
+        with self.lock:
+            if len(self.sessions) >= self.max_sessions:
+                raise ApiError(503, "Too many sessions; try again later")
+            session = ServerSession(uuid.uuid4().hex, self.sessions_dir)
+            self.sessions[session.id] = session
+        return session
+
+    def evict_idle_sessions(self):
+        """Remove sessions that have been idle too long, with their project directories"""
+        now = time.time()
+        with self.lock:
+            idle = [session for session in self.sessions.values() if session.is_idle(now, self.idle_timeout)]
+            for session in idle:
+                del self.sessions[session.id]
+        for session in idle:
+            if session.worker is not None:
+                session.worker.cancel_image_analysis()
+            shutil.rmtree(session.directory, ignore_errors=True)
+            print(f"Removed idle session {session.id}")
+        return len(idle)
+
+    def eviction_loop(self):
+        while not self.stopped.wait(EVICTION_INTERVAL):
+            self.evict_idle_sessions()
+
+    def get_session(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise ApiError(404, f"Unknown session {session_id}")
+        session.last_active = time.time()
+        return session
+
+    def submit(self, session, kind, priority, function, *args):
+        """Queue a job for a session; its API requests are scheduled in the given priority class"""
+        with self.lock:
+            if session.pending_jobs >= MAX_PENDING_JOBS_PER_SESSION:
+                raise ApiError(429, "Too many pending jobs for this session")
+            session.pending_jobs += 1
+            job_id = uuid.uuid4().hex[:12]
+            session.publish("queued", {"kind": kind}, job_id)
+            session.queued_jobs.append((session, job_id, kind, priority, function, args))
+            if not session.job_running:
+                self.schedule_next(session)
+        return job_id
+
+    def schedule_next(self, session):
+        """Hand a session's next job to the pool; called with self.lock held"""
+        if not session.queued_jobs:
+            session.job_running = False
+            return
+        session.job_running = True
+        job = session.queued_jobs.popleft()
+        self.jobs.put((job[3], next(self.job_order), job))
+
+    def job_loop(self):
+        while True:
+            _, _, job = self.jobs.get()
+            if job is None:
+                break
+            session, job_id, kind, priority, function, args = job
+            self.run_job(session, job_id, kind, priority, function, *args)
+
+    def run_job(self, session, job_id, kind, priority, function, *args):
+        with request_context(priority, session.id):
+            session.publish("started", {"kind": kind}, job_id)
+            try:
+                result = function(session, job_id, *args)
+                session.publish("done", {"kind": kind, **(result or {})}, job_id)
+            except Exception as e:
+                session.publish("error", {"kind": kind, "message": str(e)}, job_id)
+            finally:
+                with self.lock:
+                    session.pending_jobs -= 1
+                    self.schedule_next(session)
+
+    def create_project(self, session, job_id, name):
+        project_dir = os.path.join(session.directory, name)
+        content_qml_file = create_project_structure(
+            name, gui_mode=False, overwrite=True, project_dir=project_dir,
+            log_callback=lambda message: session.publish("log", {"text": message}, job_id),
+            progress_callback=lambda path: session.publish(
+                "file", {"path": os.path.relpath(path, project_dir)}, job_id),
+        )
+        if not content_qml_file:
+            raise Exception("Project creation failed")
+
+        session.content_qml_file = content_qml_file
+        if session.worker is None:
+            session.worker = ClaudeApiWorker(content_qml_file, session.controller)
+            # Sessions share the working directory, so each keeps its debug output to itself
+            session.worker.debug_output_file = os.path.join(session.directory, DEBUG_OUTPUT_FILE)
+            # Generations are reused and offered as examples only within the session that made them
+            session.worker.generation_index = GenerationIndex(load_saved=False)
+        else:
+            session.worker.retarget(content_qml_file)
+        return {"project": name}
+
+    def require_project(self, session):
+        if session.worker is None:
+            raise ApiError(409, "Create a project first")
+
+    def run_prompt(self, session, job_id, prompt):
+        session.controller.set_is_loading(True)
+        try:
+            if not session.worker.process_prompt(prompt):
+                raise Exception("The response was discarded")
+        finally:
+            session.controller.set_is_loading(False)
+        return self.content_result(session)
+
+    def run_image(self, session, job_id, image_path):
+        if image_path != session.image_path:
+            raise Exception("Superseded by a newer reference image")
+        worker = session.worker
+        worker.reference_image_path = image_path
+        if not worker.convert_image_to_qml():
+            raise Exception("Image analysis failed")
+        return self.content_result(session)
+
+    def content_result(self, session):
+        with open(session.content_qml_file, "r") as f:
+            return {"file": CONTENT_FILE, "content": f.read()}
+
+    def save_image(self, session, payload):
+        media_type = payload.get("media_type", "image/png")
+        if media_type not in IMAGE_EXTENSIONS:
+            raise ApiError(400, f"Unsupported image type {media_type}")
+        try:
+            data = base64.b64decode(payload.get("data", ""), validate=True)
+        except ValueError:
+            raise ApiError(400, "Image data must be base64")
+        if not data:
+            raise ApiError(400, "Missing image data")
+        path = os.path.join(session.directory, f"reference_{uuid.uuid4().hex[:8]}{IMAGE_EXTENSIONS[media_type]}")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def shutdown(self):
+        self.stopped.set()
+        for _ in self.threads:
+            self.jobs.put((len(PRIORITY_NAMES), next(self.job_order), None))
+        set_rate_limiter(None)
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a GenerationService"""
+    service = None
+    token = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        try:
+            if self.token and self.headers.get("authorization") != f"Bearer {self.token}":
+                raise ApiError(401, "Missing or wrong bearer token")
+
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if method == "GET" and parts == ["health"]:
+                self.send_json(200, {"status": "ok", "sessions": len(self.service.sessions),
+                                     "scheduler": get_scheduler().stats()})
+                return
+            if method == "POST" and parts == ["sessions"]:
+                session = self.service.create_session()
+                self.send_json(201, {"session_id": session.id})
+                return
+            if len(parts) < 3 or parts[0] != "sessions" or not SESSION_ID_RE.match(parts[1]):
+                raise ApiError(404, "Not found")
+
+            session = self.service.get_session(parts[1])
+            action = parts[2]
+            if method == "GET" and action == "events":
+                since = parse_qs(url.query).get("since", [self.headers.get("last-event-id") or 0])[0]
+                try:
+                    since = int(since)
+                except ValueError:
+                    raise ApiError(400, "since and Last-Event-ID must be event ids")
+                self.stream_events(session, since)
+            elif method == "GET" and action == "files":
+                self.send_file(session, "/".join(parts[3:]))
+            elif method == "POST" and action == "projects":
+                name = self.read_json().get("name", "")
+                if not re.match(r"^[A-Za-z0-9_-]+$", name):
+                    raise ApiError(400, "Project name can only contain letters, digits, hyphens and underscores")
+                job_id = self.service.submit(session, "project", SCAFFOLDING, self.service.create_project, name)
+                self.send_json(202, {"job_id": job_id})
+            elif method == "POST" and action == "prompts":
+                prompt = self.read_json().get("prompt", "").strip()
+                if not prompt:
+                    raise ApiError(400, "Missing prompt")
+                self.service.require_project(session)
+                job_id = self.service.submit(session, "prompt", INTERACTIVE, self.service.run_prompt, prompt)
+                self.send_json(202, {"job_id": job_id})
+            elif method == "POST" and action == "images":
+                self.service.require_project(session)
+                image_path = self.service.save_image(session, self.read_json())
+                # A newer image supersedes the one being analyzed, so it must not overwrite Content.qml
+                session.image_path = image_path
+                session.worker.cancel_image_analysis()
+                job_id = self.service.submit(session, "image", IMAGE_ANALYSIS, self.service.run_image, image_path)
+                self.send_json(202, {"job_id": job_id})
+            else:
+                raise ApiError(404, "Not found")
+        except ApiError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def read_json(self):
+        length = int(self.headers.get("content-length", 0))
+        if length > MAX_REQUEST_BYTES:
+            raise ApiError(413, "Request too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "Body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Body must be a JSON object")
+        return body
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_file(self, session, name):
+        path = session.project_path(name)
+        if path is None or not os.path.exists(path):
+            raise ApiError(404, f"No file {name}")
+        with open(path, "rb") as f:
+            payload = f.read()
+        self.send_response(200)
+        self.send_header("content-type", "text/plain; charset=utf-8")
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream_events(self, session, since):
+        """Stream events as server-sent events until the client disconnects"""
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.send_header("connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        while True:
+            # A connected client keeps its session from being evicted
+            session.last_active = time.time()
+            events = session.events_since(since, timeout=15)
+            if events:
+                for event in events:
+                    self.wfile.write(f"id: {event['id']}\nevent: {event['type']}\n"
+                                     f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                since = events[-1]["id"]
+            else:
+                self.wfile.write(b": keep-alive\n\n")  # Also detects disconnected clients
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+
+def create_server(host="127.0.0.1", port=8765, sessions_dir="server_sessions", workers=4, requests_per_minute=50,
+                  token=None, max_sessions=MAX_SESSIONS, idle_timeout=SESSION_IDLE_TIMEOUT):
+    """Create the HTTP server and its service; call serve_forever() on the result"""
+    service = GenerationService(sessions_dir, workers, requests_per_minute, max_sessions, idle_timeout)
+    handler = type("Handler", (GenerationRequestHandler,), {"service": service, "token": token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Claude QML generation server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions-dir", default="server_sessions", help="Directory holding each session's project")
+    parser.add_argument("--workers", type=int, default=4, help="Jobs run concurrently across all sessions")
+    parser.add_argument("--requests-per-minute", type=int, default=50,
+                        help="Global limit on API requests (0 disables the limit)")
+    parser.add_argument("--token", default=os.environ.get("CLAUDEQML_SERVER_TOKEN"),
+                        help="Require this bearer token from clients")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS, help="Sessions kept at the same time")
+    parser.add_argument("--idle-timeout", type=int, default=SESSION_IDLE_TIMEOUT,
+                        help="Seconds without requests after which a session and its files are removed")
+    args = parser.parse_args(argv)
+
+    if not os.environ.get("ANTHROPIC_API_KEY"):
+        print("Error: ANTHROPIC_API_KEY environment variable not set")
+        return 1
+
+    server = create_server(args.host, args.port, args.sessions_dir, args.workers, args.requests_per_minute,
+                           args.token, args.max_sessions, args.idle_timeout)
+    print(f"Generation server listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
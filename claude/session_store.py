@@ -0,0 +1,283 @@
+"""
+Persistent session store
+
+Keeps projects, conversation turns, image analysis results and usage statistics in
+an SQLite database so a project can be reopened after a restart with its
+conversation context intact and without calling the API. Writes are queued and
+performed by a background thread; reads use their own connection.
+"""
+import os
+import json
+import time
+import queue
+import base64
+import sqlite3
+import hashlib
+import threading
+from .api import CACHE_DIR
+
+
+SESSION_DB_FILE = os.path.join(CACHE_DIR, "sessions.db")
+
+# Conversation turns restored into the worker, matching the history it keeps
+MAX_RESTORED_MESSAGES = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    project_dir TEXT NOT NULL UNIQUE,
+    content_qml_file TEXT NOT NULL,
+    reference_image_path TEXT,
+    image_hash TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    project_dir TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_project ON messages (project_dir, id);
+CREATE TABLE IF NOT EXISTS prompts (
+    id INTEGER PRIMARY KEY,
+    project_dir TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    model TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    seconds REAL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS prompts_project ON prompts (project_dir, id);
+CREATE TABLE IF NOT EXISTS images (
+    hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    media_type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS image_results (
+    image_hash TEXT PRIMARY KEY,
+    qml_content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+def file_hash(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SessionStore:
+    """
+    SQLite-backed store of project sessions
+
+    Image blocks are never written to the database: they are replaced by a reference
+    to the image file and its hash, and turned back into base64 blocks on load if the
+    file is still there and unchanged.
+    """
+    def __init__(self, db_file=SESSION_DB_FILE):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+
+        self.read_connection = self.connect()
+        self.read_connection.executescript(SCHEMA)
+        self.read_lock = threading.Lock()
+
+        # Hashes of image files already seen, keyed by (path, mtime, size)
+        self.image_hashes = {}
+
+        self.write_queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.db_file, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def write_loop(self):
+        connection = self.connect()
+        while True:
+            statements = self.write_queue.get()
+            if statements is None:
+                break
+            try:
+                with connection:
+                    for sql, params in statements:
+                        connection.execute(sql, params)
+            except sqlite3.Error as e:
+                print(f"Could not write session data: {e}")
+            finally:
+                self.write_queue.task_done()
+        connection.close()
+
+    def write(self, *statements):
+        """Queue statements to run in one transaction on the writer thread"""
+        self.write_queue.put(list(statements))
+
+    def flush(self):
+        """Wait until every queued write has been committed"""
+        self.write_queue.join()
+
+    def close(self):
+        self.write_queue.put(None)
+        self.writer.join(timeout=5)
+        self.read_connection.close()
+
+    def image_hash(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key not in self.image_hashes:
+            self.image_hashes[key] = file_hash(path)
+        return self.image_hashes[key]
+
+    def save_project(self, name, content_qml_file, reference_image_path=None):
+        """Create or update a project; safe to call from any thread"""
+        project_dir = os.path.dirname(os.path.abspath(content_qml_file))
+        image_hash = None
+        if reference_image_path and os.path.exists(reference_image_path):
+            image_hash = self.image_hash(reference_image_path)
+        now = time.time()
+        self.write((
+            """INSERT INTO projects (name, project_dir, content_qml_file, reference_image_path, image_hash,
+                                     created, updated)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (project_dir) DO UPDATE SET
+                   name = excluded.name, content_qml_file = excluded.content_qml_file,
+                   reference_image_path = excluded.reference_image_path, image_hash = excluded.image_hash,
+                   updated = excluded.updated""",
+            (name, project_dir, os.path.abspath(content_qml_file), reference_image_path, image_hash, now, now)
+        ))
+
+    def clear_messages(self, content_qml_file):
+        """Forget a project's conversation, e.g. when the project is created again"""
+        project_dir = os.path.dirname(os.path.abspath(content_qml_file))
+        self.write(("DELETE FROM messages WHERE project_dir = ?", (project_dir,)))
+
+    def dehydrate(self, content, image_path=None):
+        """Replace base64 image blocks with references to the image file they were read from"""
+        blocks = []
+        statements = []
+        for block in content:
+            if block.get("type") != "image":
+                blocks.append(block)
+            elif image_path and os.path.exists(image_path):
+                image_hash = self.image_hash(image_path)
+                statements.append(("INSERT OR REPLACE INTO images (hash, path, media_type) VALUES (?, ?, ?)",
+                                   (image_hash, os.path.abspath(image_path), block["source"]["media_type"])))
+                blocks.append({"type": "image_ref", "hash": image_hash})
+        return blocks, statements
+
+    def record_turn(self, content_qml_file, prompt, user_content, assistant_content, image_path=None, usage=None,
+                    model=None, seconds=None):
+        """Record one prompt and its response; the image file is referenced, not copied"""
+        project_dir = os.path.dirname(os.path.abspath(content_qml_file))
+        now = time.time()
+        user_blocks, statements = self.dehydrate(user_content, image_path)
+        usage = usage or {}
+        statements += [
+            ("INSERT INTO messages (project_dir, role, content, created) VALUES (?, 'user', ?, ?)",
+             (project_dir, json.dumps(user_blocks), now)),
+            ("INSERT INTO messages (project_dir, role, content, created) VALUES (?, 'assistant', ?, ?)",
+             (project_dir, json.dumps(assistant_content), now)),
+            ("""INSERT INTO prompts (project_dir, prompt, model, input_tokens, output_tokens, seconds, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+             (project_dir, prompt, model, usage.get("input_tokens"), usage.get("output_tokens"), seconds, now)),
+            ("UPDATE projects SET updated = ? WHERE project_dir = ?", (now, project_dir)),
+        ]
+        self.write(*statements)
+
+    def save_image_result(self, reference_image_path, qml_content):
+        """Keep the QML generated from an image so the same image never has to be analyzed twice"""
+        self.write(("INSERT OR REPLACE INTO image_results (image_hash, qml_content, created) VALUES (?, ?, ?)",
+                    (self.image_hash(reference_image_path), qml_content, time.time())))
+
+    def query(self, sql, params=()):
+        with self.read_lock:
+            return self.read_connection.execute(sql, params).fetchall()
+
+    def projects(self):
+        """Return (name, content_qml_file, updated) for every project whose files still exist"""
+        rows = self.query("SELECT name, content_qml_file, updated FROM projects ORDER BY updated DESC")
+        return [row for row in rows if os.path.exists(row[1])]
+
+    def image_result(self, reference_image_path):
+        """Return the QML previously generated from this image, or None"""
+        rows = self.query("SELECT qml_content FROM image_results WHERE image_hash = ?",
+                          (self.image_hash(reference_image_path),))
+        return rows[0][0] if rows else None
+
+    def hydrate(self, blocks):
+        """Turn image references back into base64 image blocks"""
+        content = []
+        for block in blocks:
+            if block.get("type") != "image_ref":
+                content.append(block)
+                continue
+            rows = self.query("SELECT path, media_type FROM images WHERE hash = ?", (block["hash"],))
+            if not rows or not os.path.exists(rows[0][0]) or self.image_hash(rows[0][0]) != block["hash"]:
+                continue  # The image is gone or has changed; the text still carries the context
+            with open(rows[0][0], "rb") as f:
+                data = base64.b64encode(f.read()).decode("utf-8")
+            content.append({"type": "image", "source": {"type": "base64", "media_type": rows[0][1], "data": data}})
+        return content
+
+    def load_session(self, content_qml_file):
+        """
+        Load what is needed to resume a project, without any API calls
+        Returns a dict with the project row, the recent conversation, the prompt log and usage totals
+        """
+        project_dir = os.path.dirname(os.path.abspath(content_qml_file))
+        rows = self.query("""SELECT name, content_qml_file, reference_image_path, image_hash
+                             FROM projects WHERE project_dir = ?""", (project_dir,))
+        if not rows:
+            return None
+        name, content_qml_file, reference_image_path, image_hash = rows[0]
+
+        messages = self.query("""SELECT role, content FROM messages WHERE project_dir = ?
+                                 ORDER BY id DESC LIMIT ?""", (project_dir, MAX_RESTORED_MESSAGES))
+        history = [{"role": role, "content": self.hydrate(json.loads(content))} for role, content in reversed(messages)]
+        while history and history[0]["role"] != "user":
+            history.pop(0)
+
+        image_qml = None
+        if image_hash:
+            result = self.query("SELECT qml_content FROM image_results WHERE image_hash = ?", (image_hash,))
+            image_qml = result[0][0] if result else None
+
+        prompts = [row[0] for row in self.query("SELECT prompt FROM prompts WHERE project_dir = ? ORDER BY id",
+                                                (project_dir,))]
+        usage = self.query("""SELECT COUNT(*), COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0)
+                              FROM prompts WHERE project_dir = ?""", (project_dir,))[0]
+        return {
+            "name": name,
+            "content_qml_file": content_qml_file,
+            "reference_image_path": reference_image_path
+                if reference_image_path and os.path.exists(reference_image_path) else None,
+            "image_qml": image_qml,
+            "history": history,
+            "prompts": prompts,
+            "usage": {"requests": usage[0], "input_tokens": usage[1], "output_tokens": usage[2]},
+        }
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide session store, opening it on first use"""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = SessionStore()
+        return _session_store
@@ -0,0 +1,239 @@
+"""
+Content-addressed snapshot store
+
+Every version of a project's QML files is recorded in <project>/.snapshots so that
+undo, redo and jumping to an earlier version are local file writes instead of
+another API call. File contents are stored once per SHA-256 hash, as zlib-compressed
+line deltas against the previous version of the same file where that is smaller.
+"""
+import os
+import json
+import time
+import zlib
+import difflib
+import hashlib
+import threading
+from .components import CONTENT_FILE, COMPONENTS_DIR, load_project_files, write_project_files
+
+
+SNAPSHOT_DIR = ".snapshots"
+INDEX_FILE = "index.json"
+
+# Longest chain of deltas before a file is stored in full again, bounding restore time
+MAX_DELTA_CHAIN = 16
+
+BLOB_CACHE_SIZE = 64
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def line_delta(base, text):
+    """
+    Encode text as operations on the lines of base
+    Each operation is either [start, end] (copy base lines start:end) or a string of new lines
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return ops
+
+
+def apply_line_delta(base, ops):
+    base_lines = base.splitlines(keepends=True)
+    return "".join("".join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+class SnapshotStore:
+    """
+    Versions of one project's QML files, with an undo/redo position
+
+    The version list is append-only: undoing and then generating again adds a new
+    version at the end, and the versions that were undone stay reachable by number.
+    Safe to use from the worker thread and the GUI thread.
+    """
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.directory = os.path.join(project_dir, SNAPSHOT_DIR)
+        self.lock = threading.Lock()
+        self.blob_cache = {}
+        self.index = self.load_index()
+
+    def load_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable snapshot index: {e}")
+        return {"versions": [], "position": -1}
+
+    def save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def blob_path(self, blob_hash):
+        return os.path.join(self.directory, "objects", blob_hash[:2], blob_hash)
+
+    def put_blob(self, text, base_hash=None):
+        """Store text unless it is already present, as a delta against base_hash if that is smaller"""
+        blob_hash = content_hash(text)
+        path = self.blob_path(blob_hash)
+        if os.path.exists(path):
+            return blob_hash
+
+        record = {"text": text, "depth": 0}
+        if base_hash and base_hash != blob_hash:
+            base_record = self.read_record(base_hash)
+            if base_record is not None and base_record["depth"] < MAX_DELTA_CHAIN:
+                delta = {"base": base_hash, "ops": line_delta(self.get_blob(base_hash), text),
+                         "depth": base_record["depth"] + 1}
+                if len(json.dumps(delta["ops"])) < len(text):
+                    record = delta
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(zlib.compress(json.dumps(record).encode("utf-8")))
+        os.replace(path + ".tmp", path)
+        self.cache_blob(blob_hash, text)
+        return blob_hash
+
+    def read_record(self, blob_hash):
+        try:
+            with open(self.blob_path(blob_hash), "rb") as f:
+                return json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+
+    def get_blob(self, blob_hash):
+        if blob_hash in self.blob_cache:
+            return self.blob_cache[blob_hash]
+
+        record = self.read_record(blob_hash)
+        if record is None:
+            raise Exception(f"Snapshot data {blob_hash[:12]} is missing")
+        if "text" in record:
+            text = record["text"]
+        else:
+            text = apply_line_delta(self.get_blob(record["base"]), record["ops"])
+        self.cache_blob(blob_hash, text)
+        return text
+
+    def cache_blob(self, blob_hash, text):
+        if len(self.blob_cache) >= BLOB_CACHE_SIZE:
+            self.blob_cache.pop(next(iter(self.blob_cache)))
+        self.blob_cache[blob_hash] = text
+
+    def current(self):
+        position = self.index["position"]
+        return self.index["versions"][position] if position >= 0 else None
+
+    def current_number(self):
+        """Return the number of the current version, or None before the first one"""
+        return self.index["position"] + 1 or None
+
+    def record(self, files, prompt, response=None):
+        """
+        Record a version of the project files
+        Returns the new version number, or None if the files match the current version
+        """
+        with self.lock:
+            current = self.current()
+            previous_files = current["files"] if current else {}
+            manifest = {name: self.put_blob(text, previous_files.get(name)) for name, text in sorted(files.items())}
+            if current and manifest == current["files"]:
+                return None
+
+            version = {
+                "files": manifest,
+                "prompt": prompt,
+                "time": time.time(),
+                "parent": self.index["position"] + 1 if current else None,  # The version this one was made from
+            }
+            if response is not None:
+                version["response"] = self.put_blob(response)
+            self.index["versions"].append(version)
+            self.index["position"] = len(self.index["versions"]) - 1
+            self.save_index()
+            return len(self.index["versions"])
+
+    def record_project(self, content_qml_file, prompt):
+        """Record the project files as they are on disk"""
+        return self.record(load_project_files(content_qml_file), prompt)
+
+    def restore(self, number, content_qml_file):
+        """
+        Write version number (1-based) back to the project and make it current
+        Component files that are not part of the version are removed
+        """
+        with self.lock:
+            versions = self.index["versions"]
+            if not 1 <= number <= len(versions):
+                raise Exception(f"There is no version {number} (versions 1-{len(versions)})")
+            version = versions[number - 1]
+            files = {name: self.get_blob(blob_hash) for name, blob_hash in version["files"].items()}
+
+            write_project_files(content_qml_file, files)
+            components_dir = os.path.join(os.path.dirname(content_qml_file), COMPONENTS_DIR)
+            for name in load_project_files(content_qml_file):
+                if name not in files and name != CONTENT_FILE:
+                    os.remove(os.path.join(components_dir, os.path.basename(name)))
+
+            self.index["position"] = number - 1
+            self.save_index()
+            return version
+
+    def undo(self, content_qml_file):
+        """Go back to the version the current one was made from"""
+        current = self.current_number()
+        parent = self.parent_number(current) if current else None
+        if not parent:
+            raise Exception("Nothing to undo")
+        return self.restore(parent, content_qml_file)
+
+    def redo(self, content_qml_file):
+        """Go forward to the newest version made from the current one"""
+        current = self.current_number()
+        children = [number for number in range(len(self.index["versions"]), 0, -1)
+                    if number != current and self.parent_number(number) == current]
+        if not children:
+            raise Exception("Nothing to redo")
+        return self.restore(children[0], content_qml_file)
+
+    def parent_number(self, number):
+        """Return the number of the version that version number was made from, or None"""
+        version = self.index["versions"][number - 1]
+        # Versions recorded before parents were tracked follow the one before them
+        return version.get("parent", number - 1 or None)
+
+    def accepted_versions(self):
+        """
+        Return (number, version, parent) for the versions that were kept
+        A version counts as kept if it is current or another version was made from it;
+        versions that were undone and never built on are left out
+        """
+        with self.lock:
+            versions = self.index["versions"]
+            kept = {self.index["position"] + 1} if versions else set()
+            kept.update(self.parent_number(number) for number in range(1, len(versions) + 1))
+            return [(number, versions[number - 1],
+                     versions[self.parent_number(number) - 1] if self.parent_number(number) else None)
+                    for number in sorted(kept - {None})]
+
+    def versions(self):
+        """Return (number, prompt, time, is_current) for every version"""
+        with self.lock:
+            position = self.index["position"]
+            return [(i + 1, version["prompt"], version["time"], i == position)
+                    for i, version in enumerate(self.index["versions"])]
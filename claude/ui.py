@@ -4,12 +4,8 @@ UI and window creation utilities
 import os
 
 
-def create_main_window_qml(file_path):
-    """
-    Create the main window QML file
-    """
-    with open(file_path, "w") as f:
-        f.write("""import QtQuick
+# Preview shell: hosts the generated Content.qml in a Loader with loading and status overlays
+MAIN_WINDOW_QML = """import QtQuick
 import QtQuick.Window
 import QtQuick.Controls
 import QtQuick.Layouts
@@ -112,4 +108,52 @@ Window {
             }
         }
     }
-}""")
\ No newline at end of file
+}"""
+
+# Small documents instantiated once at startup so the first preview doesn't pay for
+# loading these modules, registering their types and initializing the Controls style
+WARMUP_QML_DOCUMENTS = (
+    """import QtQuick
+
+Item {
+    Rectangle { gradient: Gradient { GradientStop { position: 0.0 } } }
+    Text { text: "warm" }
+    Image {}
+    Canvas {}
+    Repeater { model: 1; Item {} }
+    NumberAnimation {}
+}""",
+    """import QtQuick
+import QtQuick.Layouts
+
+Item {
+    RowLayout { ColumnLayout { GridLayout { Item { Layout.fillWidth: true } } } }
+}""",
+    """import QtQuick
+import QtQuick.Controls
+
+Item {
+    Button {}
+    Label {}
+    Slider {}
+    Switch {}
+    BusyIndicator {}
+}""",
+    """import QtQuick
+import QtQuick.Shapes
+
+Shape {
+    ShapePath {
+        PathLine {}
+        PathAngleArc {}
+    }
+}""",
+)
+
+
+def create_main_window_qml(file_path):
+    """
+    Create the main window QML file
+    """
+    with open(file_path, "w") as f:
+        f.write(MAIN_WINDOW_QML)
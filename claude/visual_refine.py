@@ -0,0 +1,232 @@
+"""
+Automatic refinement against the reference image
+
+Renders Content.qml offscreen in a child process at the size of the reference image,
+scores the rendering with claude.visual_score and asks Claude to fix the regions
+that differ most, sending crops of just those regions. Refinement turns run on the
+worker thread, queued behind any prompt, so they never edit the project concurrently. The loop is bounded, keeps
+the best version it has seen and stops early once the score stops improving.
+"""
+import os
+import sys
+import time
+import base64
+import argparse
+import tempfile
+import threading
+import subprocess
+from PySide6.QtCore import QObject, Signal
+from .scheduler import IMAGE_ANALYSIS, request_context
+
+
+MAX_REFINEMENT_ITERATIONS = 4
+TARGET_SCORE = 0.92         # Good enough; stop refining
+MIN_IMPROVEMENT = 0.005     # Smaller gains count as a plateau
+REGIONS_PER_ITERATION = 3
+CROP_MARGIN = 0.1           # Context around each region, as a fraction of its size
+RENDER_SETTLE_SECONDS = 0.5 # Time for animations and image loading before the frame is grabbed
+RENDER_TIMEOUT = 60
+
+
+def render_main(argv=None):
+    """Entry point of the render child process"""
+    parser = argparse.ArgumentParser(description="Render a QML file offscreen to an image")
+    parser.add_argument("content", help="QML file to render")
+    parser.add_argument("--output", required=True, help="PNG file to write")
+    parser.add_argument("--width", type=int, required=True)
+    parser.add_argument("--height", type=int, required=True)
+    parser.add_argument("--settle", type=float, default=RENDER_SETTLE_SECONDS)
+    args = parser.parse_args(argv)
+
+    from PySide6.QtCore import QUrl
+    from PySide6.QtGui import QGuiApplication
+    from PySide6.QtQuick import QQuickView
+
+    app = QGuiApplication(sys.argv[:1])
+    view = QQuickView()
+    view.setResizeMode(QQuickView.SizeRootObjectToView)
+    view.resize(args.width, args.height)
+    view.setSource(QUrl.fromLocalFile(os.path.abspath(args.content)))
+    if view.status() != QQuickView.Ready or view.rootObject() is None:
+        errors = "\n".join(error.toString() for error in view.errors())
+        print(errors or "Failed to load QML", file=sys.stderr)
+        return 1
+    view.show()
+
+    end = time.perf_counter() + args.settle
+    while time.perf_counter() < end:
+        app.processEvents()
+        time.sleep(0.01)
+    return 0 if view.grabWindow().save(args.output, "PNG") else 1
+
+
+def render_qml(content_qml_file, width, height, output_file):
+    """Render a QML file to a PNG in a child process; raises if it fails to load or hangs"""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["QT_QPA_PLATFORM"] = "offscreen"
+    env.setdefault("QT_QUICK_BACKEND", "software")
+    try:
+        process = subprocess.run(
+            [sys.executable, "-m", "claude.visual_refine", content_qml_file,
+             "--output", output_file, "--width", str(width), "--height", str(height)],
+            cwd=base_dir, env=env, timeout=RENDER_TIMEOUT,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+    except subprocess.TimeoutExpired:
+        raise Exception("The QML did not finish loading in time (possible infinite loop)")
+    if process.returncode != 0 or not os.path.exists(output_file):
+        raise Exception(process.stderr.decode("utf-8", "replace").strip() or "Rendering failed")
+
+
+def image_rgb(image):
+    """Return a QImage as an (h, w, 3) uint8 numpy array"""
+    import numpy as np
+    from PySide6.QtGui import QImage
+    image = image.convertToFormat(QImage.Format_RGB888)
+    width, height = image.width(), image.height()
+    data = np.frombuffer(image.constBits(), dtype=np.uint8, count=image.sizeInBytes())
+    return data.reshape(height, image.bytesPerLine())[:, :width * 3].reshape(height, width, 3).copy()
+
+
+def crop_block(image, region):
+    """Return an API image block with a region of a QImage and a margin around it"""
+    from PySide6.QtCore import QBuffer, QByteArray, QIODevice, QRect
+    margin_x, margin_y = int(region.width * CROP_MARGIN), int(region.height * CROP_MARGIN)
+    rect = QRect(region.x - margin_x, region.y - margin_y,
+                 region.width + 2 * margin_x, region.height + 2 * margin_y).intersected(image.rect())
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.copy(rect).save(buffer, "PNG")
+    buffer.close()
+    return {
+        "type": "image",
+        "source": {"type": "base64", "media_type": "image/png", "data": base64.b64encode(bytes(data)).decode("utf-8")}
+    }
+
+
+def build_refinement_prompt(regions, width, height):
+    """Describe the regions whose crops are attached, in reference image pixels"""
+    lines = "\n".join(f"- Image {i + 1}: x {region.x}-{region.x + region.width}, y {region.y}-{region.y + region.height} "
+                      f"(similarity {region.score:.2f})" for i, region in enumerate(regions))
+    return f"""The rendered UI does not match the reference design closely enough in some areas. The attached images are crops of the reference design ({width}x{height} pixels) showing the areas that differ most:
+{lines}
+
+Change the QML so these areas match their crops in layout, size, color and content. Keep everything else as it is."""
+
+
+class RefinementJob(QObject):
+    """Runs the render, score and refine loop on a background thread"""
+    progress = Signal(str)
+    finished = Signal(dict)
+    failed = Signal(str)
+
+    def __init__(self, worker, content_qml_file, reference_image_path, max_iterations=MAX_REFINEMENT_ITERATIONS):
+        super().__init__()
+        self.worker = worker
+        self.content_qml_file = content_qml_file
+        self.reference_image_path = reference_image_path
+        self.max_iterations = max_iterations
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def refine(self, prompt, images):
+        """Send one refinement turn; runs on the worker thread"""
+        with request_context(IMAGE_ANALYSIS):
+            return self.worker.process_prompt(prompt, images)
+
+    def history(self):
+        """Return a copy of the worker's conversation; runs on the worker thread"""
+        return list(self.worker.conversation_history)
+
+    def restore(self, number, history):
+        """Go back to a version and to the conversation that produced it; runs on the worker thread"""
+        self.worker.snapshots.restore(number, self.content_qml_file)
+        self.worker.conversation_history = history
+
+    def measure(self, scorer, width, height):
+        """Render the current project and score it; a rendering that fails scores 0"""
+        from PySide6.QtGui import QImage
+        from .visual_score import VisualScore
+        import numpy as np
+        fd, output_file = tempfile.mkstemp(suffix=".png", prefix="qml_render_")
+        os.close(fd)
+        try:
+            render_qml(self.content_qml_file, width, height, output_file)
+            started = time.perf_counter()
+            score = scorer.score(image_rgb(QImage(output_file)))
+            self.progress.emit(f"Visual similarity {score.score:.3f} (scored in "
+                               f"{(time.perf_counter() - started) * 1000:.0f} ms)")
+            return score
+        except Exception as e:
+            self.progress.emit(f"Rendering failed: {e}")
+            return VisualScore(0.0, np.zeros((scorer.grid, scorer.grid)))
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def run(self):
+        try:
+            from PySide6.QtGui import QImage
+            from .visual_score import ReferenceScorer, format_heatmap
+        except ImportError:
+            self.failed.emit("Install numpy to score renderings against the reference image")
+            return
+
+        try:
+            reference = QImage(self.reference_image_path)
+            if reference.isNull():
+                raise Exception(f"Could not read {self.reference_image_path}")
+            width, height = reference.width(), reference.height()
+            scorer = ReferenceScorer(image_rgb(reference))
+            snapshots = self.worker.snapshots
+
+            current = self.measure(scorer, width, height)
+            self.progress.emit(f"Region similarity:\n{format_heatmap(current)}")
+            start_score = best_score = current.score
+            best_version = snapshots.current_number()
+            best_history = self.worker.run_task(self.history)
+            iterations = 0
+
+            while iterations < self.max_iterations and best_score < TARGET_SCORE and not self.cancel_event.is_set():
+                iterations += 1
+                regions = scorer.regions(current)[:REGIONS_PER_ITERATION]
+                self.progress.emit(f"Refinement {iterations}/{self.max_iterations}: fixing "
+                                   f"{len(regions)} region(s), worst {regions[0].score:.2f}")
+                images = [crop_block(reference, region) for region in regions]
+                if not self.worker.run_task(self.refine, build_refinement_prompt(regions, width, height), images):
+                    break
+
+                current = self.measure(scorer, width, height)
+                if current.score >= best_score + MIN_IMPROVEMENT:
+                    best_score, best_version = current.score, snapshots.current_number()
+                    best_history = self.worker.run_task(self.history)
+                    self.progress.emit(f"Region similarity:\n{format_heatmap(current)}")
+                    continue
+
+                # No real gain: go back to the best version, and the conversation that produced it, and stop
+                if current.score < best_score and best_version:
+                    self.worker.run_task(self.restore, best_version, best_history)
+                    self.progress.emit(f"Restored version {best_version} ({best_score:.3f})")
+                break
+
+            self.finished.emit({"start_score": start_score, "score": best_score, "iterations": iterations,
+                                "version": best_version})
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(render_main())
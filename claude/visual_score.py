@@ -0,0 +1,113 @@
+"""
+Visual similarity between a reference image and a rendered UI
+
+Scores a rendering against the reference with SSIM on luminance combined with the
+per-pixel color difference, and breaks the score down over a grid of regions so
+the worst parts of the UI can be found. Everything is vectorized with numpy; the
+reference statistics are computed once, so ranking candidates against the same
+reference takes milliseconds each.
+"""
+from collections import namedtuple
+import numpy as np
+
+
+ANALYSIS_SIZE = 256   # Longest side, in pixels, the images are compared at
+GRID_SIZE = 4         # The heatmap has GRID_SIZE x GRID_SIZE regions
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+COLOR_WEIGHT = 0.3    # Share of the score that comes from color rather than structure
+
+LUMINANCE = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+VisualScore = namedtuple("VisualScore", "score grid")
+# A grid cell, with its rectangle in reference image pixels
+Region = namedtuple("Region", "row column score x y width height")
+
+
+def downscale(rgb, size=ANALYSIS_SIZE):
+    """Shrink an (h, w, 3) image by an integer factor, averaging blocks, until its longest side fits size"""
+    height, width = rgb.shape[:2]
+    factor = max(1, -(-max(height, width) // size))
+    if factor == 1:
+        return rgb.astype(np.float32)
+    height, width = height // factor * factor, width // factor * factor
+    # Adding strided views is several times faster than a reshaped mean on large images
+    total = np.zeros((height // factor, width // factor, rgb.shape[2]), dtype=np.uint32)
+    for row in range(factor):
+        for column in range(factor):
+            total += rgb[row:height:factor, column:width:factor]
+    return total.astype(np.float32) / (factor * factor)
+
+
+def resample(rgb, height, width):
+    """Nearest-neighbour resize, used when a rendering does not match the reference size"""
+    rows = (np.arange(height) * rgb.shape[0] / height).astype(np.intp)
+    columns = (np.arange(width) * rgb.shape[1] / width).astype(np.intp)
+    return rgb[rows[:, None], columns]
+
+
+def box_filter(image, size=SSIM_WINDOW):
+    """Mean over every size x size window, from a summed-area table; the result is size - 1 smaller"""
+    table = np.pad(image.astype(np.float64), ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    sums = table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size]
+    return sums / (size * size)
+
+
+def grid_means(values, grid=GRID_SIZE):
+    """Mean of a 2-D map over each cell of a grid x grid split"""
+    row_starts = np.linspace(0, values.shape[0], grid + 1).astype(np.intp)[:-1]
+    column_starts = np.linspace(0, values.shape[1], grid + 1).astype(np.intp)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(values, row_starts, axis=0), column_starts, axis=1)
+    counts = np.outer(np.diff(np.append(row_starts, values.shape[0])),
+                      np.diff(np.append(column_starts, values.shape[1])))
+    return sums / counts
+
+
+class ReferenceScorer:
+    """Scores renderings against one reference image"""
+    def __init__(self, reference_rgb, grid=GRID_SIZE):
+        self.height, self.width = reference_rgb.shape[:2]
+        self.grid = grid
+        self.rgb = downscale(reference_rgb)
+        # Tiny references are enlarged so every grid cell holds at least one SSIM window
+        minimum = grid + SSIM_WINDOW - 1
+        if min(self.rgb.shape[:2]) < minimum:
+            scale = minimum / min(self.rgb.shape[:2])
+            self.rgb = resample(self.rgb, int(np.ceil(self.rgb.shape[0] * scale)),
+                                int(np.ceil(self.rgb.shape[1] * scale)))
+        self.luminance = self.rgb @ LUMINANCE
+        self.mean = box_filter(self.luminance)
+        self.variance = box_filter(self.luminance ** 2) - self.mean ** 2
+
+    def score(self, rendered_rgb):
+        """Return a VisualScore: 1.0 is identical, and grid holds the score of each region"""
+        rgb = downscale(rendered_rgb)
+        if rgb.shape != self.rgb.shape:
+            rgb = resample(rgb, *self.rgb.shape[:2])
+        luminance = rgb @ LUMINANCE
+
+        mean = box_filter(luminance)
+        variance = box_filter(luminance ** 2) - mean ** 2
+        covariance = box_filter(luminance * self.luminance) - mean * self.mean
+        ssim = ((2 * mean * self.mean + SSIM_C1) * (2 * covariance + SSIM_C2)
+                / ((mean ** 2 + self.mean ** 2 + SSIM_C1) * (variance + self.variance + SSIM_C2)))
+
+        # Align the color difference with the windows the SSIM map was computed over
+        offset = SSIM_WINDOW // 2
+        color = np.abs(rgb - self.rgb).mean(axis=2)[offset:offset + ssim.shape[0], offset:offset + ssim.shape[1]]
+        quality = (1 - COLOR_WEIGHT) * np.clip(ssim, 0, 1) + COLOR_WEIGHT * (1 - color / 255)
+        return VisualScore(float(quality.mean()), grid_means(quality, self.grid))
+
+    def regions(self, score):
+        """Return every grid region of a score, worst first"""
+        cell_height, cell_width = self.height / self.grid, self.width / self.grid
+        regions = [Region(row, column, float(score.grid[row, column]), int(column * cell_width), int(row * cell_height),
+                          max(1, int(cell_width)), max(1, int(cell_height)))
+                   for row in range(self.grid) for column in range(self.grid)]
+        return sorted(regions, key=lambda region: region.score)
+
+
+def format_heatmap(score):
+    """One line per grid row with the score of each region"""
+    return "\n".join(" ".join(f"{value:.2f}" for value in row) for row in score.grid)
@@ -5,9 +5,56 @@ import os
 import threading
 import queue
 import time
-import requests
 import base64
 
+from .api import API_URL, ResponseTruncated, complete_message
+from .scheduler import INTERACTIVE, request_context
+from .model_router import classify_edit, get_model_router, sized_route
+from .qml_tokenizer import is_complete_document
+from .retrieval import get_generation_index, format_examples
+from .image_analysis import IMAGE_PROMPT, ImageAnalysisCancelled, encode_image, get_image_analyzer
+from .qml_style import enforce_style, format_issues
+from .qml_index import QmlIndex, MIN_SELECTION_SOURCE_CHARS, splice
+from .snapshots import SnapshotStore
+from .session_store import get_session_store
+from .components import (
+    CONTENT_FILE, load_project_files, format_project_files, split_response, mentioned_components,
+    ensure_components_import, write_project_files
+)
+
+
+# The last raw response, for inspection
+DEBUG_OUTPUT_FILE = "debug_qml_output.txt"
+
+
+class WorkerTask:
+    """A function queued for the worker thread, so it never runs alongside a prompt"""
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.function(*self.args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def cancel(self):
+        self.error = Exception("The worker switched to another project")
+        self.done.set()
+
+    def wait(self):
+        """Block until the task ran and return its result, raising its error"""
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
 
 class ClaudeApiWorker(threading.Thread):
     def __init__(self, content_qml_file, controller, reference_image_path=None):
@@ -18,11 +65,22 @@ class ClaudeApiWorker(threading.Thread):
         self.prompt_queue = queue.Queue()
         self.running = True
         self.api_key = os.environ.get("ANTHROPIC_API_KEY", "")
-        self.model = "claude-3-7-sonnet-20250219"
-        self.api_url = "https://api.anthropic.com/v1/messages"
+        self.api_url = API_URL
         self.conversation_history = []
         self.reference_image_path = reference_image_path
         self.initial_image_conversion_done = False
+        self.image_ticket = None
+        self.debug_output_file = DEBUG_OUTPUT_FILE
+        
+        # Past generations that prompts are reused from and take examples from
+        self.generation_index = get_generation_index()
+        
+        # Guards retargeting; generation changes whenever the worker switches project
+        self.lock = threading.Lock()
+        self.generation = 0
+        
+        # Every version of the project files, for undo and redo
+        self.snapshots = SnapshotStore(os.path.dirname(content_qml_file))
         
     def run(self):
         while self.running:
@@ -36,17 +94,49 @@ class ClaudeApiWorker(threading.Thread):
                 except queue.Empty:
                     continue
                 
+                if isinstance(prompt, WorkerTask):
+                    prompt.run()
+                    self.prompt_queue.task_done()
+                    continue
+                
                 self.controller.updatePromptStatus("Generating QML code from your prompt...")
                 self.controller.set_is_loading(True)
                 
-                # Read the existing QML code
-                existing_code = ""
-                if os.path.exists(self.content_qml_file):
-                    with open(self.content_qml_file, "r") as f:
-                        existing_code = f.read()
-                else:
-                    # Create a default if no file exists
-                    existing_code = """import QtQuick
+                # Prompts typed by the designer go ahead of queued image analysis and scaffolding
+                with request_context(INTERACTIVE):
+                    updated = self.process_prompt(prompt)
+                if updated:
+                    self.controller.updatePromptStatus("QML code updated successfully!")
+                self.controller.set_is_loading(False)
+                self.prompt_queue.task_done()
+                
+            except Exception as e:
+                self.controller.updatePromptStatus(f"Error: {str(e)}")
+                self.controller.set_is_loading(False)
+                print(f"Error in Claude API worker: {e}")
+                if not self.prompt_queue.empty():
+                    self.prompt_queue.task_done()
+                time.sleep(1)
+    
+    def process_prompt(self, prompt, images=None):
+        """
+        Generate updated QML for one prompt and write it to the content file
+        images are image blocks sent instead of the whole reference image, such as crops of it
+        Returns True if the file was updated, False if the response was discarded
+        """
+        # Take a consistent view of the target project for the whole request
+        with self.lock:
+            content_qml_file = self.content_qml_file
+            reference_image_path = self.reference_image_path
+            generation = self.generation
+            history = self.conversation_history
+            snapshots = self.snapshots
+        
+        # Read Content.qml and its components
+        files = load_project_files(content_qml_file)
+        if CONTENT_FILE not in files:
+            # Create a default if no file exists
+            files[CONTENT_FILE] = """import QtQuick
 import QtQuick.Controls
 
 Rectangle {
@@ -59,270 +149,307 @@ Rectangle {
         font.pixelSize: 24
     }
 }"""
-                
-                # Prepare prompt for Claude
-                system_prompt = """You are an expert QML developer assistant. Follow these style guidelines:
-1. Don't use version numbers in imports (use "import QtQuick" not "import QtQuick 2.15")
-2. Don't start IDs with capital letters (use "id: button" not "id: Button") 
-3. Make sure the code is suitable for a Loader component (no Window element)
-4. Make sure the root element uses anchors.fill: parent if it doesn't already
-5. Make sure to include the necessary QML imports for new types that are added
-6. Always use real numbers for decimal values (use 0.5 instead of 0 when appropriate)
-7. Always use PathAngleArc instead of PathArc for arcs in Path elements
-8. If the user is creating a speedometer or gauge, it should have a start angle of -210 and sweep to 240
-9. If the user is creating a speedometer or gauge, the 0 value should have a start angle of -210 and sweep to 240
-10. If the user is creating a speedometer or gauge, the tick marks should have a start angle of -210 and sweep to 240
+        existing_code = files[CONTENT_FILE]
+        
+        # Keep the starting point so the first change can be undone
+        if snapshots.current() is None:
+            snapshots.record(files, "Initial version")
+        
+        # The same prompt on the same files was answered before
+        retrieval = self.generation_index
+        reused = retrieval.reuse(prompt, files) if not images else None
+        if reused:
+            return self.apply_reused_generation(prompt, files, reused, content_qml_file, snapshots, history,
+                                                generation)
+        
+        # Prepare prompt for Claude
+        system_prompt = """You are an expert QML developer assistant. Follow these style guidelines:
+1. Make sure the root element uses anchors.fill: parent if it doesn't already
+2. Always use real numbers for decimal values (use 0.5 instead of 0 when appropriate)
+3. If the user is creating a speedometer or gauge, it should have a start angle of -210 and sweep to 240
+4. If the user is creating a speedometer or gauge, the 0 value should have a start angle of -210 and sweep to 240
+5. If the user is creating a speedometer or gauge, the tick marks should have a start angle of -210 and sweep to 240
+6. Never use QtGraphicalEffects
+
+The UI is split into Content.qml and reusable components in the components directory, which Content.qml uses with import "components". When you add an element that is used more than once or is a self-contained widget (a gauge, a card, a styled button), put it in its own file under components/ with a type name starting with an uppercase letter.
+
+When more than one file is involved, start each file with a "// File: <path>" line (for example "// File: Content.qml" or "// File: components/Gauge.qml") and only return the files you changed.
 
 Return ONLY the modified QML code without any explanation or markdown formatting."""
-                
-                user_message = f"""I need you to modify the following QML code based on this requirement: {prompt}
+        
+        # Components named in the prompt are edited on their own
+        sent_files = files
+        total_size = sum(len(source) for source in files.values())
+        mentioned = mentioned_components(files, prompt)
+        if mentioned and total_size >= MIN_SELECTION_SOURCE_CHARS:
+            sent_files = {name: files[name] for name in mentioned}
+        
+        # On large files only send the part of the UI the prompt is about
+        selection = QmlIndex(existing_code).select(prompt) if sent_files is files else None
+        if selection:
+            print(f"Sending {selection.node.label()} (lines {selection.node.first_line}-{selection.node.last_line}) "
+                  f"instead of the whole file")
+            code_section = f"""This is one part of a larger QML file. Return ONLY the modified {selection.node.type_name} object, with any new imports it needs above it.
+{selection.context()}
 
-Existing QML code:
+Selected QML code:
+```qml
+{selection.text()}
+```"""
+        elif len(files) > 1 or sent_files is not files:
+            other_components = sorted(name for name in files if name not in sent_files)
+            code_section = f"""Existing QML files:
+```qml
+{format_project_files(sent_files)}
+```"""
+            if other_components:
+                code_section += f"\nOther files in the project: {', '.join(other_components)}"
+        else:
+            code_section = f"""Existing QML code:
 ```qml
 {existing_code}
 ```"""
-                
-                # Prepare the message content
-                message_content = [{"type": "text", "text": user_message}]
-                
-                # Add reference image if provided
-                if self.reference_image_path and os.path.exists(self.reference_image_path):
-                    try:
-                        # Read and encode the image
-                        with open(self.reference_image_path, "rb") as image_file:
-                            image_data = image_file.read()
-                            base64_image = base64.b64encode(image_data).decode("utf-8")
-                            
-                            # Determine media type based on file extension
-                            media_type = "image/jpeg"  # default
-                            if self.reference_image_path.lower().endswith(".png"):
-                                media_type = "image/png"
-                            elif self.reference_image_path.lower().endswith(".gif"):
-                                media_type = "image/gif"
-                                
-                            # Add image to the message content before the text
-                            message_content.insert(0, {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": base64_image
-                                }
-                            })
-                            
-                            # Add reference to the image in the text
-                            message_content[1]["text"] = f"""I need you to modify the following QML code based on this requirement: {prompt}
-                            
-Please use the reference image provided above for design inspiration.
+        
+        # Similar components accepted in earlier projects, as a starting point
+        examples = retrieval.similar_examples(prompt, files)
+        if examples:
+            print(f"Adding {len(examples)} earlier component(s) as examples")
+            code_section += f"""
 
-Existing QML code:
+Components made for similar requests before, which you can adapt:
 ```qml
-{existing_code}
+{format_examples(examples)}
 ```"""
-                            
-                    except Exception as e:
-                        print(f"Error processing reference image: {e}")
-                
-                # Add the current message to conversation history
-                self.conversation_history.append({"role": "user", "content": message_content})
-                
-                # Make API request using direct Anthropic API
-                headers = {
-                    "x-api-key": self.api_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json"
-                }
-                
-                data = {
-                    "model": self.model,
-                    "max_tokens": 4000,
-                    "temperature": 0.7,
-                    "system": system_prompt,
-                    "messages": self.conversation_history
-                }
-                
-                # Make the API call to Anthropic directly
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    json=data
-                )
-                
-                # Check for errors
-                if response.status_code != 200:
-                    raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
-                
-                # Parse the response
-                response_data = response.json()
-                generated_qml = response_data['content'][0]['text'].strip()
-                
-                # Add assistant response to conversation history
-                self.conversation_history.append({
-                    "role": "assistant", 
-                    "content": [{"type": "text", "text": generated_qml}]
-                })
-                
-                # Keep conversation history to a reasonable size (last 10 messages)
-                if len(self.conversation_history) > 10:
-                    self.conversation_history = self.conversation_history[-10:]
-                
-                # Clean up the response to extract just the QML code
-                if generated_qml.startswith("```qml"):
-                    generated_qml = generated_qml[6:]
-                elif generated_qml.startswith("```"):
-                    generated_qml = generated_qml[3:]
-                
-                if generated_qml.endswith("```"):
-                    generated_qml = generated_qml[:-3]
-                
-                generated_qml = generated_qml.strip()
-                
-                # Save generated QML to a debug file for inspection
-                with open("debug_qml_output.txt", "w") as debug_file:
-                    debug_file.write(generated_qml)
-                
-                # Write to the main content file
-                with open(self.content_qml_file, "w") as f:
-                    f.write(generated_qml)
-                
-                self.controller.updatePromptStatus("QML code updated successfully!")
-                self.controller.set_is_loading(False)
-                self.prompt_queue.task_done()
-                
+        
+        user_message = f"""I need you to modify the following QML code based on this requirement: {prompt}
+
+{code_section}"""
+        
+        # Prepare the message content
+        message_content = [{"type": "text", "text": user_message}]
+        
+        # Add reference image if provided
+        if images:
+            message_content = list(images) + message_content
+        elif reference_image_path and os.path.exists(reference_image_path):
+            try:
+                # Read and encode the image
+                with open(reference_image_path, "rb") as image_file:
+                    image_data = image_file.read()
+                    base64_image = base64.b64encode(image_data).decode("utf-8")
+                    
+                    # Determine media type based on file extension
+                    media_type = "image/jpeg"  # default
+                    if reference_image_path.lower().endswith(".png"):
+                        media_type = "image/png"
+                    elif reference_image_path.lower().endswith(".gif"):
+                        media_type = "image/gif"
+                        
+                    # Add image to the message content before the text
+                    message_content.insert(0, {
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": media_type,
+                            "data": base64_image
+                        }
+                    })
+                    
+                    # Add reference to the image in the text
+                    message_content[1]["text"] = f"""I need you to modify the following QML code based on this requirement: {prompt}
+                    
+Please use the reference image provided above for design inspiration.
+
+{code_section}"""
+                    
             except Exception as e:
-                self.controller.updatePromptStatus(f"Error: {str(e)}")
-                self.controller.set_is_loading(False)
-                print(f"Error in Claude API worker: {e}")
-                if not self.prompt_queue.empty():
-                    self.prompt_queue.task_done()
-                time.sleep(1)
+                print(f"Error processing reference image: {e}")
+        
+        # Add the current message to conversation history
+        history.append({"role": "user", "content": message_content})
+        
+        # Property tweaks go to the fast model, structural changes to the large one
+        # max_tokens grows with the code the response has to reproduce
+        router = get_model_router()
+        sent_chars = len(selection.text()) if selection else sum(len(source) for source in sent_files.values())
+        route = sized_route(router.choose(classify_edit(prompt)), sent_chars)
+        
+        # Make API request using direct Anthropic API
+        data = {
+            "model": route.model,
+            "max_tokens": route.max_tokens,
+            "temperature": 0.7,
+            "system": system_prompt,
+            "messages": history
+        }
+        
+        # Make the API call to Anthropic directly
+        # Responses cut off at max_tokens are continued rather than written half-finished
+        started = time.time()
+        try:
+            response_data = complete_message(data, self.api_key)
+        except ResponseTruncated:
+            router.record(route, time.time() - started, success=False)
+            history.pop()
+            raise
+        elapsed = time.time() - started
+        
+        # Parse the response
+        generated_qml = response_data['content'][0]['text'].strip()
+        
+        # Add assistant response to conversation history
+        history.append({
+            "role": "assistant", 
+            "content": [{"type": "text", "text": generated_qml}]
+        })
+        
+        # Save the raw response to a debug file for inspection
+        with open(self.debug_output_file, "w") as debug_file:
+            debug_file.write(generated_qml)
+        
+        # Put an edited selection back into the whole file
+        try:
+            if selection:
+                changed_files = {CONTENT_FILE: splice(selection, generated_qml)}
+            else:
+                default_name = CONTENT_FILE if len(sent_files) != 1 else next(iter(sent_files))
+                changed_files = split_response(generated_qml, default_name)
+        except Exception:
+            router.record(route, elapsed, success=False)
+            raise
+        
+        # Apply the style rules that are enforced locally
+        valid = True
+        for name in changed_files:
+            changed_files[name], issues = enforce_style(changed_files[name])
+            if issues:
+                self.controller.log(f"Style fixes in {name}:\n{format_issues(issues)}")
+            valid = valid and is_complete_document(changed_files[name]) and all(issue.fixed for issue in issues)
+        router.record(route, elapsed, valid)
+        
+        all_files = dict(files, **changed_files)
+        if CONTENT_FILE in changed_files or any(name not in files for name in changed_files):
+            all_files[CONTENT_FILE] = changed_files[CONTENT_FILE] = \
+                ensure_components_import(all_files[CONTENT_FILE], all_files)
+        
+        # Components are written before Content.qml so the reload sees the new types
+        # Checked under the lock, so a retarget can't slip in between: the response is dropped
+        # if the worker was retargeted to another project meanwhile
+        names = sorted(changed_files, key=lambda name: name == CONTENT_FILE)
+        with self.lock:
+            if generation != self.generation:
+                print("Project changed while generating; discarding response")
+                return False
+            written = write_project_files(content_qml_file, {name: changed_files[name] for name in names})
+            version = snapshots.record(all_files, prompt, generated_qml)
+            
+            # Keep conversation history to a reasonable size (last 10 messages)
+            if len(history) > 10:
+                self.conversation_history = history[-10:]
+        print(f"Updated {len(written)} file(s)")
+        
+        if version:
+            print(f"Saved version {version}")
+            retrieval.add_project(os.path.dirname(content_qml_file))
+        
+        # Persist the turn so the conversation can be resumed after a restart
+        has_image = any(block["type"] == "image" for block in message_content)
+        get_session_store().record_turn(content_qml_file, prompt, message_content, history[-1]["content"],
+                                        reference_image_path if has_image and not images else None,
+                                        response_data.get("usage"), route.model, elapsed)
+        
+        return True
+    
+    def apply_reused_generation(self, prompt, files, reused, content_qml_file, snapshots, history, generation):
+        """Write the files of an earlier generation instead of calling the API"""
+        result, response = reused
+        changed_files = {name: text for name, text in result.items() if files.get(name) != text}
+        names = sorted(changed_files, key=lambda name: name == CONTENT_FILE)
+        message_content = [{"type": "text", "text": prompt}]
+        with self.lock:
+            if generation != self.generation:
+                print("Project changed while generating; discarding response")
+                return False
+            written = write_project_files(content_qml_file, {name: changed_files[name] for name in names})
+            version = snapshots.record(result, prompt, response)
+            
+            # Keep the conversation consistent with what is now in the project
+            history.append({"role": "user", "content": message_content})
+            history.append({"role": "assistant",
+                            "content": [{"type": "text", "text": response or result.get(CONTENT_FILE, "")}]})
+            if len(history) > 10:
+                self.conversation_history = history[-10:]
+        print(f"Updated {len(written)} file(s) without an API call")
+        
+        if version:
+            print(f"Saved version {version}")
+        
+        get_session_store().record_turn(content_qml_file, prompt, message_content, history[-1]["content"])
+        return True
     
     def convert_image_to_qml(self):
-        """Convert the reference image to QML code automatically"""
+        """
+        Convert the reference image to QML code automatically
+        Returns True if the project files were written
+        """
         if not self.reference_image_path or not os.path.exists(self.reference_image_path):
-            return
+            return False
             
         self.controller.updatePromptStatus("Analyzing reference image and generating QML...")
         self.controller.set_is_loading(True)
         
         try:
-            # Read and encode the image
-            with open(self.reference_image_path, "rb") as image_file:
-                image_data = image_file.read()
-                base64_image = base64.b64encode(image_data).decode("utf-8")
-                
-            # Determine media type based on file extension
-            media_type = "image/jpeg"  # default
-            if self.reference_image_path.lower().endswith(".png"):
-                media_type = "image/png"
-            elif self.reference_image_path.lower().endswith(".gif"):
-                media_type = "image/gif"
-                
-            # Prepare the message content with the image
-            message_content = [
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": media_type,
-                        "data": base64_image
-                    }
-                },
-                {
-                    "type": "text",
-                    "text": """Please create QML code that recreates the UI shown in this reference image.
-
-Your task is to:
-1. Analyze the visual elements, layout, colors, and design of the image
-2. Create QML code that implements this interface as closely as possible
-3. Use standard Qt Quick components and custom elements as needed
-4. Ensure all interactive elements are functional
-5. Pay special attention to colors, gradients, and visual styling
-
-Please provide ONLY the complete QML code, with no explanation or markdown."""
-                }
-            ]
-            
-            # System prompt for image-to-QML conversion
-            system_prompt = """You are an expert QML developer assistant who specializes in recreating UI designs from images.
-
-Follow these style guidelines:
-1. Don't use version numbers in imports (use "import QtQuick" not "import QtQuick 2.15")
-2. Don't start IDs with capital letters (use "id: button" not "id: Button") 
-3. Make sure the code is suitable for a Loader component (no Window element)
-4. Make sure the root element uses anchors.fill: parent
-5. Include all necessary QML imports for the components you use
-6. Make generous use of QtQuick.Layouts for proper responsive layout
-7. Use QtQuick.Controls 2 components for standard UI elements
-8. Implement custom graphics with Canvas when appropriate
-9. Be precise with colors, try to match the exact colors from the image
-10. Always use real numbers for decimal values (use 0.5 instead of 0 when appropriate)
-11. Always use PathAngleArc instead of PathArc for arcs in Path elements
-
-Return ONLY the QML code without any explanation or markdown formatting."""
+            # Shares the request with anyone analyzing the same image; the image is hashed in wait(),
+            # outside the lock, and the superseded analysis is released only after this one joined,
+            # so analyzing the same image again keeps its request
+            with self.lock:
+                reference_image_path = self.reference_image_path
+                content_qml_file = self.content_qml_file
+                generation = self.generation
+                ticket = get_image_analyzer().submit(reference_image_path, self.api_key, replaces=self.image_ticket)
+                self.image_ticket = ticket
             
-            # Create a new request to Claude
-            headers = {
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            }
+            generated_qml = ticket.wait()
             
-            data = {
-                "model": self.model,
-                "max_tokens": 4000,
-                "temperature": 0.7,
-                "system": system_prompt,
-                "messages": [{"role": "user", "content": message_content}]
-            }
-            
-            # Make the API call to Anthropic directly
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=data
-            )
-            
-            # Check for errors
-            if response.status_code != 200:
-                raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
+            # Save generated QML to a debug file for inspection
+            with open(self.debug_output_file, "w") as debug_file:
+                debug_file.write(generated_qml)
             
-            # Parse the response
-            response_data = response.json()
-            generated_qml = response_data['content'][0]['text'].strip()
+            # Write Content.qml and any components generated with it, unless the analysis was
+            # cancelled or the worker retargeted while it finished
+            with self.lock:
+                if ticket.cancelled or generation != self.generation:
+                    raise ImageAnalysisCancelled("The image analysis was superseded")
+                write_project_files(content_qml_file, split_response(generated_qml))
+                self.snapshots.record_project(content_qml_file, "Generated from reference image")
             
             # Add this to our conversation history
             self.conversation_history = [
-                {"role": "user", "content": message_content},
+                {"role": "user", "content": [encode_image(reference_image_path),
+                                             {"type": "text", "text": IMAGE_PROMPT}]},
                 {"role": "assistant", "content": [{"type": "text", "text": generated_qml}]}
             ]
             
-            # Clean up the response to extract just the QML code
-            if generated_qml.startswith("```qml"):
-                generated_qml = generated_qml[6:]
-            elif generated_qml.startswith("```"):
-                generated_qml = generated_qml[3:]
-            
-            if generated_qml.endswith("```"):
-                generated_qml = generated_qml[:-3]
-            
-            generated_qml = generated_qml.strip()
-            
-            # Save generated QML to a debug file for inspection
-            with open("debug_qml_output.txt", "w") as debug_file:
-                debug_file.write(generated_qml)
-            
-            # Write to the main content file
-            with open(self.content_qml_file, "w") as f:
-                f.write(generated_qml)
-            
             self.controller.updatePromptStatus("QML generated from reference image!")
             self.controller.set_is_loading(False)
+            return True
             
+        except ImageAnalysisCancelled as e:
+            self.controller.updatePromptStatus(f"Image analysis cancelled: {e}")
+            self.controller.set_is_loading(False)
+            return False
         except Exception as e:
             self.controller.updatePromptStatus(f"Error generating from image: {str(e)}")
             self.controller.set_is_loading(False)
             print(f"Error in image-to-QML conversion: {e}")
+            return False
+    
+    def cancel_image_analysis(self):
+        """Give up on the running image analysis, for example because a newer image replaces it"""
+        with self.lock:
+            ticket, self.image_ticket = self.image_ticket, None
+        if ticket is not None:
+            ticket.cancel()
     
     def submit_prompt(self, prompt):
         if not self.api_key:
@@ -330,5 +457,43 @@ Return ONLY the QML code without any explanation or markdown formatting."""
             return
         self.prompt_queue.put(prompt)
     
+    def run_task(self, function, *args):
+        """
+        Run a function on the worker thread after the prompts queued before it, and return its result
+        Refinement turns go through here, so they never edit the project or the conversation
+        concurrently with a prompt
+        """
+        task = WorkerTask(function, args)
+        if not self.is_alive():
+            task.run()  # Server sessions call the worker from their job threads instead
+        else:
+            self.prompt_queue.put(task)
+        return task.wait()
+    
+    def retarget(self, content_qml_file, reference_image_path=None):
+        """Point the worker at another project, dropping queued prompts and conversation context"""
+        with self.lock:
+            self.content_qml_file = content_qml_file
+            self.reference_image_path = reference_image_path
+            self.conversation_history = []
+            self.snapshots = SnapshotStore(os.path.dirname(content_qml_file))
+            self.generation += 1
+        self.cancel_image_analysis()
+            
+        # Prompts queued for the previous project no longer apply
+        while True:
+            try:
+                prompt = self.prompt_queue.get_nowait()
+                if isinstance(prompt, WorkerTask):
+                    prompt.cancel()
+                self.prompt_queue.task_done()
+            except queue.Empty:
+                break
+    
+    def restore_session(self, history):
+        """Resume a saved conversation for the current project"""
+        with self.lock:
+            self.conversation_history = list(history)
+    
     def stop(self):
         self.running = False
\ No newline at end of file
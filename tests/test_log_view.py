@@ -0,0 +1,57 @@
+import unittest
+
+try:
+    from claude.log_view import LogModel, RingBuffer
+except ImportError:
+    LogModel = None
+
+
+@unittest.skipUnless(LogModel, "the log view needs PySide6")
+class RingBufferTest(unittest.TestCase):
+    def test_indexing_after_wrapping(self):
+        ring = RingBuffer(3, [1, 2, 3])
+        ring.drop_front(2)
+        ring.append(4)
+        ring.append(5)
+        self.assertEqual(list(ring), [3, 4, 5])
+        self.assertEqual((ring[0], ring[-1]), (3, 5))
+        with self.assertRaises(IndexError):
+            ring.append(6)
+        with self.assertRaises(IndexError):
+            ring[3]
+
+
+@unittest.skipUnless(LogModel, "the log view needs PySide6")
+class LogModelTest(unittest.TestCase):
+    def lines(self, model):
+        return [model.data(model.index(row, 0)) for row in range(model.rowCount())]
+
+    def test_oldest_lines_are_dropped(self):
+        model = LogModel(max_lines=3)
+        for line in "abcde":
+            model.append(line)
+            model.flush()
+        self.assertEqual(self.lines(model), ["c", "d", "e"])
+
+    def test_hidden_levels_count_towards_the_buffer(self):
+        model = LogModel(max_lines=3)
+        model.set_min_level("info")
+        model.append("a")
+        model.append("b", "debug")
+        model.append("c")
+        model.append("d", "error")
+        model.flush()
+        self.assertEqual(self.lines(model), ["c", "d"])
+
+        model.set_min_level("debug")
+        self.assertEqual(self.lines(model), ["b", "c", "d"])
+
+    def test_batch_larger_than_the_buffer_keeps_its_tail(self):
+        model = LogModel(max_lines=2)
+        model.append("a\nb\nc")
+        model.flush()
+        self.assertEqual(self.lines(model), ["b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+
+from claude.qml_style import (
+    enforce_style, fix_graphical_effects, fix_id_case, fix_import_versions, fix_missing_imports,
+    fix_path_arcs, fix_window_root
+)
+from claude.qml_tokenizer import is_complete_document
+
+
+class ImportVersionTest(unittest.TestCase):
+    def test_versions_are_removed(self):
+        source, issues = fix_import_versions("import QtQuick 2.15\nimport QtQuick.Controls 2.15\nItem {}\n")
+        self.assertEqual(source, "import QtQuick\nimport QtQuick.Controls\nItem {}\n")
+        self.assertEqual(len(issues), 2)
+
+    def test_unversioned_imports_are_kept(self):
+        source = "import QtQuick\nItem {}\n"
+        self.assertEqual(fix_import_versions(source), (source, []))
+
+
+class GraphicalEffectsTest(unittest.TestCase):
+    def test_module_is_replaced(self):
+        source, issues = fix_graphical_effects("import QtQuick\nimport QtGraphicalEffects\nItem {}\n")
+        self.assertEqual(source, "import QtQuick\nimport Qt5Compat.GraphicalEffects\nItem {}\n")
+        self.assertTrue(issues[0].fixed)
+
+
+class WindowRootTest(unittest.TestCase):
+    def test_window_becomes_item_without_window_properties(self):
+        source, _ = fix_window_root('import QtQuick\n\nWindow {\n    width: 400\n    visible: true\n'
+                                    '    title: "x"\n}\n')
+        self.assertEqual(source, "import QtQuick\n\nItem {\n    width: 400\n}\n")
+
+    def test_window_with_color_becomes_rectangle(self):
+        source, _ = fix_window_root('Window {\n    color: "red"\n}\n')
+        self.assertEqual(source, 'Rectangle {\n    color: "red"\n}\n')
+
+    def test_properties_sharing_a_line_take_their_separator(self):
+        source, _ = fix_window_root('Window { width: 400; visible: true; title: "x"\n    height: 300\n}\n')
+        self.assertNotIn(";;", source.replace(" ", ""))
+        self.assertTrue(source.startswith("Item { width: 400; "))
+        self.assertNotIn("visible", source)
+        self.assertNotIn("title", source)
+        self.assertTrue(is_complete_document(source))
+
+    def test_application_window_properties_are_reported(self):
+        _, issues = fix_window_root("ApplicationWindow {\n    header: ToolBar {}\n}\n")
+        self.assertFalse(issues[-1].fixed)
+
+
+class IdCaseTest(unittest.TestCase):
+    def test_ids_and_references_are_renamed(self):
+        source, _ = fix_id_case("Item {\n    Rectangle { id: Box; width: Box.height }\n}\n")
+        self.assertEqual(source, "Item {\n    Rectangle { id: box; width: box.height }\n}\n")
+
+    def test_renamed_id_does_not_shadow_a_property(self):
+        source, _ = fix_id_case("Item {\n    property int label: 1\n    Text { id: Label; text: Label.width }\n}\n")
+        self.assertIn("id: labelItem; text: labelItem.width", source)
+        self.assertIn("property int label: 1", source)
+
+    def test_renamed_ids_do_not_collide(self):
+        source, _ = fix_id_case("Item {\n    Text { id: title }\n    Text { id: Title; text: Title.width }\n}\n")
+        self.assertIn("id: title }", source)
+        self.assertIn("id: titleItem; text: titleItem.width", source)
+
+    def test_type_names_are_not_renamed(self):
+        source, _ = fix_id_case("Item {\n    Gauge { id: Gauge }\n}\n")
+        self.assertEqual(source, "Item {\n    Gauge { id: gauge }\n}\n")
+
+
+class PathArcTest(unittest.TestCase):
+    def test_literal_arc_is_converted(self):
+        source, issues = fix_path_arcs("Shape {\n    ShapePath {\n        startX: 0; startY: 0\n"
+                                       "        PathArc {\n            x: 100; y: 0\n"
+                                       "            radiusX: 50; radiusY: 50\n        }\n    }\n}\n")
+        self.assertNotIn("PathArc {", source)
+        for line in ("centerX: 50.0", "centerY: 0.0", "radiusX: 50.0", "radiusY: 50.0",
+                     "startAngle: 180.0", "sweepAngle: 180.0", "moveToStart: false"):
+            self.assertIn(line, source)
+        self.assertTrue(issues[0].fixed)
+
+    def test_counterclockwise_arc_sweeps_backwards(self):
+        source, _ = fix_path_arcs("ShapePath {\n    PathArc {\n        x: 100; y: 0\n        radiusX: 50; radiusY: 50\n"
+                                  "        direction: PathArc.Counterclockwise\n    }\n}\n")
+        self.assertIn("sweepAngle: -180.0", source)
+
+    def test_computed_arc_is_reported(self):
+        source = "ShapePath {\n    PathArc { x: width; y: 0; radiusX: 50; radiusY: 50 }\n}\n"
+        result, issues = fix_path_arcs(source)
+        self.assertEqual(result, source)
+        self.assertFalse(issues[0].fixed)
+
+
+class MissingImportTest(unittest.TestCase):
+    def test_modules_of_used_types_are_imported(self):
+        source, _ = fix_missing_imports("import QtQuick\n\nItem {\n    RowLayout { Button {} }\n}\n")
+        self.assertTrue(source.startswith("import QtQuick\nimport QtQuick.Controls\nimport QtQuick.Layouts\n"))
+
+    def test_qtquick_is_added_without_imports(self):
+        source, _ = fix_missing_imports("Item {}\n")
+        self.assertEqual(source, "import QtQuick\n\nItem {}\n")
+
+
+class EnforceStyleTest(unittest.TestCase):
+    def test_code_fences_are_stripped(self):
+        source, issues = enforce_style("```qml\nimport QtQuick\nItem {}\n```")
+        self.assertEqual(source, "import QtQuick\nItem {}")
+        self.assertEqual(issues, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from claude.retrieval import GenerationIndex, TfidfMatrix, words
+from claude.snapshots import SnapshotStore
+
+
+BASE_FILES = {"Content.qml": 'Rectangle { color: "white" }\n'}
+
+
+def changed_files(prompt):
+    return {"Content.qml": f'Rectangle {{ color: "white" }} // {prompt}\n'}
+
+
+class ReuseTest(unittest.TestCase):
+    PROMPTS = ["make the background red", "set the font size to 5", "visible true", "make it 2x bigger",
+               "show the title"]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = GenerationIndex(load_saved=False)
+        for number, prompt in enumerate(self.PROMPTS):
+            project_dir = os.path.join(self.directory.name, str(number))
+            store = SnapshotStore(project_dir)
+            store.record(BASE_FILES, "Initial version")
+            store.record(changed_files(prompt), prompt)
+            self.index.add_project(project_dir)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_same_prompt_is_reused(self):
+        files, _ = self.index.reuse("Make the background red.", BASE_FILES)
+        self.assertEqual(files, changed_files("make the background red"))
+
+    def test_superset_prompts_are_not_reused(self):
+        for prompt in ("make the background dark red", "make the background not red",
+                       "make background red on hover"):
+            with self.subTest(prompt=prompt):
+                self.assertIsNone(self.index.reuse(prompt, BASE_FILES))
+
+    def test_prompts_differing_in_a_value_are_not_reused(self):
+        for prompt in ("set the font size to 8", "visible false", "make it 3x bigger", "don't show the title"):
+            with self.subTest(prompt=prompt):
+                self.assertIsNone(self.index.reuse(prompt, BASE_FILES))
+
+    def test_other_indexes_are_not_searched(self):
+        self.assertIsNone(GenerationIndex(load_saved=False).reuse("make the background red", BASE_FILES))
+
+
+@unittest.skipUnless(numpy, "examples need numpy")
+class TfidfTest(unittest.TestCase):
+    def test_unseen_words_lower_the_score(self):
+        matrix = TfidfMatrix([words("make the background red")])
+        self.assertAlmostEqual(float(matrix.scores(words("make the background red"))[0]), 1.0, places=5)
+        self.assertLess(float(matrix.scores(words("make the background dark red"))[0]), 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import json
+import importlib
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+try:
+    importlib.import_module("requests")  # Imported by the API client on the first request
+    from claude import api, session_store
+    from claude.mock_upstream import start_mock_upstream
+    from claude.server import create_server
+except ImportError:
+    create_server = None
+
+
+@unittest.skipUnless(create_server, "the server needs PySide6 and requests")
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.upstream = start_mock_upstream()
+        patches = [
+            mock.patch.object(api, "API_URL", f"http://127.0.0.1:{self.upstream.server_port}/v1/messages"),
+            mock.patch.dict(os.environ, {"ANTHROPIC_API_KEY": "mock-key-0000000000000"}),
+            mock.patch.object(session_store, "_session_store",
+                              session_store.SessionStore(os.path.join(self.directory.name, "sessions.db"))),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.server = create_server(port=0, sessions_dir=os.path.join(self.directory.name, "server"),
+                                    requests_per_minute=0)
+        self.service = self.server.service
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.shutdown()
+        self.upstream.shutdown()
+        self.upstream.server_close()
+        self.directory.cleanup()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def post(self, path, body=None):
+        request = Request(self.url(path), data=json.dumps(body or {}).encode("utf-8"), method="POST",
+                          headers={"content-type": "application/json"})
+        with urlopen(request, timeout=10) as response:
+            return json.loads(response.read())
+
+    def wait_for_job(self, session_id, job_id):
+        """Read the event stream until the job finishes; returns its last event"""
+        with urlopen(self.url(f"/sessions/{session_id}/events"), timeout=30) as response:
+            for line in response:
+                if not line.startswith(b"data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event.get("job_id") == job_id and event["type"] in ("done", "error"):
+                    return event
+        self.fail("The event stream ended")
+
+    def test_project_prompt_and_events(self):
+        session_id = self.post("/sessions")["session_id"]
+        job_id = self.post(f"/sessions/{session_id}/projects", {"name": "Demo"})["job_id"]
+        self.assertEqual(self.wait_for_job(session_id, job_id)["type"], "done")
+
+        job_id = self.post(f"/sessions/{session_id}/prompts", {"prompt": "make the background red"})["job_id"]
+        event = self.wait_for_job(session_id, job_id)
+        self.assertEqual(event["type"], "done")
+        # The mock answers with the start of the request it was sent
+        self.assertIn("I need you to modify the following QML code", event["content"])
+
+        with urlopen(self.url(f"/sessions/{session_id}/files/Content.qml"), timeout=10) as response:
+            self.assertEqual(response.read().decode("utf-8"), event["content"])
+
+    def test_malformed_event_id_is_a_bad_request(self):
+        session_id = self.post("/sessions")["session_id"]
+        with self.assertRaises(HTTPError) as error:
+            urlopen(self.url(f"/sessions/{session_id}/events?since=abc"), timeout=10)
+        self.assertEqual(error.exception.code, 400)
+
+    def test_idle_sessions_are_evicted(self):
+        session = self.service.create_session()
+        self.assertTrue(os.path.isdir(session.directory))
+        session.last_active -= self.service.idle_timeout + 1
+
+        self.assertEqual(self.service.evict_idle_sessions(), 1)
+        self.assertNotIn(session.id, self.service.sessions)
+        self.assertFalse(os.path.exists(session.directory))
+
+    def test_session_count_is_capped(self):
+        self.service.max_sessions = 1
+        self.post("/sessions")
+        with self.assertRaises(HTTPError) as error:
+            self.post("/sessions")
+        self.assertEqual(error.exception.code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
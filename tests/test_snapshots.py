@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from claude.snapshots import SnapshotStore
+
+
+class UndoRedoTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.content_qml_file = os.path.join(self.directory.name, "Content.qml")
+        self.store = SnapshotStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def generate(self, name):
+        with open(self.content_qml_file, "w") as f:
+            f.write(f'Text {{ text: "{name}" }}\n')
+        return self.store.record_project(self.content_qml_file, name)
+
+    def test_undo_after_new_version_goes_to_parent(self):
+        for name in ("v1", "v2", "v3"):
+            self.generate(name)
+        self.assertEqual(self.store.undo(self.content_qml_file)["prompt"], "v2")
+        self.generate("v4")
+
+        # The abandoned v3 must not come back
+        self.assertEqual(self.store.undo(self.content_qml_file)["prompt"], "v2")
+        self.assertEqual(self.store.undo(self.content_qml_file)["prompt"], "v1")
+        with self.assertRaises(Exception):
+            self.store.undo(self.content_qml_file)
+
+    def test_redo_goes_to_newest_child(self):
+        for name in ("v1", "v2", "v3"):
+            self.generate(name)
+        self.store.undo(self.content_qml_file)
+        self.generate("v4")
+        self.store.undo(self.content_qml_file)
+
+        self.assertEqual(self.store.redo(self.content_qml_file)["prompt"], "v4")
+        with self.assertRaises(Exception):
+            self.store.redo(self.content_qml_file)
+        with open(self.content_qml_file) as f:
+            self.assertIn("v4", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()